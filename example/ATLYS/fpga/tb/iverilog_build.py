@@ -0,0 +1 @@
+../lib/eth/tb/iverilog_build.py
\ No newline at end of file
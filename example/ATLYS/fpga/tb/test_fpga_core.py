@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -100,9 +101,8 @@ def dut_fpga_core(clk,
                   uart_rxd,
                   uart_txd):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
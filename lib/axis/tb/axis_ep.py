@@ -23,25 +23,268 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+from collections import deque
+import array
+import random
+
+if hasattr(int, 'from_bytes'):
+    def from_le_bytes(b):
+        return int.from_bytes(b, 'little')
+
+    def to_le_bytes(v, n):
+        return v.to_bytes(n, 'little')
+else:
+    # Python 2
+    import binascii
+
+    def from_le_bytes(b):
+        return int(binascii.hexlify(b.tobytes()[::-1]) or b'0', 16)
+
+    def to_le_bytes(v, n):
+        return binascii.unhexlify(b'%0*x' % (2*n, v))[::-1]
 
 skip_asserts = False
 
+# how sinks store per-beat sideband (tkeep, tuser) of received frames:
+# 'list' - plain lists
+# 'array' - compact arrays
+# 'compact' - arrays, or None where build() would regenerate the same values
+#             (keep all ones apart from the final partial beat, user all zero)
+sideband_storage = 'list'
+
+def compact_array(values):
+    m = max(values) if len(values) else 0
+    for t in ('B', 'H', 'L'):
+        if m < 1 << 8*array.array(t).itemsize:
+            return array.array(t, values)
+    return list(values)
+
+tkeep_table_max_width = 16
+tkeep_checkers = {}
+
+# returns check(keep, first, last) for a tkeep bus of the given width
+# check returns the number of bytes in the beat, or 0 if keep is not legal
+# narrow buses use lookup tables built once per width, wider ones use bit tricks
+def tkeep_checker(width):
+    if width in tkeep_checkers:
+        return tkeep_checkers[width]
+
+    msb = 1 << (width-1)
+
+    if width <= tkeep_table_max_width:
+        # tables indexed by first | last << 1, then by tkeep
+        tables = [[0]*(1 << width) for i in range(4)]
+        for start in range(width):
+            for stop in range(start+1, width+1):
+                k = ((1 << (stop-start)) - 1) << start
+                for pos in range(4):
+                    if start > 0 and not pos & 1:
+                        # not first cycle; lowest bit must be set
+                        continue
+                    if stop < width and not pos & 2:
+                        # not last cycle; highest bit must be set
+                        continue
+                    tables[pos][k] = stop-start
+
+        def check(keep, first, last):
+            return tables[bool(first) | bool(last) << 1][keep]
+    else:
+        def check(keep, first, last):
+            # contiguous iff adding the lowest set bit clears every set bit
+            if keep == 0 or (keep + (keep & -keep)) & keep:
+                return 0
+            if not first and not keep & 1:
+                return 0
+            if not last and not keep & msb:
+                return 0
+            return bin(keep).count('1')
+
+    tkeep_checkers[width] = check
+    return check
+
+# Frames carry simulation timestamps (now()): ts_inject is set by the source
+# when it starts sending the frame, on the object taken from its queue, and
+# ts_first and ts_last by the sink on the first and last beat it receives.
+# They are None until set, are copied along with the frame and are not
+# compared by __eq__.
+def copy_timestamps(frame, other):
+    frame.ts_inject = getattr(other, 'ts_inject', None)
+    frame.ts_first = getattr(other, 'ts_first', None)
+    frame.ts_last = getattr(other, 'ts_last', None)
+
+def set_inject_time(frame):
+    # frames queued as bytes or lists have nowhere to keep it
+    if hasattr(frame, 'ts_inject'):
+        frame.ts_inject = now()
+
+# Pause policies generate stall patterns inside an endpoint's own clock
+# process (pause_policy=...), which costs far less than a separate generator
+# toggling a pause signal every cycle.  They are combined with the pause
+# signal, restart on endpoint reset so patterns are reproducible, and hold
+# per endpoint state, so each endpoint needs its own instance.
+# Subclasses implement restart() and pause(), which is called once per
+# cycle and returns whether to pause for that cycle.
+class PausePolicy(object):
+    paused = False
+
+    def restart(self):
+        pass
+
+    def pause(self):
+        return False
+
+    def reset(self, sig):
+        self.restart()
+        self.paused = False
+        sig.next = False
+
+    def step(self, sig):
+        p = self.pause()
+        if p != self.paused:
+            self.paused = p
+            sig.next = p
+
+class DutyCyclePause(PausePolicy):
+    # pauses for paused cycles out of every period, starting offset cycles
+    # into the pattern; DutyCyclePause(1, 2) pauses every other cycle
+    def __init__(self, paused=1, period=2, offset=0):
+        self.paused_cycles = paused
+        self.period = period
+        self.offset = offset
+        self.restart()
+
+    def restart(self):
+        self.count = self.offset % self.period
+
+    def pause(self):
+        c = self.count
+        self.count = c+1 if c+1 < self.period else 0
+        return c < self.paused_cycles
+
+class BurstPause(PausePolicy):
+    # alternates runs and pauses with lengths drawn uniformly from runs and
+    # pauses, each a cycle count or a (min, max) tuple, using a seeded
+    # generator
+    def __init__(self, runs=(1, 16), pauses=(1, 16), seed=1):
+        self.runs = runs if type(runs) is tuple else (runs, runs)
+        self.pauses = pauses if type(pauses) is tuple else (pauses, pauses)
+        self.seed = seed
+        self.restart()
+
+    def restart(self):
+        self.rand = random.Random(self.seed)
+        self.in_pause = True
+        self.count = 0
+
+    def pause(self):
+        while self.count == 0:
+            self.in_pause = not self.in_pause
+            self.count = self.rand.randint(*(self.pauses if self.in_pause else self.runs))
+        self.count -= 1
+        return self.in_pause
+
+class LFSRPause(PausePolicy):
+    # pauses a ratio of cycles picked at random by a 32 bit xorshift LFSR,
+    # which is cheap to step and gives the same sequence for a seed on any
+    # Python version
+    def __init__(self, ratio=0.5, seed=1):
+        self.threshold = int(ratio * 0x10000)
+        self.seed = seed & 0xffffffff or 1
+        self.restart()
+
+    def restart(self):
+        self.state = self.seed
+
+    def pause(self):
+        x = self.state
+        x ^= (x << 13) & 0xffffffff
+        x ^= x >> 17
+        x ^= (x << 5) & 0xffffffff
+        self.state = x
+        return x >> 16 < self.threshold
+
+class SelectPause(PausePolicy):
+    # delegates to a policy that can be swapped while the simulation runs
+    # (None for no pauses), to sweep stall patterns within one testbench
+    def __init__(self, policy=None):
+        self.policy = policy
+
+    def select(self, policy):
+        if policy is not None:
+            policy.restart()
+        self.policy = policy
+
+    def restart(self):
+        if self.policy is not None:
+            self.policy.restart()
+
+    def pause(self):
+        return self.policy is not None and self.policy.pause()
+
+# stall patterns for sweeps, as (name, source policy, sink policy)
+def pause_patterns(seed=1):
+    return [
+        ('none', None, None),
+        ('source every other cycle', DutyCyclePause(1, 2), None),
+        ('sink every other cycle', None, DutyCyclePause(1, 2)),
+        ('source 1 of 2, sink 1 of 3', DutyCyclePause(1, 2), DutyCyclePause(1, 3)),
+        ('source 3 of 4', DutyCyclePause(3, 4), None),
+        ('sink 3 of 4', None, DutyCyclePause(3, 4)),
+        ('source bursts', BurstPause(seed=seed), None),
+        ('sink bursts', None, BurstPause(seed=seed)),
+        ('random 50%', LFSRPause(0.5, seed), LFSRPause(0.5, seed+1)),
+        ('random 10%', LFSRPause(0.1, seed), LFSRPause(0.1, seed+1)),
+        ('source random 90%', LFSRPause(0.9, seed), None),
+        ('sink random 90%', None, LFSRPause(0.9, seed))
+    ]
+
+# counts the cycles out of the first cycles after a restart in which
+# neither policy pauses (None for no pauses), which is how many beats get
+# through when each one needs both sides free in the same cycle.  Replays
+# the policies from restart, so call it once a sweep step is done with them.
+def free_cycles(source_policy, sink_policy, cycles):
+    policies = [p for p in (source_policy, sink_policy) if p is not None]
+    for p in policies:
+        p.restart()
+    free = 0
+    for k in range(cycles):
+        paused = False
+        for p in policies:
+            if p.pause():
+                paused = True
+        if not paused:
+            free += 1
+    return free
+
 class AXIStreamFrame(object):
+    __slots__ = ('B', 'N', 'M', 'WL', 'version', '_data', '_segments', 'keep', 'user',
+        'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, data=b'', keep=None, user=None):
         self.B = 0
         self.N = 8
         self.M = 1
         self.WL = 8
-        self.data = b''
+        self.version = 0
+        self._data = b''
+        self._segments = None
         self.keep = None
         self.user = None
-
-        if type(data) is bytes or type(data) is bytearray:
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
+
+        if type(data) is bytes:
+            # immutable, so reference it until the data is needed
+            self._segments = [(data, 0, len(data))]
+        elif type(data) is bytearray:
             self.data = bytearray(data)
         elif type(data) is AXIStreamFrame:
             self.N = data.N
             self.WL = data.WL
-            if type(data.data) is bytearray:
+            if data._segments is not None:
+                self._segments = list(data._segments)
+            elif type(data.data) is bytearray:
                 self.data = bytearray(data.data)
             else:
                 self.data = list(data.data)
@@ -52,18 +295,87 @@ class AXIStreamFrame(object):
                     self.user = data.user
                 else:
                     self.user = list(data.user)
+            copy_timestamps(self, data)
         else:
             self.data = list(data)
 
+    # Frames built or parsed by the protocol layers are layered: instead of a
+    # bytearray they hold a list of (buffer, offset, length) segments that
+    # reference the headers and the parent frame's payload.  The segments are
+    # copied into a bytearray only once, when data is first accessed.
+    # Segment buffers are always immutable bytes: bytearrays (passed in, or
+    # the data of a frame that has been accessed) are copied when segments
+    # are taken from them, so editing a buffer or a frame's data in place
+    # never changes a frame that was already built, parsed or queued from it.
+    # version counts the times data is assigned or handed out, since the
+    # caller may edit it in place, so while version is unchanged the content
+    # is too (unless a reference to data is held across).
+    @property
+    def data(self):
+        if self._segments is not None:
+            data = bytearray(sum(seg[2] for seg in self._segments))
+            ptr = 0
+            for buf, offset, length in self._segments:
+                data[ptr:ptr+length] = memoryview(buf)[offset:offset+length]
+                ptr += length
+            self._data = data
+            self._segments = None
+        self.version += 1
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._segments = None
+        self.version += 1
+
+    def get_segments(self, copy=True):
+        # copy=False returns accessed data without copying it, for callers
+        # that only read the segments before returning
+        if self._segments is not None:
+            return self._segments
+        data = self._data
+        if type(data) is list or (copy and type(data) is not bytes):
+            data = bytes(bytearray(data))
+        return [(data, 0, len(data))]
+
+    def get_length(self):
+        if self._segments is None:
+            return len(self._data)
+        return sum(seg[2] for seg in self._segments)
+
+    def get_slice(self, start=None, stop=None):
+        start, stop, step = slice(start, stop).indices(self.get_length())
+        segments = []
+        ptr = 0
+        for buf, offset, length in self.get_segments():
+            a = max(start-ptr, 0)
+            b = min(stop-ptr, length)
+            if a < b:
+                segments.append((buf, offset+a, b-a))
+            ptr += length
+        frame = AXIStreamFrame()
+        frame._segments = segments
+        return frame
+
+    def get_bytes(self, start=None, stop=None):
+        if self._segments is None:
+            return bytes(self._data[start:stop])
+        if self._segments and stop is not None and 0 <= stop <= self._segments[0][2] and (start is None or start >= 0):
+            # headers almost always sit in the first segment
+            buf, offset, length = self._segments[0]
+            return memoryview(buf)[offset+(start or 0):offset+stop].tobytes()
+        return b''.join(memoryview(buf)[offset:offset+length].tobytes()
+            for buf, offset, length in self.get_slice(start, stop)._segments)
+
     def build(self):
         if self.data is None:
             return
 
-        f = list(self.data)
+        n = len(self.data)
         tdata = []
         tkeep = []
         tuser = []
-        i = 0
 
         assert_tuser = False
         if (type(self.user) is int or type(self.user) is bool) and self.user:
@@ -71,34 +383,40 @@ class AXIStreamFrame(object):
             self.user = None
 
         if self.B == 0:
-            while len(f) > 0:
-                data = 0
-                keep = 0
-                for j in range(self.M):
-                    data = data | (f.pop(0) << (j*self.WL))
-                    keep = keep | (1 << j)
-                    if len(f) == 0: break
-                tdata.append(data)
-                if self.keep is None:
-                    tkeep.append(keep)
-                else:
-                    tkeep.append(self.keep[i])
-                if self.user is None:
-                    tuser.append(0)
-                else:
-                    tuser.append(self.user[i])
-                i += 1
+            M = self.M
+            full_keep = (1 << M) - 1
+            cnt = (n + M - 1) // M
+
+            if self.WL == 8 and (type(self.data) is bytearray or type(self.data) is bytes):
+                # pack M bytes per beat directly from the buffer
+                mv = memoryview(self.data)
+                tdata = [from_le_bytes(mv[k:k+M]) for k in range(0, n, M)]
+            else:
+                # generic lane packing for non-byte word lengths
+                WL = self.WL
+                f = self.data
+                for k in range(0, n, M):
+                    data = 0
+                    for j in range(min(M, n-k)):
+                        data |= f[k+j] << (j*WL)
+                    tdata.append(data)
+
+            if self.keep is None:
+                tkeep = [full_keep]*cnt
+                if n % M:
+                    tkeep[-1] = (1 << (n % M)) - 1
+            else:
+                tkeep = list(self.keep[:cnt])
         else:
             # multiple tdata signals
-            while len(f) > 0:
-                data = 0
-                tdata.append(f.pop(0))
-                tkeep.append(0)
-                if self.user is None:
-                    tuser.append(0)
-                else:
-                    tuser.append(self.user[i])
-                i += 1
+            cnt = n
+            tdata = list(self.data)
+            tkeep = [0]*cnt
+
+        if self.user is None or type(self.user) is int or type(self.user) is bool:
+            tuser = [0]*cnt
+        else:
+            tuser = list(self.user[:cnt])
 
         if assert_tuser:
             tuser[-1] = 1
@@ -112,27 +430,57 @@ class AXIStreamFrame(object):
         if len(tdata) != len(tkeep) or len(tdata) != len(tuser):
             raise Exception("Invalid data")
 
-        self.data = []
-        self.keep = []
-        self.user = []
+        self.keep = list(tkeep)
+        self.user = list(tuser)
 
         if self.B == 0:
-            mask = 2**self.WL-1
-
-            for i in range(len(tdata)):
-                for j in range(self.M):
-                    if tkeep[i] & (1 << j):
-                        self.data.append((tdata[i] >> (j*self.WL)) & mask)
-                self.keep.append(tkeep[i])
-                self.user.append(tuser[i])
+            M = self.M
+            WL = self.WL
+            full_keep = (1 << M) - 1
+
+            if WL == 8:
+                # join the beats once so the buffer is not over-allocated
+                data = []
+                for i in range(len(tdata)):
+                    k = tkeep[i]
+                    if k == full_keep:
+                        data.append(to_le_bytes(tdata[i], M))
+                    elif k & (k+1) == 0:
+                        # contiguous from lane 0
+                        data.append(to_le_bytes(tdata[i], M)[:k.bit_length()])
+                    else:
+                        b = to_le_bytes(tdata[i], M)
+                        for j in range(M):
+                            if k & (1 << j):
+                                data.append(b[j:j+1])
+                self.data = bytearray(b'').join(data)
+            else:
+                mask = 2**WL-1
+                self.data = []
+                for i in range(len(tdata)):
+                    for j in range(M):
+                        if tkeep[i] & (1 << j):
+                            self.data.append((tdata[i] >> (j*WL)) & mask)
         else:
-            for i in range(len(tdata)):
-                self.data.append(tdata[i])
-                self.keep.append(tkeep[i])
-                self.user.append(tuser[i])
+            self.data = list(tdata)
 
-        if self.WL == 8:
-            self.data = bytearray(self.data)
+    def compact_sideband(self, storage='compact'):
+        if storage == 'list':
+            return
+        if storage == 'compact':
+            if self.B == 0 and self.keep is not None and len(self.keep) > 0:
+                n = len(self.data)
+                full_keep = (1 << self.M) - 1
+                last_keep = (1 << (n % self.M or self.M)) - 1
+                if (len(self.keep) == (n + self.M - 1) // self.M and self.keep[-1] == last_keep and
+                        self.keep.count(full_keep) >= len(self.keep) - 1):
+                    self.keep = None
+            if self.user is not None and type(self.user) is not int and type(self.user) is not bool and not any(self.user):
+                self.user = None
+        if self.keep is not None:
+            self.keep = compact_array(self.keep)
+        if self.user is not None and type(self.user) is not int and type(self.user) is not bool:
+            self.user = compact_array(self.user)
 
     def __eq__(self, other):
         if type(other) is AXIStreamFrame:
@@ -144,6 +492,23 @@ class AXIStreamFrame(object):
     def __iter__(self):
         return self.data.__iter__()
 
+# builds a layered frame from headers and payloads without copying them;
+# a single frame keeps its timestamps so parse_axis can pass them on
+def layered_frame(*parts):
+    segments = []
+    for p in parts:
+        if type(p) is AXIStreamFrame:
+            segments.extend(p.get_segments())
+        else:
+            if type(p) is not bytes:
+                p = bytes(bytearray(p))
+            segments.append((p, 0, len(p)))
+    frame = AXIStreamFrame()
+    frame._segments = segments
+    if len(parts) == 1:
+        copy_timestamps(frame, parts[0])
+    return frame
+
 def AXIStreamSource(clk, rst,
                     tdata=None,
                     tkeep=Signal(bool(True)),
@@ -153,22 +518,29 @@ def AXIStreamSource(clk, rst,
                     tuser=Signal(bool(False)),
                     fifo=None,
                     pause=0,
+                    pause_policy=None,
                     name=None):
 
     tready_int = Signal(bool(False))
     tvalid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        tready_int.next = tready and not pause
-        tvalid.next = tvalid_int and not pause
+        tready_int.next = tready and not (pause or policy_pause)
+        tvalid.next = tvalid_int and not (pause or policy_pause)
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
         frame = AXIStreamFrame()
-        data = []
-        keep = []
-        user = []
+        data = deque()
+        keep = deque()
+        user = deque()
         B = 0
         N = len(tdata)
         M = len(tkeep)
@@ -193,17 +565,22 @@ def AXIStreamSource(clk, rst,
                 tkeep.next = 0
                 tvalid_int.next = False
                 tlast.next = False
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if tready_int and tvalid:
                     if len(data) > 0:
                         if B > 0:
-                            l = data.pop(0)
+                            l = data.popleft()
                             for i in range(B):
                                 tdata[i].next = l[i]
                         else:
-                            tdata.next = data.pop(0)
-                        tkeep.next = keep.pop(0)
-                        tuser.next = user.pop(0)
+                            tdata.next = data.popleft()
+                        tkeep.next = keep.popleft()
+                        tuser.next = user.popleft()
                         tvalid_int.next = True
                         tlast.next = len(data) == 0
                     else:
@@ -212,22 +589,26 @@ def AXIStreamSource(clk, rst,
                 if (tlast and tready_int and tvalid) or not tvalid_int:
                     if not fifo.empty():
                         frame = fifo.get()
+                        set_inject_time(frame)
                         frame = AXIStreamFrame(frame)
                         frame.B = B
                         frame.N = N
                         frame.M = M
                         frame.WL = WL
                         data, keep, user = frame.build()
+                        data = deque(data)
+                        keep = deque(keep)
+                        user = deque(user)
                         if name is not None:
                             print("[%s] Sending frame %s" % (name, repr(frame)))
                         if B > 0:
-                            l = data.pop(0)
+                            l = data.popleft()
                             for i in range(B):
                                 tdata[i].next = l[i]
                         else:
-                            tdata.next = data.pop(0)
-                        tkeep.next = keep.pop(0)
-                        tuser.next = user.pop(0)
+                            tdata.next = data.popleft()
+                        tkeep.next = keep.popleft()
+                        tuser.next = user.popleft()
                         tvalid_int.next = True
                         tlast.next = len(data) == 0
 
@@ -243,15 +624,32 @@ def AXIStreamSink(clk, rst,
                   tuser=Signal(bool(False)),
                   fifo=None,
                   pause=0,
-                  name=None):
+                  pause_policy=None,
+                  name=None,
+                  sideband=None,
+                  capture=None):
 
     tready_int = Signal(bool(False))
     tvalid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        tready.next = tready_int and not pause
-        tvalid_int.next = tvalid and not pause
+        tready.next = tready_int and not (pause or policy_pause)
+        tvalid_int.next = tvalid and not (pause or policy_pause)
+
+    # capture: PcapWriter (pcap_ep) to record received frames to; records
+    # are frame.data as bytes, so the stream must have 8 bit lanes
+    capture_write = None
+    if capture is not None:
+        if type(tdata) is list or type(tdata) is tuple or int((len(tdata)+len(tkeep)-1)/len(tkeep)) != 8:
+            raise Exception("Capture needs a stream with 8 bit lanes")
+        capture_write = capture.add_interface(name).write
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -264,6 +662,8 @@ def AXIStreamSink(clk, rst,
         M = len(tkeep)
         WL = int((len(tdata)+M-1)/M)
         first = True
+        ts_first = None
+        keep_check = tkeep_checker(len(tkeep))
 
         if type(tdata) is list or type(tdata) is tuple:
             # multiple tdata signals
@@ -282,29 +682,21 @@ def AXIStreamSink(clk, rst,
                 keep = []
                 user = []
                 first = True
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 tready_int.next = True
 
                 if tvalid_int:
 
                     if not skip_asserts:
-                        # zero tkeep not allowed
-                        assert int(tkeep) != 0
-                        # tkeep must be contiguous
+                        # tkeep must be nonzero and contiguous
                         # i.e. 0b00011110 allowed, but 0b00011010 not allowed
-                        b = int(tkeep)
-                        while b & 1 == 0:
-                            b = b >> 1
-                        while b & 1 == 1:
-                            b = b >> 1
-                        assert b == 0
                         # tkeep must not have gaps across cycles
-                        if not first:
-                            # not first cycle; lowest bit must be set
-                            assert int(tkeep) & 1
-                        if not tlast:
-                            # not last cycle; highest bit must be set
-                            assert int(tkeep) & (1 << len(tkeep)-1)
+                        assert keep_check(int(tkeep), first, tlast)
 
                     if B > 0:
                         l = []
@@ -315,17 +707,24 @@ def AXIStreamSink(clk, rst,
                         data.append(int(tdata))
                     keep.append(int(tkeep))
                     user.append(int(tuser))
+                    if first:
+                        ts_first = now()
                     first = False
                     if tlast:
+                        frame.ts_first = ts_first
+                        frame.ts_last = now()
                         frame.B = B
                         frame.N = N
                         frame.M = M
                         frame.WL = WL
                         frame.parse(data, keep, user)
+                        frame.compact_sideband(sideband or sideband_storage)
                         if fifo is not None:
                             fifo.put(frame)
                         if name is not None:
                             print("[%s] Got frame %s" % (name, repr(frame)))
+                        if capture_write is not None:
+                            capture_write(frame.data, now())
                         frame = AXIStreamFrame()
                         data = []
                         keep = []
@@ -0,0 +1,114 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import random
+
+def ClockGen(clk, period=8, ppm=0, phase=0, jitter=0, seed=None):
+
+    # Drives clk with a nominal period in simulation time units, ppm parts per
+    # million faster (positive) or slower (negative).  The first rising edge
+    # is at half a period, like @always(delay(period//2)), delayed by phase.
+    # Edges go on the time unit nearest to the ideal edge, so the average
+    # frequency is exact even when the offset is far below one time unit per
+    # cycle, at the cost of an occasional edge one unit early or late.
+    # jitter: standard deviation of seeded random noise added to each edge,
+    # which does not accumulate from edge to edge
+
+    half = period / 2.0 / (1 + ppm*1e-6)
+    rand = random.Random(seed)
+
+    @instance
+    def logic():
+        k = 0
+        while True:
+            k += 1
+            t = phase + k*half
+            if jitter:
+                t += rand.gauss(0, jitter)
+            yield delay(max(int(round(t)) - now(), 1))
+            clk.next = not clk
+
+    return logic
+
+def frame_length(frame):
+    if hasattr(frame, 'get_length'):
+        return frame.get_length()
+    return len(getattr(frame, 'data', frame))
+
+def LineRateSource(clk, rst,
+                   fifo,
+                   source_fifo,
+                   bytes_per_cycle=8,
+                   overhead=20,
+                   period=8,
+                   ppm=0,
+                   length=frame_length,
+                   name=None):
+
+    # Moves frames from fifo to the fifo of a source endpoint at exactly the
+    # line rate of a link with the given clock period and ppm offset, which
+    # carries bytes_per_cycle bytes per cycle and overhead bytes per frame
+    # (preamble, SFD and IFG for Ethernet, 0 for AXI stream).  overhead must
+    # also count any bytes the DUT adds to each frame on the way to the
+    # link, such as the FCS a MAC appends, or the offered load will exceed
+    # the line rate.  Each frame is queued at the first clk edge at or after
+    # its start time on that link, so offered load follows the line rate of
+    # one domain while the source runs in another.  Start times are
+    # absolute, and frames that the source cannot keep up with wait in
+    # source_fifo.  The schedule starts over from the first frame queued
+    # after a reset or after fifo ran empty.
+    # length: function returning the length of a frame in bytes
+
+    cycle = period / (1 + ppm*1e-6)
+
+    @instance
+    def logic():
+        t = None
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                t = None
+                continue
+
+            while not fifo.empty():
+                if t is None:
+                    t = now()
+                elif now() < t:
+                    break
+
+                frame = fifo.get()
+                t += (length(frame) + overhead) * cycle / bytes_per_cycle
+                source_fifo.put(frame)
+
+                if name is not None:
+                    print("[%s] Queued frame %s" % (name, repr(frame)))
+
+            if fifo.empty() and t is not None and now() >= t:
+                # idle line
+                t = None
+
+    return logic
@@ -0,0 +1,58 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+class CosimSession(object):
+    # Runs test cases back to back in one simulation, so a single vvp
+    # process serves all of them.  Each case must leave the endpoint queues
+    # empty so it cannot leak frames into the next one.  With reset_cases,
+    # cases are also separated by a DUT reset; without it, DUT state carries
+    # over from one case to the next as in a single long test sequence.
+    def __init__(self, clk, rst, queues=(), reset_cycles=1, reset_cases=True):
+        self.clk = clk
+        self.rst = rst
+        self.queues = list(queues)
+        self.reset_cycles = reset_cycles
+        self.reset_cases = reset_cases
+        self.count = 0
+
+    def reset(self):
+        yield self.clk.posedge
+        self.rst.next = 1
+        for k in range(self.reset_cycles):
+            yield self.clk.posedge
+        self.rst.next = 0
+        yield self.clk.posedge
+
+    def check_idle(self, case):
+        for q in self.queues:
+            assert q.empty(), "case %s left frames queued" % (case,)
+
+    def run(self, cases, run_case):
+        # run_case(*case) returns the generator for one case
+        for case in cases:
+            if self.reset_cases and self.count > 0:
+                yield self.reset()
+            yield run_case(*case)
+            self.check_idle(case)
+            self.count += 1
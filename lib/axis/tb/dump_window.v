@@ -0,0 +1,116 @@
+/*
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+*/
+
+
+// Language: Verilog 2001
+
+`timescale 1 ps / 1 ps
+
+/*
+ * Waveform dump window
+ *
+ * Extra root module added by iverilog_build for windowed dumps.  Turns
+ * dumping off outside the window given by plusargs:
+ * +dump_start=<t> +dump_stop=<t> - simulation time, in the same units as
+ *   MyHDL now() (simulator precision)
+ * +dump_test_start=<n> +dump_test_stop=<n> - current_test range of the
+ *   testbench module named by the DUMP_TOP define
+ */
+module dump_window;
+
+reg [63:0] start_time = 0;
+reg [63:0] stop_time = 0;
+integer test_start = 0;
+integer test_stop = -1;
+
+reg ready = 1'b0;
+reg dumping = 1'b1;
+reg in_time = 1'b1;
+reg in_test = 1'b1;
+
+task update;
+begin
+    if (ready) begin
+        if (dumping && !(in_time && in_test)) begin
+            $dumpoff;
+            dumping = 1'b0;
+        end else if (!dumping && in_time && in_test) begin
+            $dumpon;
+            dumping = 1'b1;
+        end
+    end
+end
+endtask
+
+task check_test;
+begin
+`ifdef DUMP_TOP
+    in_test = `DUMP_TOP.current_test >= test_start &&
+        (test_stop < 0 || `DUMP_TOP.current_test <= test_stop);
+`else
+    in_test = 1'b1;
+`endif
+end
+endtask
+
+initial begin
+    if (!$value$plusargs("dump_start=%d", start_time))
+        start_time = 0;
+    if (!$value$plusargs("dump_stop=%d", stop_time))
+        stop_time = 0;
+    if (!$value$plusargs("dump_test_start=%d", test_start))
+        test_start = 0;
+    if (!$value$plusargs("dump_test_stop=%d", test_stop))
+        test_stop = -1;
+
+    // let the testbench call $dumpvars first
+    #0;
+
+    ready = 1'b1;
+    in_time = start_time == 0;
+    check_test;
+    update;
+
+    fork
+        if (start_time != 0) begin
+            #(start_time);
+            in_time = 1'b1;
+            update;
+        end
+        if (stop_time != 0) begin
+            #(stop_time);
+            in_time = 1'b0;
+            update;
+        end
+    join
+end
+
+`ifdef DUMP_TOP
+always @(`DUMP_TOP.current_test) begin
+    check_test;
+    update;
+end
+`endif
+
+endmodule
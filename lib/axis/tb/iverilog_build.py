@@ -0,0 +1,175 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# compiled testbenches are kept here, named by a hash of the build command,
+# the contents of every source file and the iverilog version
+# IVERILOG_CACHE=0 disables the cache
+cache_dir = os.environ.get('IVERILOG_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'iverilog_build'))
+cache_enable = os.environ.get('IVERILOG_CACHE', '1') != '0'
+
+# waveform dumping (COSIM_DUMP):
+# 'full' - dump all signals for the whole run
+# 'none' - no dump
+# a window, comma separated 'time=<start>:<stop>' (now() units) and/or
+# 'test=<first>:<last>' (current_test values), either bound may be left
+# empty, e.g. 'test=3:3' or 'time=200000:,test=2:'
+cosim_dump = os.environ.get('COSIM_DUMP', 'full')
+dump_format = os.environ.get('COSIM_DUMP_FORMAT', 'lxt2')
+
+dump_window_src = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'dump_window.v')
+
+iverilog_version = None
+
+def get_iverilog_version():
+    global iverilog_version
+    if iverilog_version is None:
+        try:
+            p = subprocess.Popen(['iverilog', '-V'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = p.communicate()
+            iverilog_version = out.splitlines()[0] if out else b''
+        except OSError:
+            iverilog_version = b''
+    return iverilog_version
+
+def build_key(args, srcs):
+    h = hashlib.sha1()
+    h.update(get_iverilog_version())
+    h.update(b'\0')
+    for a in args:
+        h.update(a.encode('utf-8'))
+        h.update(b'\0')
+    for s in srcs:
+        h.update(s.encode('utf-8'))
+        h.update(b'\0')
+        with open(s, 'rb') as f:
+            h.update(f.read())
+        h.update(b'\0')
+    return h.hexdigest()
+
+def parse_dump(dump):
+    # returns vvp plusargs for the dump window, or None for no dump
+    if dump == 'none':
+        return None
+    if dump in ('full', ''):
+        return []
+    plusargs = []
+    for item in dump.split(','):
+        kind, sep, window = item.strip().partition('=')
+        start, sep2, stop = window.partition(':')
+        if kind not in ('time', 'test') or not sep or not sep2:
+            raise Exception("Invalid dump window %s" % item)
+        prefix = 'dump_' if kind == 'time' else 'dump_test_'
+        if start:
+            plusargs.append('+%sstart=%d' % (prefix, int(float(start))))
+        if stop:
+            plusargs.append('+%sstop=%d' % (prefix, int(float(stop))))
+    return plusargs
+
+def vvp_cmd(vvp):
+    # command for Cosimulation, dumping as selected by cosim_dump
+    plusargs = parse_dump(cosim_dump)
+    if plusargs is None:
+        return "vvp -m myhdl %s -none" % vvp
+    return ' '.join(["vvp -m myhdl %s -%s" % (vvp, dump_format)] + plusargs)
+
+def replace_file(src, dst):
+    # copy src over dst so that dst is never seen partially written
+    tmp = '%s.%d.tmp' % (dst, os.getpid())
+    shutil.copyfile(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except AttributeError:
+        # python 2, rename replaces on POSIX
+        os.rename(tmp, dst)
+
+def build(build_cmd, srcs):
+    # Run an "iverilog -o <output> ..." build_cmd, reusing a cached output
+    # when the command, srcs and compiler are unchanged.  Sources pulled in
+    # with `include are not hashed, so list them in srcs to track them.
+    # Safe to call from several processes at once: builds of the same key
+    # are serialized with a lock file where fcntl is available, and outputs
+    # are written to temporary files and renamed into place.
+    args = shlex.split(build_cmd)
+
+    if '-o' not in args:
+        if os.system(build_cmd):
+            raise Exception("Error running build command")
+        return
+
+    i = args.index('-o')+1
+    output = args[i]
+
+    if parse_dump(cosim_dump):
+        # windowed dump, add dump_window as a second root module
+        top = os.path.splitext(os.path.basename(output))[0]
+        args = args[:1] + ['-DDUMP_TOP=%s' % top] + args[1:] + [dump_window_src]
+        i += 1
+        srcs = list(srcs) + [dump_window_src]
+
+    if not cache_enable:
+        if subprocess.call(args):
+            raise Exception("Error running build command")
+        return
+
+    key = build_key(args, srcs)
+    cached = os.path.join(cache_dir, key + '.vvp')
+
+    if not os.path.exists(cached):
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # created by another process
+                pass
+
+        # one process builds, others wait for it and reuse the result
+        with open(cached + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if not os.path.exists(cached):
+                tmp = '%s.%d.tmp' % (cached, os.getpid())
+                args[i] = tmp
+                if subprocess.call(args):
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise Exception("Error running build command")
+                try:
+                    os.replace(tmp, cached)
+                except AttributeError:
+                    os.rename(tmp, cached)
+
+    replace_file(cached, output)
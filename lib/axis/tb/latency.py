@@ -0,0 +1,203 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import math
+
+def tag_bytes(seq, length=4):
+    # sequence number as big endian bytes, to put at the start of a payload
+    return bytes(bytearray((seq >> 8*(length-1-k)) & 0xff for k in range(length)))
+
+def payload_tag(offset=0, length=4):
+    # Returns a function reading the tag of a frame: length bytes at offset
+    # in the payload of Ethernet, IP and UDP frames, in the data of other
+    # frames (GMII and XGMII data includes the preamble), or in the frame
+    # itself for bytes queued to a source
+    def tag(frame):
+        frame = getattr(frame, 'payload', frame)
+        if hasattr(frame, 'get_bytes'):
+            return frame.get_bytes(offset, offset+length)
+        data = getattr(frame, 'data', frame)
+        return bytes(bytearray(data[offset:offset+length]))
+    return tag
+
+def peak_in_flight(sent, received):
+    # most frames between the start of sending (ts_inject of sent frames) and
+    # the end of receiving (ts_last of received frames) at any one time, e.g.
+    # the buffering a FIFO needed; frames are counted out before new ones
+    # are counted in at the same time
+    events = sorted([(f.ts_inject, 1) for f in sent if f.ts_inject is not None] +
+        [(f.ts_last, -1) for f in received if f.ts_last is not None])
+    n = 0
+    peak = 0
+    for t, e in events:
+        n += e
+        peak = max(peak, n)
+    return peak
+
+class Histogram(object):
+    # Streaming histogram of non-negative integers with log-linear buckets:
+    # values below 2**sub_bits are counted exactly, larger ones in buckets
+    # no wider than 2**-(sub_bits-1) of their value, so memory depends on
+    # the range of the values and not on how many there are.
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            raise ValueError("Negative value %d" % value)
+        shift = max(value.bit_length() - self.sub_bits, 0)
+        key = shift << self.sub_bits | value >> shift
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+        self.total += value*count
+        self.total_sq += value*value*count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError("Histograms have different resolutions")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        for v in (other.min, other.max):
+            if v is not None:
+                if self.min is None or v < self.min:
+                    self.min = v
+                if self.max is None or v > self.max:
+                    self.max = v
+
+    def bucket_range(self, key):
+        shift = key >> self.sub_bits
+        low = (key & ((1 << self.sub_bits) - 1)) << shift
+        return low, low + (1 << shift) - 1
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / float(self.count)
+
+    def stdev(self):
+        if not self.count:
+            return None
+        m = self.mean()
+        return math.sqrt(max(self.total_sq / float(self.count) - m*m, 0))
+
+    def percentile(self, p):
+        # middle of the bucket holding the value at rank p percent, exact
+        # for values below 2**sub_bits
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(p / 100.0 * self.count)), 1)
+        n = 0
+        for key in sorted(self.buckets):
+            n += self.buckets[key]
+            if n >= rank:
+                low, high = self.bucket_range(key)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def summary(self, scale=1, percentiles=(50, 90, 99, 99.9)):
+        # scale: divides the values, e.g. by the clock period for cycles
+        s = {'count': self.count}
+        if self.count:
+            s['min'] = self.min / float(scale)
+            s['max'] = self.max / float(scale)
+            s['mean'] = self.mean() / scale
+            s['stdev'] = self.stdev() / scale
+            for p in percentiles:
+                s['p%g' % p] = self.percentile(p) / float(scale)
+        return s
+
+class LatencyTracker(object):
+    # Pairs frames queued to a source with the frames a sink received for
+    # them by sequence tag, and keeps histograms of the latency from the
+    # injection timestamp of the sent frame to the ts_last (end='last') or
+    # ts_first (end='first') timestamp of the received one, and of the
+    # jitter, the difference between consecutive latencies in the order
+    # frames are received.  sent() must be given the frame object that is
+    # put in the source queue, as the source sets ts_inject on it.
+    #
+    #   tracker = latency.LatencyTracker()
+    #   frame = axis_ep.AXIStreamFrame(latency.tag_bytes(k) + payload)
+    #   tracker.sent(frame)
+    #   source_queue.put(frame)
+    #   ...
+    #   tracker.received(sink_queue.get())
+    #   print(tracker.summary(scale=8))
+    def __init__(self, tag=None, end='last', sub_bits=5):
+        if end not in ('first', 'last'):
+            raise ValueError("Unknown end %s" % end)
+        self.tag = tag or payload_tag()
+        self.end = 'ts_' + end
+        self.pending = {}
+        self.latency = Histogram(sub_bits)
+        self.jitter = Histogram(sub_bits)
+        self.last_latency = None
+        self.unmatched = 0
+
+    def sent(self, frame):
+        tag = self.tag(frame)
+        if tag in self.pending:
+            raise Exception("Tag %r is already in flight" % (tag,))
+        self.pending[tag] = frame
+        return tag
+
+    def received(self, frame):
+        # returns the latency, or None for frames that were not sent
+        src = self.pending.pop(self.tag(frame), None)
+        if src is None:
+            self.unmatched += 1
+            return None
+        if src.ts_inject is None or getattr(frame, self.end) is None:
+            raise Exception("Frame has no timestamp")
+        lat = getattr(frame, self.end) - src.ts_inject
+        self.latency.add(lat)
+        if self.last_latency is not None:
+            self.jitter.add(abs(lat - self.last_latency))
+        self.last_latency = lat
+        return lat
+
+    def lost(self):
+        # frames sent but not received (yet)
+        return len(self.pending)
+
+    def summary(self, scale=1):
+        return {
+            'latency': self.latency.summary(scale),
+            'jitter': self.jitter.summary(scale),
+            'lost': self.lost(),
+            'unmatched': self.unmatched
+        }
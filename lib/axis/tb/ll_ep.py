@@ -23,6 +23,7 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+from collections import deque
 
 def LocalLinkSource(clk, rst,
                     data_out,
@@ -32,19 +33,27 @@ def LocalLinkSource(clk, rst,
                     dst_rdy_in_n,
                     fifo,
                     pause=0,
+                    pause_policy=None,
                     name=None):
 
     src_rdy_out_n_int = Signal(bool(True))
     dst_rdy_in_n_int = Signal(bool(True))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        dst_rdy_in_n_int.next = dst_rdy_in_n or pause
-        src_rdy_out_n.next = src_rdy_out_n_int or pause
+        dst_rdy_in_n_int.next = dst_rdy_in_n or pause or policy_pause
+        src_rdy_out_n.next = src_rdy_out_n_int or pause or policy_pause
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
         frame = []
+        data = deque()
 
         while True:
             yield clk.posedge, rst.posedge
@@ -54,25 +63,31 @@ def LocalLinkSource(clk, rst,
                 src_rdy_out_n_int.next = True
                 sof_out_n.next = True
                 eof_out_n.next = True
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if not dst_rdy_in_n_int and not src_rdy_out_n:
-                    if len(frame) > 0:
-                        data_out.next = frame.pop(0)
+                    if len(data) > 0:
+                        data_out.next = data.popleft()
                         src_rdy_out_n_int.next = False
                         sof_out_n.next = True
-                        eof_out_n.next = len(frame) != 0
+                        eof_out_n.next = len(data) != 0
                     else:
                         src_rdy_out_n_int.next = True
                         eof_out_n.next = True
                 if (not eof_out_n and not dst_rdy_in_n_int and not src_rdy_out_n) or src_rdy_out_n_int:
                     if not fifo.empty():
                         frame = fifo.get()
+                        data = deque(frame)
                         if name is not None:
                             print("[%s] Sending frame %s" % (name, repr(frame)))
-                        data_out.next = frame.pop(0)
+                        data_out.next = data.popleft()
                         src_rdy_out_n_int.next = False
                         sof_out_n.next = False
-                        eof_out_n.next = len(frame) != 0
+                        eof_out_n.next = len(data) != 0
 
     return logic, pause_logic
 
@@ -85,15 +100,22 @@ def LocalLinkSink(clk, rst,
                   dst_rdy_out_n,
                   fifo=None,
                   pause=0,
+                  pause_policy=None,
                   name=None):
 
     src_rdy_in_n_int = Signal(bool(True))
     dst_rdy_out_n_int = Signal(bool(True))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        dst_rdy_out_n.next = dst_rdy_out_n_int or pause
-        src_rdy_in_n_int.next = src_rdy_in_n or pause
+        dst_rdy_out_n.next = dst_rdy_out_n_int or pause or policy_pause
+        src_rdy_in_n_int.next = src_rdy_in_n or pause or policy_pause
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -105,7 +127,12 @@ def LocalLinkSink(clk, rst,
             if rst:
                 dst_rdy_out_n_int.next = True
                 frame = []
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 dst_rdy_out_n_int.next = False
 
                 if not src_rdy_in_n_int:
@@ -0,0 +1,49 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+
+# Selects the cases of a testbench to run in this process, from SHARD:
+# '<index>/<count>' - the index-th (0 based) of count contiguous, nearly
+#                     equal slices of the cases, so each shard runs part of
+#                     the full sequence in its original order
+# '' - all cases
+# run_regression.py --shards sets SHARD for benches that define cases()
+shard = os.environ.get('SHARD', '')
+
+def parse_shard(s):
+    index, sep, count = s.partition('/')
+    index, count = int(index), int(count or 1)
+    if not sep or not 0 <= index < count:
+        raise Exception("Invalid shard %s" % s)
+    return index, count
+
+def select(cases, s=None):
+    if s is None:
+        s = shard
+    if not s:
+        return list(cases)
+    index, count = parse_shard(s)
+    cases = list(cases)
+    return cases[len(cases)*index//count:len(cases)*(index+1)//count]
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -61,9 +62,8 @@ def dut_axis_async_fifo(async_rst,
                  output_axis_tlast,
                  output_axis_tuser):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 async_rst=async_rst,
                 input_clk=input_clk,
                 output_clk=output_clk,
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -32,9 +33,14 @@ except ImportError:
     from Queue import Queue
 
 import axis_ep
+import clock_ep
+import latency
 
 module = 'axis_async_frame_fifo'
 
+# frames for the sustained line rate test
+LINE_RATE_FRAMES = 1000
+
 srcs = []
 
 srcs.append("../rtl/%s.v" % module)
@@ -67,9 +73,8 @@ def dut_axis_async_frame_fifo(async_rst,
                  output_status_bad_frame,
                  output_status_good_frame):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 async_rst=async_rst,
                 input_clk=input_clk,
                 output_clk=output_clk,
@@ -124,6 +129,7 @@ def bench():
     source_pause = Signal(bool(0))
     sink_queue = Queue()
     sink_pause = Signal(bool(0))
+    line_queue = Queue()
 
     source = axis_ep.AXIStreamSource(input_clk,
                                     async_rst,
@@ -146,6 +152,17 @@ def bench():
                                 pause=sink_pause,
                                 name='sink')
 
+    # offers frames at the line rate of a 100 MHz link 100 ppm fast, while
+    # the output clock runs 100 ppm slow
+    line_source = clock_ep.LineRateSource(input_clk,
+                                          async_rst,
+                                          fifo=line_queue,
+                                          source_fifo=source_queue,
+                                          bytes_per_cycle=1,
+                                          overhead=0,
+                                          period=10,
+                                          ppm=100)
+
     # DUT
     dut = dut_axis_async_frame_fifo(async_rst,
                        input_clk,
@@ -170,13 +187,8 @@ def bench():
                        output_status_bad_frame,
                        output_status_good_frame)
 
-    @always(delay(4))
-    def input_clkgen():
-        input_clk.next = not input_clk
-
-    @always(delay(5))
-    def output_clkgen():
-        output_clk.next = not output_clk
+    input_clkgen = clock_ep.ClockGen(input_clk, 8)
+    output_clkgen = clock_ep.ClockGen(output_clk, 10, ppm=-100)
 
     input_status_overflow_asserted = Signal(bool(0))
     input_status_bad_frame_asserted = Signal(bool(0))
@@ -631,9 +643,46 @@ def bench():
 
         yield delay(100)
 
+        yield input_clk.posedge
+        print("test 11: sustained line rate with clock offset")
+        current_test.next = 11
+
+        input_status_overflow_asserted.next = 0
+        input_status_bad_frame_asserted.next = 0
+        output_status_overflow_asserted.next = 0
+        output_status_bad_frame_asserted.next = 0
+
+        test_frames = []
+        for k in range(LINE_RATE_FRAMES):
+            test_frame = axis_ep.AXIStreamFrame(bytearray((k+i) & 0xff for i in range(64)))
+            test_frames.append(test_frame)
+            line_queue.put(test_frame)
+
+        rx_frames = []
+        cycles = 0
+        while len(rx_frames) < len(test_frames) and cycles < 2*64*LINE_RATE_FRAMES:
+            yield output_clk.posedge
+            cycles += 1
+            while not sink_queue.empty():
+                rx_frames.append(sink_queue.get())
+
+        assert rx_frames == test_frames
+
+        assert not input_status_overflow_asserted
+        assert not input_status_bad_frame_asserted
+        assert not output_status_overflow_asserted
+        assert not output_status_bad_frame_asserted
+
+        # FIFO depth the offset needed, counting frames from the first beat
+        # sent to the last beat received
+        peak = latency.peak_in_flight(test_frames, rx_frames)
+        print("peak %d frames (%d bytes) in flight" % (peak, peak*64))
+
+        yield delay(100)
+
         raise StopSimulation
 
-    return dut, monitor_1, monitor_2, source, sink, input_clkgen, output_clkgen, check
+    return dut, monitor_1, monitor_2, source, sink, line_source, input_clkgen, output_clkgen, check
 
 def test_bench():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -72,9 +73,8 @@ def dut_axis_frame_length_adjust_8(clk,
                                    length_min,
                                    length_max):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s_8.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s_8.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -78,9 +79,8 @@ def dut_axis_mux_4(clk,
                  enable,
                  select):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -160,12 +160,14 @@ def bench():
     source_0_pause = Signal(bool(0))
     source_1_queue = Queue()
     source_1_pause = Signal(bool(0))
+    source_1_policy_select = axis_ep.SelectPause()
     source_2_queue = Queue()
     source_2_pause = Signal(bool(0))
     source_3_queue = Queue()
     source_3_pause = Signal(bool(0))
     sink_queue = Queue()
     sink_pause = Signal(bool(0))
+    sink_policy_select = axis_ep.SelectPause()
 
     source_0 = axis_ep.AXIStreamSource(clk,
                                        rst,
@@ -186,6 +188,7 @@ def bench():
                                        tuser=input_1_axis_tuser,
                                        fifo=source_1_queue,
                                        pause=source_1_pause,
+                                       pause_policy=source_1_policy_select,
                                        name='source1')
     source_2 = axis_ep.AXIStreamSource(clk,
                                        rst,
@@ -217,6 +220,7 @@ def bench():
                                  tuser=output_axis_tuser,
                                  fifo=sink_queue,
                                  pause=sink_pause,
+                                 pause_policy=sink_policy_select,
                                  name='sink')
 
     # DUT
@@ -491,6 +495,50 @@ def bench():
 
         yield delay(100)
 
+        yield clk.posedge
+        print("test 7: stall pattern sweep")
+        current_test.next = 7
+
+        select.next = 1
+
+        for pattern, source_policy, sink_policy in axis_ep.pause_patterns():
+            print("pattern: %s" % pattern)
+            source_1_policy_select.select(source_policy)
+            sink_policy_select.select(sink_policy)
+
+            test_frames = []
+            for k in range(16):
+                test_frame = axis_ep.AXIStreamFrame(bytearray((k+i) & 0xff for i in range(1+(k*37) % 64)))
+                test_frames.append(test_frame)
+                source_1_queue.put(test_frame)
+
+            rx_frames = []
+            cycles = 0
+            while len(rx_frames) < len(test_frames) and cycles < 100000:
+                yield clk.posedge
+                cycles += 1
+                while not sink_queue.empty():
+                    rx_frames.append(sink_queue.get())
+
+            assert rx_frames == test_frames
+
+            # clock period is 8; each beat needs a cycle in which neither
+            # side is paused, unless the DUT holds it across a pause, so the
+            # free cycles over the run may only exceed the beats by the
+            # latency at either end, at most 8 cycles, plus at most 2 per
+            # frame to pick up the next frame; more are bubbles
+            beats = sum(len(f.data) for f in test_frames)
+            free = axis_ep.free_cycles(source_policy, sink_policy, cycles)
+            print("%d beats in %d cycles, %d free" % (beats, rx_frames[-1].ts_last//8 - test_frames[0].ts_inject//8 + 1, free))
+            assert free <= beats + 8 + 2*len(test_frames)
+
+            yield delay(100)
+
+        source_1_policy_select.select(None)
+        sink_policy_select.select(None)
+
+        yield delay(100)
+
         raise StopSimulation
 
     return dut, source_0, source_1, source_2, source_3, sink, clkgen, check
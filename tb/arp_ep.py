@@ -32,7 +32,33 @@ try:
 except ImportError:
     from Queue import Queue
 
+# htype, ptype, hlen, plen, oper, sha (16 and 32 bit halves), spa,
+# tha (16 and 32 bit halves), tpa
+arp_hdr = struct.Struct('>HHBBHHLLHLL')
+
+def pack_arp_hdr(buf, offset, f):
+    arp_hdr.pack_into(buf, offset,
+        f.arp_htype,
+        f.arp_ptype,
+        f.arp_hlen,
+        f.arp_plen,
+        f.arp_oper,
+        f.arp_sha >> 32, f.arp_sha & 0xffffffff,
+        f.arp_spa,
+        f.arp_tha >> 32, f.arp_tha & 0xffffffff,
+        f.arp_tpa)
+
+def unpack_arp_hdr(buf, offset, f):
+    (f.arp_htype, f.arp_ptype, f.arp_hlen, f.arp_plen, f.arp_oper,
+        shah, shal, f.arp_spa, thah, thal, f.arp_tpa) = arp_hdr.unpack_from(buf, offset)
+    f.arp_sha = shah << 32 | shal
+    f.arp_tha = thah << 32 | thal
+
 class ARPFrame(object):
+    __slots__ = ('eth_dest_mac', 'eth_src_mac', 'eth_type',
+        'arp_htype', 'arp_ptype', 'arp_hlen', 'arp_plen', 'arp_oper',
+        'arp_sha', 'arp_spa', 'arp_tha', 'arp_tpa')
+
     def __init__(self,
                  eth_dest_mac=0,
                  eth_src_mac=0,
@@ -88,42 +114,32 @@ class ARPFrame(object):
             self.arp_tpa = eth_dest_mac.arp_tpa
 
     def build_axis(self):
-        return self.build_eth().build_axis()
+        n = eth_ep.eth_hdr.size
+        data = bytearray(n + arp_hdr.size)
+        eth_ep.pack_eth_hdr(data, 0, self)
+        pack_arp_hdr(data, n, self)
+
+        return axis_ep.layered_frame(data)
 
     def build_eth(self):
-        data = b''
-
-        data += struct.pack('>H', self.arp_htype)
-        data += struct.pack('>H', self.arp_ptype)
-        data += struct.pack('B', self.arp_hlen)
-        data += struct.pack('B', self.arp_plen)
-        data += struct.pack('>H', self.arp_oper)
-        data += struct.pack('>Q', self.arp_sha)[2:]
-        data += struct.pack('>L', self.arp_spa)
-        data += struct.pack('>Q', self.arp_tha)[2:]
-        data += struct.pack('>L', self.arp_tpa)
+        data = bytearray(arp_hdr.size)
+        pack_arp_hdr(data, 0, self)
 
         return eth_ep.EthFrame(data, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
 
     def parse_axis(self, data):
-        frame = eth_ep.EthFrame()
-        frame.parse_axis(data)
-        self.parse_eth(frame)
+        data = axis_ep.layered_frame(data)
+        n = eth_ep.eth_hdr.size
+        hdr = data.get_bytes(0, n + arp_hdr.size)
+        eth_ep.unpack_eth_hdr(hdr, 0, self)
+        unpack_arp_hdr(hdr, n, self)
 
     def parse_eth(self, data):
         self.eth_src_mac = data.eth_src_mac
         self.eth_dest_mac = data.eth_dest_mac
         self.eth_type = data.eth_type
 
-        self.arp_htype = struct.unpack('>H', data.payload.data[0:2])[0]
-        self.arp_ptype = struct.unpack('>H', data.payload.data[2:4])[0]
-        self.arp_hlen = struct.unpack('B', data.payload.data[4:5])[0]
-        self.arp_plen = struct.unpack('B', data.payload.data[5:6])[0]
-        self.arp_oper = struct.unpack('>H', data.payload.data[6:8])[0]
-        self.arp_sha = struct.unpack('>Q', b'\x00\x00'+data.payload.data[8:14])[0]
-        self.arp_spa = struct.unpack('>L', data.payload.data[14:18])[0]
-        self.arp_tha = struct.unpack('>Q', b'\x00\x00'+data.payload.data[18:24])[0]
-        self.arp_tpa = struct.unpack('>L', data.payload.data[24:28])[0]
+        unpack_arp_hdr(data.payload.get_bytes(0, arp_hdr.size), 0, self)
 
     def __eq__(self, other):
         if type(other) is ARPFrame:
@@ -171,15 +187,22 @@ def ARPFrameSource(clk, rst,
                    arp_tpa=Signal(intbv(0)[32:]),
                    fifo=None,
                    pause=0,
+                   pause_policy=None,
                    name=None):
 
     frame_ready_int = Signal(bool(False))
     frame_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        frame_ready_int.next = frame_ready and not pause
-        frame_valid.next = frame_valid_int and not pause
+        frame_ready_int.next = frame_ready and not (pause or policy_pause)
+        frame_valid.next = frame_valid_int and not (pause or policy_pause)
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -190,7 +213,12 @@ def ARPFrameSource(clk, rst,
 
             if rst:
                 frame_valid_int.next = False
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if frame_ready_int:
                     frame_valid_int.next = False
                 if (frame_ready_int and frame_valid) or not frame_valid_int:
@@ -235,15 +263,22 @@ def ARPFrameSink(clk, rst,
                  arp_tpa=Signal(intbv(0)[32:]),
                  fifo=None,
                  pause=0,
+                 pause_policy=None,
                  name=None):
 
     frame_ready_int = Signal(bool(False))
     frame_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
 
     @always_comb
     def pause_logic():
-        frame_ready.next = frame_ready_int and not pause
-        frame_valid_int.next = frame_valid and not pause
+        frame_ready.next = frame_ready_int and not (pause or policy_pause)
+        frame_valid_int.next = frame_valid and not (pause or policy_pause)
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -255,7 +290,12 @@ def ARPFrameSink(clk, rst,
             if rst:
                 frame_ready_int.next = False
                 frame = ARPFrame()
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 frame_ready_int.next = True
 
                 if frame_ready_int and frame_valid_int:
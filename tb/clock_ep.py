@@ -0,0 +1 @@
+../lib/axis/tb/clock_ep.py
\ No newline at end of file
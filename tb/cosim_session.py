@@ -0,0 +1 @@
+../lib/axis/tb/cosim_session.py
\ No newline at end of file
@@ -32,30 +32,147 @@ try:
 except ImportError:
     from Queue import Queue
 
+# dest MAC, source MAC (each split into 16 and 32 bit halves), ethertype
+eth_hdr = struct.Struct('>HLHLH')
+
+def pack_eth_hdr(buf, offset, f):
+    eth_hdr.pack_into(buf, offset,
+        f.eth_dest_mac >> 32, f.eth_dest_mac & 0xffffffff,
+        f.eth_src_mac >> 32, f.eth_src_mac & 0xffffffff,
+        f.eth_type)
+
+def unpack_eth_hdr(buf, offset, f):
+    dh, dl, sh, sl, f.eth_type = eth_hdr.unpack_from(buf, offset)
+    f.eth_dest_mac = dh << 32 | dl
+    f.eth_src_mac = sh << 32 | sl
+
+eth_fields = ('eth_dest_mac', 'eth_src_mac', 'eth_type')
+
+# combines (fields, unpack, size) of each header, outermost first, into a
+# layout for FrameView.init_view
+def view_layout(*layers):
+    index = {}
+    decoders = []
+    offset = 0
+    for i, (fields, unpack, size) in enumerate(layers):
+        for name in fields:
+            index[name] = i
+        decoders.append((unpack, offset))
+        offset += size
+    return index, decoders, offset
+
+class HeaderFields(object):
+    # scratch object for FrameView to decode a header into
+    pass
+
+class FrameView(object):
+    # Mixin for received frames that decode headers on demand.  Header fields
+    # are slots, so reading one that has not been set falls through to
+    # __getattr__, which decodes that header from the saved header bytes.
+    # Assigning a field of a header that has not been decoded yet decodes it
+    # first, so the assignment is never overwritten.  The payload is sliced
+    # out of the received frame on first access.  Subclasses add the slots
+    # _view (frame, layout, header bytes) and _view_decoded (header bitmap).
+    # Timestamps are copied from src, the frame the view was made from.
+    __slots__ = ()
+
+    def init_view(self, frame, layout, src=None):
+        hdr = frame.get_bytes(0, layout[2])
+        if len(hdr) < layout[2]:
+            raise Exception("Frame too short")
+        object.__setattr__(self, '_view', (frame, layout, hdr))
+        object.__setattr__(self, '_view_decoded', 0)
+        axis_ep.copy_timestamps(self, src)
+
+    def decode_layer(self, i):
+        frame, layout, hdr = self._view
+        object.__setattr__(self, '_view_decoded', self._view_decoded | 1 << i)
+        unpack, offset = layout[1][i]
+        fields = HeaderFields()
+        unpack(hdr, offset, fields)
+        for name, value in fields.__dict__.items():
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        if name.startswith('_view') or name.startswith('__'):
+            raise AttributeError(name)
+        frame, layout, hdr = self._view
+        i = layout[0].get(name)
+        if i is not None and not self._view_decoded & 1 << i:
+            self.decode_layer(i)
+            return object.__getattribute__(self, name)
+        if name == '_payload':
+            object.__setattr__(self, '_payload', frame.get_slice(layout[2]))
+            return self._payload
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        try:
+            i = self._view[1][0].get(name)
+        except AttributeError:
+            # not set up yet, e.g. while being copied
+            i = None
+        if i is not None and not self._view_decoded & 1 << i:
+            self.decode_layer(i)
+        object.__setattr__(self, name, value)
+
+class FCS(object):
+    # running CRC32 state; update() with successive chunks (header, payload
+    # segments, padding) to get the FCS without joining them first
+    def __init__(self, data=b''):
+        self.crc = 0
+        self.update(data)
+
+    def update(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+
+    def update_frame(self, frame):
+        for buf, offset, length in frame.get_segments(False):
+            if offset == 0 and length == len(buf):
+                self.update(buf)
+            else:
+                self.update(memoryview(buf)[offset:offset+length])
+
+    def copy(self):
+        c = FCS()
+        c.crc = self.crc
+        return c
+
+    def fcs(self):
+        return self.crc & 0xffffffff
+
 class EthFrame(object):
+    __slots__ = ('_version', '_fcs_key', '_fcs', '_payload', '_eth_dest_mac', '_eth_src_mac', '_eth_type', 'eth_fcs',
+        'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, payload=b'', eth_dest_mac=0, eth_src_mac=0, eth_type=0, eth_fcs=None):
+        self._version = 0
+        self._fcs_key = None
+        self._fcs = None
         self._payload = axis_ep.AXIStreamFrame()
         self.eth_dest_mac = eth_dest_mac
         self.eth_src_mac = eth_src_mac
         self.eth_type = eth_type
         self.eth_fcs = eth_fcs
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
 
         if type(payload) is dict:
-            self.payload = axis_ep.AXIStreamFrame(payload['eth_payload'])
+            self.payload = payload['eth_payload']
             self.eth_dest_mac = payload['eth_dest_mac']
             self.eth_src_mac = payload['eth_src_mac']
             self.eth_type = payload['eth_type']
             self.eth_fcs = payload['eth_fcs']
-        if type(payload) is bytes:
-            payload = bytearray(payload)
-        if type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload)
+        if type(payload) is bytes or type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
+            self.payload = payload
         if type(payload) is EthFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload.payload)
+            self.payload = payload.payload
             self.eth_dest_mac = payload.eth_dest_mac
             self.eth_src_mac = payload.eth_src_mac
             self.eth_type = payload.eth_type
             self.eth_fcs = payload.eth_fcs
+            axis_ep.copy_timestamps(self, payload)
 
     @property
     def payload(self):
@@ -64,49 +181,77 @@ class EthFrame(object):
     @payload.setter
     def payload(self, value):
         self._payload = axis_ep.AXIStreamFrame(value)
+        self._version += 1
 
-    def calc_fcs(self):
-        frame = self.build_axis().data
+    @property
+    def eth_dest_mac(self):
+        return self._eth_dest_mac
+
+    @eth_dest_mac.setter
+    def eth_dest_mac(self, value):
+        self._eth_dest_mac = value
+        self._version += 1
+
+    @property
+    def eth_src_mac(self):
+        return self._eth_src_mac
+
+    @eth_src_mac.setter
+    def eth_src_mac(self, value):
+        self._eth_src_mac = value
+        self._version += 1
 
-        return zlib.crc32(bytes(frame)) & 0xffffffff
+    @property
+    def eth_type(self):
+        return self._eth_type
+
+    @eth_type.setter
+    def eth_type(self, value):
+        self._eth_type = value
+        self._version += 1
+
+    def calc_fcs(self):
+        # cached until a header field or the payload is assigned, or the
+        # payload data is assigned or accessed (and so possibly edited)
+        key = (self._version, self._payload.version)
+        if self._fcs_key != key:
+            data = bytearray(eth_hdr.size)
+            pack_eth_hdr(data, 0, self)
+            fcs = FCS(data)
+            fcs.update_frame(self._payload)
+            self._fcs = fcs.fcs()
+            self._fcs_key = key
+        return self._fcs
 
     def update_fcs(self):
         self.eth_fcs = self.calc_fcs()
 
     def build_axis(self):
-        data = b''
+        data = bytearray(eth_hdr.size)
+        pack_eth_hdr(data, 0, self)
 
-        data += struct.pack('>Q', self.eth_dest_mac)[2:]
-        data += struct.pack('>Q', self.eth_src_mac)[2:]
-        data += struct.pack('>H', self.eth_type)
-
-        data += self.payload.data
-
-        return axis_ep.AXIStreamFrame(data)
+        return axis_ep.layered_frame(data, self.payload)
 
     def build_axis_fcs(self):
         if self.eth_fcs is None:
             self.update_fcs()
 
-        data = self.build_axis().data
-
-        data += struct.pack('<L', self.eth_fcs)
-
-        return axis_ep.AXIStreamFrame(data)
+        return axis_ep.layered_frame(self.build_axis(), struct.pack('<L', self.eth_fcs))
 
     def parse_axis(self, data):
-        data = axis_ep.AXIStreamFrame(data).data
-        self.eth_dest_mac = struct.unpack('>Q', b'\x00\x00'+data[0:6])[0]
-        self.eth_src_mac = struct.unpack('>Q', b'\x00\x00'+data[6:12])[0]
-        self.eth_type = struct.unpack('>H', data[12:14])[0]
-        data = data[14:]
-        self.payload = axis_ep.AXIStreamFrame(data)
+        data = axis_ep.layered_frame(data)
+        unpack_eth_hdr(data.get_bytes(0, eth_hdr.size), 0, self)
+        # get_slice returns a new frame, so it does not need to be copied
+        self._payload = data.get_slice(eth_hdr.size)
+        self._version += 1
+        axis_ep.copy_timestamps(self, data)
 
     def parse_axis_fcs(self, data):
         self.parse_axis(data)
-        data = self.payload.data
-        self.payload = axis_ep.AXIStreamFrame(data[:-4])
-        self.eth_fcs = struct.unpack('<L', data[-4:])[0]
+        data = self.payload
+        self._payload = data.get_slice(None, -4)
+        self._version += 1
+        self.eth_fcs = struct.unpack('<L', data.get_bytes(-4))[0]
 
     def __eq__(self, other):
         if type(other) is EthFrame:
@@ -135,10 +280,12 @@ def EthFrameSource(clk, rst,
                    eth_payload_tuser=Signal(bool(False)),
                    fifo=None,
                    pause=0,
+                   pause_policy=None,
                    name=None):
 
     eth_hdr_ready_int = Signal(bool(False))
     eth_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     eth_payload_pause = Signal(bool(False))
 
     eth_payload_fifo = Queue()
@@ -156,9 +303,14 @@ def EthFrameSource(clk, rst,
 
     @always_comb
     def pause_logic():
-        eth_hdr_ready_int.next = eth_hdr_ready and not pause
-        eth_hdr_valid.next = eth_hdr_valid_int and not pause
-        eth_payload_pause.next = pause # or eth_hdr_valid_int
+        eth_hdr_ready_int.next = eth_hdr_ready and not (pause or policy_pause)
+        eth_hdr_valid.next = eth_hdr_valid_int and not (pause or policy_pause)
+        eth_payload_pause.next = pause or policy_pause # or eth_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -169,12 +321,18 @@ def EthFrameSource(clk, rst,
 
             if rst:
                 eth_hdr_valid_int.next = False
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if eth_hdr_ready_int:
                     eth_hdr_valid_int.next = False
                 if (eth_payload_tlast and eth_hdr_ready_int and eth_hdr_valid) or not eth_hdr_valid_int:
                     if not fifo.empty():
                         frame = fifo.get()
+                        axis_ep.set_inject_time(frame)
                         frame = EthFrame(frame)
                         eth_dest_mac.next = frame.eth_dest_mac
                         eth_src_mac.next = frame.eth_src_mac
@@ -203,10 +361,12 @@ def EthFrameSink(clk, rst,
                  eth_payload_tuser=Signal(bool(False)),
                  fifo=None,
                  pause=0,
+                 pause_policy=None,
                  name=None):
 
     eth_hdr_ready_int = Signal(bool(False))
     eth_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     eth_payload_pause = Signal(bool(False))
 
     eth_payload_fifo = Queue()
@@ -225,9 +385,14 @@ def EthFrameSink(clk, rst,
 
     @always_comb
     def pause_logic():
-        eth_hdr_ready.next = eth_hdr_ready_int and not pause
-        eth_hdr_valid_int.next = eth_hdr_valid and not pause
-        eth_payload_pause.next = pause # or eth_hdr_valid_int
+        eth_hdr_ready.next = eth_hdr_ready_int and not (pause or policy_pause)
+        eth_hdr_valid_int.next = eth_hdr_valid and not (pause or policy_pause)
+        eth_payload_pause.next = pause or policy_pause # or eth_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -239,7 +404,12 @@ def EthFrameSink(clk, rst,
             if rst:
                 eth_hdr_ready_int.next = False
                 frame = EthFrame()
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 eth_hdr_ready_int.next = True
 
                 if eth_hdr_ready_int and eth_hdr_valid_int:
@@ -247,11 +417,14 @@ def EthFrameSink(clk, rst,
                     frame.eth_dest_mac = int(eth_dest_mac)
                     frame.eth_src_mac = int(eth_src_mac)
                     frame.eth_type = int(eth_type)
+                    frame.ts_first = now()
                     eth_header_fifo.put(frame)
 
                 if not eth_payload_fifo.empty() and not eth_header_fifo.empty():
                     frame = eth_header_fifo.get()
                     frame.payload = eth_payload_fifo.get()
+                    frame.ts_first = min(frame.ts_first, frame.payload.ts_first)
+                    frame.ts_last = frame.payload.ts_last
                     fifo.put(frame)
 
                     if name is not None:
@@ -0,0 +1,323 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+# Reference model of the eth_mac_10g_tx output, built from the XGMII
+# framing rules of IEEE 802.3 clause 46 rather than from the RTL:
+# - a frame is /S/, six preamble bytes and the SFD, the data padded with
+#   zeros to min_frame_length-4 bytes when padding is enabled, the FCS and
+#   /T/; a frame aborted by tuser or underflow carries /E/ before its /T/
+# - /S/ is only allowed on lane 0 or lane 4
+# - the IPG counts the /T/ and the idles up to the next /S/; without DIC
+#   every IPG is at least max(ifg_delay, 12).  With DIC an IPG may be
+#   shorter as long as the deficit (idles owed) stays at 3 or less, and
+#   longer IPGs pay the deficit back.
+# predict() gives the word stream of a transmitter that always uses the
+# shortest allowed IPG, and EthMac10GTxChecker checks the DUT output
+# against the same rules and the frames on its AXI input.
+
+from myhdl import *
+from collections import deque
+import struct
+import zlib
+
+import axis_ep
+
+XGMII_IDLE = 0x07
+XGMII_START = 0xfb
+XGMII_TERM = 0xfd
+XGMII_ERROR = 0xfe
+
+IDLE_TXD = 0x0707070707070707
+IDLE_TXC = 0xff
+
+PREAMBLE = bytearray(b'\x55\x55\x55\x55\x55\x55\xD5')
+
+def wire_data(data, enable_padding=True, min_frame_length=64):
+    # frame data as sent after the SFD: padded if enabled, FCS appended
+    data = bytearray(data)
+    if enable_padding and len(data) < min_frame_length-4:
+        data += bytearray(min_frame_length-4-len(data))
+    data += struct.pack('<L', zlib.crc32(bytes(data)) & 0xffffffff)
+    return data
+
+class IPGRule(object):
+    # shortest IPG allowed next, and the deficit left by each IPG sent
+    def __init__(self, enable_dic=True):
+        self.enable_dic = enable_dic
+        self.reset()
+
+    def reset(self):
+        self.deficit = 0
+
+    def min_ipg(self, ifg_delay=12):
+        ifg = max(ifg_delay, 12)
+        if self.enable_dic:
+            return ifg - 3 + self.deficit
+        return ifg
+
+    def ipg(self, n, ifg_delay=12):
+        # account for an IPG of n lanes; returns False if it was too short
+        if n < self.min_ipg(ifg_delay):
+            return False
+        if self.enable_dic:
+            self.deficit = max(0, self.deficit + max(ifg_delay, 12) - n)
+        return True
+
+def lanes_to_words(lanes):
+    # (byte, control) per lane to (txd, txc) per word, idle filled
+    lanes = list(lanes) + [(XGMII_IDLE, 1)]*(-len(lanes) % 8)
+    words = []
+    for k in range(0, len(lanes), 8):
+        txd = 0
+        txc = 0
+        for j in range(8):
+            b, c = lanes[k+j]
+            txd |= b << j*8
+            txc |= c << j
+        words.append((txd, txc))
+    return words
+
+def predict(frames, ifg_delay=12, enable_padding=True, enable_dic=True, min_frame_length=64):
+    # XGMII words sent for back to back frames (AXIStreamFrame or bytes,
+    # without FCS), from the first /S/ on lane 0 through the word holding
+    # the last /T/
+    rule = IPGRule(enable_dic)
+    lanes = []
+    term = None
+    for frame in frames:
+        if type(frame) is axis_ep.AXIStreamFrame:
+            frame = frame.get_bytes()
+        if term is not None:
+            start = term + rule.min_ipg(ifg_delay)
+            start += -start % 4
+            rule.ipg(start - term, ifg_delay)
+            lanes.extend([(XGMII_IDLE, 1)]*(start - len(lanes)))
+        lanes.append((XGMII_START, 1))
+        lanes.extend((b, 0) for b in PREAMBLE)
+        lanes.extend((b, 0) for b in wire_data(frame, enable_padding, min_frame_length))
+        term = len(lanes)
+        lanes.append((XGMII_TERM, 1))
+    return lanes_to_words(lanes)
+
+class EthMac10GTxModel(object):
+    # Checks an XGMII stream against the rules above, lane by lane, with the
+    # frames taken from the AXI input as the expected contents.  The first
+    # violation goes to mismatch as (cycle, time, description).
+    def __init__(self, enable_padding=True, enable_dic=True, min_frame_length=64):
+        self.enable_padding = enable_padding
+        self.enable_dic = enable_dic
+        self.min_frame_length = min_frame_length
+        self.rule = IPGRule(enable_dic)
+        self.reset()
+
+        self.mismatch = None
+        self.reset_stats()
+
+    def reset(self):
+        # input side: frames accepted on the AXI input, as (data, aborted)
+        self.expected = deque()
+        self.in_data = bytearray()
+        self.in_frame = False
+        self.in_abort = False
+
+        # output side
+        self.rule.reset()
+        self.lane = 0
+        self.term = None
+        self.frame = None
+        self.frame_error = False
+
+    def reset_stats(self):
+        self.cycles = 0
+        self.frame_lanes = 0
+        self.first_busy = None
+        self.last_busy = None
+        self.words = []
+
+    def input(self, tdata, tkeep, tvalid, tready, tlast, tuser):
+        # one cycle of the AXI input
+        if self.in_frame and not tvalid:
+            # underflow aborts the frame
+            self.in_abort = True
+        if tvalid and tready:
+            self.in_frame = True
+            for j in range(8):
+                if tkeep & (1 << j):
+                    self.in_data.append((tdata >> j*8) & 0xff)
+            if tlast:
+                self.expected.append((self.in_data, self.in_abort or bool(tuser)))
+                self.in_data = bytearray()
+                self.in_frame = False
+                self.in_abort = False
+
+    def output(self, txd, txc, ifg_delay=12):
+        # one XGMII word; returns a description of the first rule it breaks
+        error = None
+        for j in range(8):
+            b = (txd >> j*8) & 0xff
+            c = txc >> j & 1
+            e = self.lane_in(b, c, ifg_delay)
+            if e is not None and error is None:
+                error = "lane %d: %s" % (j, e)
+            self.lane += 1
+        return error
+
+    def lane_in(self, b, c, ifg_delay):
+        if self.frame is None:
+            if not c:
+                return "data 0x%02x outside a frame" % b
+            if b == XGMII_START:
+                if self.lane % 4:
+                    return "start on lane %d" % (self.lane % 8)
+                self.frame = bytearray()
+                self.frame_error = False
+                if self.term is not None:
+                    n = self.lane - self.term
+                    if not self.rule.ipg(n, ifg_delay):
+                        return "IPG of %d, %d allowed" % (n, self.rule.min_ipg(ifg_delay))
+            elif b != XGMII_IDLE:
+                return "control 0x%02x outside a frame" % b
+            return None
+
+        if not c:
+            self.frame.append(b)
+            return None
+        if b == XGMII_ERROR:
+            self.frame_error = True
+            return None
+        if b != XGMII_TERM:
+            return "control 0x%02x in a frame" % b
+
+        # end of frame
+        frame = self.frame
+        self.frame = None
+        self.term = self.lane
+        if not self.expected:
+            return "frame not sent on the input"
+        data, aborted = self.expected.popleft()
+        if self.frame_error != aborted:
+            if aborted:
+                return "aborted frame sent without /E/"
+            return "frame sent with /E/"
+        if aborted:
+            return None
+        if frame[:7] != PREAMBLE:
+            return "bad preamble"
+        if frame[7:] != wire_data(data, self.enable_padding, self.min_frame_length):
+            return "frame data differs"
+        return None
+
+    def record(self, txd, txc):
+        # line utilization counters, see line_utilization; words holds the
+        # output from the first busy word on
+        n = frame_lanes(txd, txc)
+        if n:
+            if self.first_busy is None:
+                self.first_busy = self.cycles
+            self.last_busy = self.cycles
+            self.frame_lanes += n
+        if self.first_busy is not None:
+            self.words.append((txd, txc))
+        self.cycles += 1
+
+    def utilization(self):
+        if self.first_busy is None:
+            return 0.0
+        return self.frame_lanes / float(8*(self.last_busy+1-self.first_busy))
+
+def frame_lanes(txd, txc):
+    # lanes carrying frame data, start and preamble included
+    n = 0
+    for j in range(8):
+        if not txc & (1 << j) or (txd >> j*8) & 0xff == XGMII_START:
+            n += 1
+    return n
+
+def line_utilization(words):
+    # fraction of lanes carrying frames, between the first start and the
+    # end of the last frame
+    busy = [k for k, (txd, txc) in enumerate(words) if frame_lanes(txd, txc)]
+    if not busy:
+        return 0.0
+    n = sum(frame_lanes(txd, txc) for txd, txc in words[busy[0]:busy[-1]+1])
+    return n / float(8*(busy[-1]+1-busy[0]))
+
+def ideal_utilization(lengths, ifg_delay=12, min_frame_length=64):
+    # best case for back to back frames of the given lengths (FCS
+    # excluded); DIC keeps the average gap at the configured IFG
+    ifg = max(ifg_delay, 12)
+    n = [max(l + 4, min_frame_length) + 8 for l in lengths]
+    return sum(n) / float(sum(n) + ifg*(len(n)-1))
+
+def EthMac10GTxChecker(clk, rst,
+                       model,
+                       input_axis_tdata,
+                       input_axis_tkeep,
+                       input_axis_tvalid,
+                       input_axis_tready,
+                       input_axis_tlast,
+                       input_axis_tuser,
+                       xgmii_txd,
+                       xgmii_txc,
+                       ifg_delay,
+                       name=None):
+
+    # Feeds model the DUT inputs and outputs every cycle and records the
+    # first cycle where the XGMII output breaks the framing rules or does
+    # not carry the input frames in model.mismatch.  Line utilization of
+    # the output is counted for model.utilization(), model.reset_stats()
+    # starts a new count.
+
+    model_input = model.input
+    model_output = model.output
+    model_record = model.record
+    model_reset = model.reset
+
+    @instance
+    def logic():
+        cycle = 0
+        while True:
+            yield clk.posedge
+
+            if rst:
+                model_reset()
+                continue
+
+            txd = int(xgmii_txd)
+            txc = int(xgmii_txc)
+
+            error = model_output(txd, txc, int(ifg_delay))
+            if error is not None and model.mismatch is None:
+                model.mismatch = (cycle, now(), error)
+                if name is not None:
+                    print("[%s] Mismatch in cycle %d at %d: %s, txd 0x%016x txc 0x%02x" %
+                        (name, cycle, now(), error, txd, txc))
+
+            model_record(txd, txc)
+
+            model_input(int(input_axis_tdata), int(input_axis_tkeep), bool(input_axis_tvalid),
+                bool(input_axis_tready), bool(input_axis_tlast), bool(input_axis_tuser))
+            cycle += 1
+
+    return logic
@@ -23,15 +23,30 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+import array
+
+# how sinks store per-byte sideband (error) of received frames:
+# 'list' - plain lists
+# 'array' - compact arrays
+# 'compact' - arrays, or None where all zero
+sideband_storage = 'list'
 
 class GMIIFrame(object):
+    __slots__ = ('data', 'error', 'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, data=b'', error=None):
         self.data = b''
         self.error = None
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
 
         if type(data) is GMIIFrame:
             self.data = data.data
             self.error = data.error
+            self.ts_inject = data.ts_inject
+            self.ts_first = data.ts_first
+            self.ts_last = data.ts_last
         else:
             self.data = bytearray(data)
 
@@ -39,23 +54,18 @@ class GMIIFrame(object):
         if self.data is None:
             return
 
-        f = list(self.data)
-        d = []
+        d = list(self.data)
         er = []
-        i = 0
 
         assert_er = False
         if (type(self.error) is int or type(self.error) is bool) and self.error:
             assert_er = True
             self.error = None
 
-        while len(f) > 0:
-            d.append(f.pop(0))
-            if self.error is None:
-                er.append(0)
-            else:
-                er.append(self.error[i])
-            i += 1
+        if self.error is None or type(self.error) is int or type(self.error) is bool:
+            er = [0]*len(d)
+        else:
+            er = list(self.error[:len(d)])
 
         if assert_er:
             er[-1] = 1
@@ -63,6 +73,42 @@ class GMIIFrame(object):
 
         return d, er
 
+    def build_bytes(self, preamble=False):
+        # data as a bytearray, optionally with preamble and SFD in front, and
+        # per byte errors as a bytearray, or None where there are none
+        if self.data is None:
+            return
+
+        d = bytearray(self.data)
+        if preamble:
+            d = bytearray(b'\x55\x55\x55\x55\x55\x55\x55\xD5') + d
+        offset = len(d) - len(self.data)
+        er = None
+
+        if type(self.error) is int or type(self.error) is bool:
+            if self.error:
+                er = bytearray(len(d))
+                er[-1] = 1
+                self.error = 1
+        elif self.error is not None and any(self.error):
+            er = bytearray(len(d))
+            e = bytearray(self.error[:len(self.data)])
+            er[offset:offset+len(e)] = e
+
+        return d, er
+
+    def strip_preamble(self):
+        # removes preamble and SFD (1 to 7 bytes of 0x55 then 0xD5), along
+        # with their errors; frames without them are left alone
+        n = 0
+        while n < 7 and n < len(self.data) and self.data[n] == 0x55:
+            n += 1
+        if 0 < n < len(self.data) and self.data[n] == 0xD5:
+            n += 1
+            self.data = self.data[n:]
+            if self.error is not None and type(self.error) is not int and type(self.error) is not bool:
+                self.error = self.error[n:]
+
     def parse(self, d, er):
         if d is None or er is None:
             return
@@ -70,6 +116,15 @@ class GMIIFrame(object):
         self.data = bytearray(d)
         self.error = er
 
+    def compact_sideband(self, storage='compact'):
+        if storage == 'list':
+            return
+        if self.error is not None and type(self.error) is not int and type(self.error) is not bool:
+            if storage == 'compact' and not any(self.error):
+                self.error = None
+            else:
+                self.error = array.array('B', self.error)
+
     def __eq__(self, other):
         if type(other) is GMIIFrame:
             return self.data == other.data
@@ -86,14 +141,22 @@ def GMIISource(clk, rst,
                tx_en,
                tx_er,
                fifo=None,
+               ifg=12,
+               preamble=False,
                name=None):
 
+    # ifg: idle cycles between frames (int or Signal), can be set below the
+    # 12 of 802.3 to stress receivers
+    # preamble: insert preamble and SFD, otherwise frames must include them
+
     @instance
     def logic():
         frame = None
-        d = []
-        er = []
+        d = None
+        er = None
+        ptr = 0
         ifg_cnt = 0
+        idle = False
 
         while True:
             yield clk.posedge, rst.posedge
@@ -103,33 +166,40 @@ def GMIISource(clk, rst,
                 txd.next = 0
                 tx_en.next = 0
                 tx_er.next = 0
-                d = []
-                er = []
+                d = None
+                er = None
+                ptr = 0
                 ifg_cnt = 0
+                idle = True
             else:
                 if ifg_cnt > 0:
                     ifg_cnt -= 1
-                    txd.next = 0
-                    tx_er.next = 0
-                    tx_en.next = 0
-                elif len(d) > 0:
-                    txd.next = d.pop(0)
-                    tx_er.next = er.pop(0)
+                elif d is None and not fifo.empty():
+                    frame = fifo.get()
+                    if type(frame) is GMIIFrame:
+                        frame.ts_inject = now()
+                    frame = GMIIFrame(frame)
+                    d, er = frame.build_bytes(preamble)
+                    ptr = 0
                     tx_en.next = 1
-                    if len(d) == 0:
-                        ifg_cnt = 12
-                elif not fifo.empty():
-                    frame = GMIIFrame(fifo.get())
-                    d, er = frame.build()
+                    tx_er.next = 0
+                    idle = False
                     if name is not None:
                         print("[%s] Sending frame %s" % (name, repr(frame)))
-                    txd.next = d.pop(0)
-                    tx_er.next = er.pop(0)
-                    tx_en.next = 1
-                else:
+
+                if d is not None:
+                    txd.next = d[ptr]
+                    if er is not None:
+                        tx_er.next = er[ptr]
+                    ptr += 1
+                    if ptr == len(d):
+                        d = None
+                        ifg_cnt = int(ifg)
+                elif not idle:
                     txd.next = 0
                     tx_er.next = 0
                     tx_en.next = 0
+                    idle = True
 
     return logic
 
@@ -139,38 +209,68 @@ def GMIISink(clk, rst,
              rx_dv,
              rx_er,
              fifo=None,
-             name=None):
+             preamble=False,
+             name=None,
+             sideband=None,
+             capture=None):
+
+    # preamble: strip preamble and SFD from received frames
+    # capture: PcapWriter (pcap_ep) to record received frames to
+    capture_write = None
+    if capture is not None:
+        capture_write = capture.add_interface(name, preamble=not preamble).write
 
     @instance
     def logic():
         frame = None
-        d = []
-        er = []
+        # frames are collected in place, buffers double when full
+        d = bytearray(2048)
+        er = bytearray(len(d))
+        ptr = 0
+        er_any = False
 
         while True:
             yield clk.posedge, rst.posedge
 
             if rst:
                 frame = None
-                d = []
-                er = []
+                ptr = 0
+                if er_any:
+                    er = bytearray(len(d))
+                er_any = False
             else:
                 if rx_dv:
                     if frame is None:
                         frame = GMIIFrame()
-                        d = []
-                        er = []
-                    d.append(int(rxd))
-                    er.append(int(rx_er))
+                        frame.ts_first = now()
+                    frame.ts_last = now()
+                    if ptr == len(d):
+                        d += bytearray(len(d))
+                        er += bytearray(len(er))
+                    d[ptr] = int(rxd)
+                    if rx_er:
+                        er[ptr] = 1
+                        er_any = True
+                    ptr += 1
                 elif frame is not None:
-                    if len(d) > 0:
-                        frame.parse(d, er)
+                    if ptr > 0:
+                        if er_any:
+                            frame.parse(d[:ptr], list(er[:ptr]))
+                            er[:ptr] = bytearray(ptr)
+                            er_any = False
+                        else:
+                            frame.parse(d[:ptr], [0]*ptr)
+                        if preamble:
+                            frame.strip_preamble()
+                        frame.compact_sideband(sideband or sideband_storage)
                         if fifo is not None:
                             fifo.put(frame)
                         if name is not None:
                             print("[%s] Got frame %s" % (name, repr(frame)))
+                        if capture_write is not None:
+                            capture_write(frame.data, now())
                     frame = None
-                    d = []
-                    er = []
+                    ptr = 0
 
     return logic
+
@@ -25,14 +25,117 @@ THE SOFTWARE.
 from myhdl import *
 import axis_ep
 import eth_ep
+import array
 import struct
+import sys
 
 try:
     from queue import Queue
 except ImportError:
     from Queue import Queue
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# version/IHL, DSCP/ECN, length, identification, flags/fragment offset,
+# TTL, protocol, header checksum, source IP, dest IP
+ip_hdr = struct.Struct('>BBHHHBBHLL')
+
+def pack_ip_hdr(buf, offset, f, ip_header_checksum=None):
+    if ip_header_checksum is None:
+        ip_header_checksum = f.ip_header_checksum
+    ip_hdr.pack_into(buf, offset,
+        f.ip_version << 4 | f.ip_ihl,
+        f.ip_dscp << 2 | f.ip_ecn,
+        f.ip_length,
+        f.ip_identification,
+        f.ip_flags << 13 | f.ip_fragment_offset,
+        f.ip_ttl,
+        f.ip_protocol,
+        ip_header_checksum,
+        f.ip_source_ip,
+        f.ip_dest_ip)
+
+def unpack_ip_hdr(buf, offset, f):
+    (v, d, f.ip_length, f.ip_identification, o, f.ip_ttl, f.ip_protocol,
+        f.ip_header_checksum, f.ip_source_ip, f.ip_dest_ip) = ip_hdr.unpack_from(buf, offset)
+    f.ip_version = (v >> 4) & 0xF
+    f.ip_ihl = v & 0xF
+    f.ip_dscp = (d >> 2) & 0x3F
+    f.ip_ecn = d & 0x3
+    f.ip_flags = (o >> 13) & 0x7
+    f.ip_fragment_offset = o & 0x1FFF
+
+# buffers at least this long are summed with numpy when it is available
+checksum_numpy_threshold = 2048
+
+def ones_sum(data):
+    # one's complement sum of big endian 16 bit words, an odd trailing byte
+    # is padded with zero; result is folded to 16 bits
+    data = memoryview(data)
+    n = len(data) & ~1
+    s = 0
+    if n >= checksum_numpy_threshold and numpy is not None:
+        s = int(numpy.frombuffer(data[:n], dtype='>u2').sum(dtype=numpy.uint64))
+    elif n > 0 and hasattr(int, 'from_bytes'):
+        # 2**16 == 1 mod 0xffff, so the value of the whole buffer is
+        # congruent to the sum of its words
+        s = int.from_bytes(data[:n], 'big')
+    elif n > 0:
+        a = array.array('H', data[:n].tobytes())
+        if sys.byteorder == 'little':
+            a.byteswap()
+        s = sum(a)
+    if len(data) & 1:
+        s += bytearray(data[n:].tobytes())[0] << 8
+    if s == 0:
+        return 0
+    return (s - 1) % 0xffff + 1
+
+class Checksum(object):
+    # running internet checksum; copy() a checksum over a fixed prefix and
+    # update() the copy to recompute after only the tail changes
+    def __init__(self, data=b''):
+        self.sum = 0
+        self.length = 0
+        self.update(data)
+
+    def update(self, data):
+        s = ones_sum(data)
+        if self.length & 1:
+            # data starts on an odd byte, so its words are byte swapped
+            s = (s >> 8 | s << 8) & 0xffff
+        s += self.sum
+        self.sum = (s & 0xffff) + (s >> 16)
+        self.length += len(data)
+
+    def update_frame(self, frame):
+        for buf, offset, length in frame.get_segments(False):
+            self.update(memoryview(buf)[offset:offset+length])
+
+    def copy(self):
+        c = Checksum()
+        c.sum = self.sum
+        c.length = self.length
+        return c
+
+    def checksum(self):
+        return ~self.sum & 0xffff
+
+def calc_ip_checksum(f):
+    data = bytearray(ip_hdr.size)
+    pack_ip_hdr(data, 0, f, 0)
+    return Checksum(data).checksum()
+
 class IPFrame(object):
+    __slots__ = ('_payload', 'eth_dest_mac', 'eth_src_mac', 'eth_type',
+        'ip_version', 'ip_ihl', 'ip_dscp', 'ip_ecn', 'ip_length', 'ip_identification',
+        'ip_flags', 'ip_fragment_offset', 'ip_ttl', 'ip_protocol', 'ip_header_checksum',
+        'ip_source_ip', 'ip_dest_ip',
+        'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, payload=b'',
                  eth_dest_mac=0,
                  eth_src_mac=0,
@@ -68,9 +171,12 @@ class IPFrame(object):
         self.ip_header_checksum = ip_header_checksum
         self.ip_source_ip = ip_source_ip
         self.ip_dest_ip = ip_dest_ip
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
 
         if type(payload) is dict:
-            self.payload = axis_ep.AXIStreamFrame(payload['ip_payload'])
+            self.payload = payload['ip_payload']
             self.eth_dest_mac = payload['eth_dest_mac']
             self.eth_src_mac = payload['eth_src_mac']
             self.eth_type = payload['eth_type']
@@ -87,12 +193,10 @@ class IPFrame(object):
             self.ip_header_checksum = payload['ip_header_checksum']
             self.ip_source_ip = payload['ip_source_ip']
             self.ip_dest_ip = payload['ip_dest_ip']
-        if type(payload) is bytes:
-            payload = bytearray(payload)
-        if type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload)
-        if type(payload) is IPFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload.payload)
+        if type(payload) is bytes or type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
+            self.payload = payload
+        if isinstance(payload, IPFrame):
+            self.payload = payload.payload
             self.eth_dest_mac = payload.eth_dest_mac
             self.eth_src_mac = payload.eth_src_mac
             self.eth_type = payload.eth_type
@@ -109,6 +213,7 @@ class IPFrame(object):
             self.ip_header_checksum = payload.ip_header_checksum
             self.ip_source_ip = payload.ip_source_ip
             self.ip_dest_ip = payload.ip_dest_ip
+            axis_ep.copy_timestamps(self, payload)
 
     @property
     def payload(self):
@@ -119,21 +224,10 @@ class IPFrame(object):
         self._payload = axis_ep.AXIStreamFrame(value)
 
     def update_length(self):
-        self.ip_length = len(self.payload.data) + 20
+        self.ip_length = self.payload.get_length() + 20
 
     def calc_checksum(self):
-        cksum = self.ip_version << 12 | self.ip_ihl << 8 | self.ip_dscp << 2 | self.ip_ecn
-        cksum += self.ip_length
-        cksum += self.ip_identification
-        cksum += self.ip_flags << 13 | self.ip_fragment_offset
-        cksum += self.ip_ttl << 8 | self.ip_protocol
-        cksum += self.ip_source_ip & 0xffff
-        cksum += (self.ip_source_ip >> 16) & 0xffff
-        cksum += self.ip_dest_ip & 0xffff
-        cksum += (self.ip_dest_ip >> 16) & 0xffff
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        return ~cksum & 0xffff
+        return calc_ip_checksum(self)
 
     def update_checksum(self):
         self.ip_header_checksum = self.calc_checksum()
@@ -145,58 +239,46 @@ class IPFrame(object):
             self.update_checksum()
 
     def build_axis(self):
-        return self.build_eth().build_axis()
-
-    def build_eth(self):
         self.build()
-        data = b''
+        data = bytearray(eth_ep.eth_hdr.size + ip_hdr.size)
+        eth_ep.pack_eth_hdr(data, 0, self)
+        pack_ip_hdr(data, eth_ep.eth_hdr.size, self)
 
-        data += struct.pack('B', self.ip_version << 4 | self.ip_ihl)
-        data += struct.pack('B', self.ip_dscp << 2 | self.ip_ecn)
-        data += struct.pack('>H', self.ip_length)
-        data += struct.pack('>H', self.ip_identification)
-        data += struct.pack('>H', self.ip_flags << 13 | self.ip_fragment_offset)
-        data += struct.pack('B', self.ip_ttl)
-        data += struct.pack('B', self.ip_protocol)
-        data += struct.pack('>H', self.ip_header_checksum)
-        data += struct.pack('>L', self.ip_source_ip)
-        data += struct.pack('>L', self.ip_dest_ip)
+        return axis_ep.layered_frame(data, self.payload)
 
-        data += self.payload.data
+    def build_eth(self):
+        self.build()
+        data = bytearray(ip_hdr.size)
+        pack_ip_hdr(data, 0, self)
 
-        return eth_ep.EthFrame(data, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
+        frame = eth_ep.EthFrame(b'', self.eth_dest_mac, self.eth_src_mac, self.eth_type)
+        frame.payload = axis_ep.layered_frame(data, self.payload)
+        return frame
 
     def parse_axis(self, data):
-        frame = eth_ep.EthFrame()
-        frame.parse_axis(data)
-        self.parse_eth(frame)
+        data = axis_ep.layered_frame(data)
+        n = eth_ep.eth_hdr.size
+        hdr = data.get_bytes(0, n + ip_hdr.size)
+        eth_ep.unpack_eth_hdr(hdr, 0, self)
+        unpack_ip_hdr(hdr, n, self)
+
+        # get_slice returns a new frame, so it does not need to be copied
+        self._payload = data.get_slice(n + ip_hdr.size)
+        axis_ep.copy_timestamps(self, data)
 
     def parse_eth(self, data):
         self.eth_src_mac = data.eth_src_mac
         self.eth_dest_mac = data.eth_dest_mac
         self.eth_type = data.eth_type
 
-        v = struct.unpack('B', data.payload.data[0:1])[0]
-        self.ip_version = (v >> 4) & 0xF
-        self.ip_ihl = v & 0xF
-        v = struct.unpack('B', data.payload.data[1:2])[0]
-        self.ip_dscp = (v >> 2) & 0x3F
-        self.ip_ecn = v & 0x3
-        self.ip_length = struct.unpack('>H', data.payload.data[2:4])[0]
-        self.ip_identification = struct.unpack('>H', data.payload.data[4:6])[0]
-        v = struct.unpack('>H', data.payload.data[6:8])[0]
-        self.ip_flags = (v >> 13) & 0x7
-        self.ip_fragment_offset = v & 0x1FFF
-        self.ip_ttl = struct.unpack('B', data.payload.data[8:9])[0]
-        self.ip_protocol = struct.unpack('B', data.payload.data[9:10])[0]
-        self.ip_header_checksum = struct.unpack('>H', data.payload.data[10:12])[0]
-        self.ip_source_ip = struct.unpack('>L', data.payload.data[12:16])[0]
-        self.ip_dest_ip = struct.unpack('>L', data.payload.data[16:20])[0]
-
-        self.payload = axis_ep.AXIStreamFrame(data.payload.data[20:])
+        unpack_ip_hdr(data.payload.get_bytes(0, ip_hdr.size), 0, self)
+
+        # get_slice returns a new frame, so it does not need to be copied
+        self._payload = data.payload.get_slice(ip_hdr.size)
+        axis_ep.copy_timestamps(self, data)
 
     def __eq__(self, other):
-        if type(other) is IPFrame:
+        if isinstance(other, IPFrame):
             return (self.eth_src_mac == other.eth_src_mac and
                 self.eth_dest_mac == other.eth_dest_mac and
                 self.eth_type == other.eth_type and
@@ -234,6 +316,27 @@ class IPFrame(object):
                 ('ip_source_ip=0x%08x, ' % self.ip_source_ip) +
                 ('ip_dest_ip=0x%08x)' % self.ip_dest_ip))
 
+ip_fields = ('ip_version', 'ip_ihl', 'ip_dscp', 'ip_ecn', 'ip_length', 'ip_identification',
+    'ip_flags', 'ip_fragment_offset', 'ip_ttl', 'ip_protocol', 'ip_header_checksum',
+    'ip_source_ip', 'ip_dest_ip')
+
+class IPFrameView(eth_ep.FrameView, IPFrame):
+    __slots__ = ('_view', '_view_decoded')
+
+    # views of a whole frame and of an Ethernet payload
+    layout_axis = eth_ep.view_layout((eth_ep.eth_fields, eth_ep.unpack_eth_hdr, eth_ep.eth_hdr.size),
+        (ip_fields, unpack_ip_hdr, ip_hdr.size))
+    layout_eth = eth_ep.view_layout((ip_fields, unpack_ip_hdr, ip_hdr.size))
+
+    def __init__(self, data):
+        if isinstance(data, eth_ep.EthFrame):
+            self.init_view(data.payload, self.layout_eth, data)
+            self.eth_dest_mac = data.eth_dest_mac
+            self.eth_src_mac = data.eth_src_mac
+            self.eth_type = data.eth_type
+        else:
+            self.init_view(axis_ep.layered_frame(data), self.layout_axis, data)
+
 def IPFrameSource(clk, rst,
                   ip_hdr_valid=None,
                   ip_hdr_ready=None,
@@ -261,10 +364,12 @@ def IPFrameSource(clk, rst,
                   ip_payload_tuser=Signal(bool(False)),
                   fifo=None,
                   pause=0,
+                  pause_policy=None,
                   name=None):
 
     ip_hdr_ready_int = Signal(bool(False))
     ip_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     ip_payload_pause = Signal(bool(False))
 
     ip_payload_fifo = Queue()
@@ -282,9 +387,14 @@ def IPFrameSource(clk, rst,
 
     @always_comb
     def pause_logic():
-        ip_hdr_ready_int.next = ip_hdr_ready and not pause
-        ip_hdr_valid.next = ip_hdr_valid_int and not pause
-        ip_payload_pause.next = pause # or ip_hdr_valid_int
+        ip_hdr_ready_int.next = ip_hdr_ready and not (pause or policy_pause)
+        ip_hdr_valid.next = ip_hdr_valid_int and not (pause or policy_pause)
+        ip_payload_pause.next = pause or policy_pause # or ip_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -295,12 +405,18 @@ def IPFrameSource(clk, rst,
 
             if rst:
                 ip_hdr_valid_int.next = False
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if ip_hdr_ready_int:
                     ip_hdr_valid_int.next = False
                 if (ip_payload_tlast and ip_hdr_ready_int and ip_hdr_valid) or not ip_hdr_valid_int:
                     if not fifo.empty():
                         frame = fifo.get()
+                        axis_ep.set_inject_time(frame)
                         frame = IPFrame(frame)
                         frame.build()
                         eth_dest_mac.next = frame.eth_dest_mac
@@ -356,10 +472,12 @@ def IPFrameSink(clk, rst,
                 ip_payload_tuser=Signal(bool(False)),
                 fifo=None,
                 pause=0,
+                pause_policy=None,
                 name=None):
 
     ip_hdr_ready_int = Signal(bool(False))
     ip_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     ip_payload_pause = Signal(bool(False))
 
     ip_payload_fifo = Queue()
@@ -378,9 +496,14 @@ def IPFrameSink(clk, rst,
 
     @always_comb
     def pause_logic():
-        ip_hdr_ready.next = ip_hdr_ready_int and not pause
-        ip_hdr_valid_int.next = ip_hdr_valid and not pause
-        ip_payload_pause.next = pause # or ip_hdr_valid_int
+        ip_hdr_ready.next = ip_hdr_ready_int and not (pause or policy_pause)
+        ip_hdr_valid_int.next = ip_hdr_valid and not (pause or policy_pause)
+        ip_payload_pause.next = pause or policy_pause # or ip_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -392,7 +515,12 @@ def IPFrameSink(clk, rst,
             if rst:
                 ip_hdr_ready_int.next = False
                 frame = IPFrame()
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 ip_hdr_ready_int.next = True
 
                 if ip_hdr_ready_int and ip_hdr_valid_int:
@@ -413,11 +541,14 @@ def IPFrameSink(clk, rst,
                     frame.ip_header_checksum = int(ip_header_checksum)
                     frame.ip_source_ip = int(ip_source_ip)
                     frame.ip_dest_ip = int(ip_dest_ip)
+                    frame.ts_first = now()
                     ip_header_fifo.put(frame)
 
                 if not ip_payload_fifo.empty() and not ip_header_fifo.empty():
                     frame = ip_header_fifo.get()
                     frame.payload = ip_payload_fifo.get()
+                    frame.ts_first = min(frame.ts_first, frame.payload.ts_first)
+                    frame.ts_last = frame.payload.ts_last
                     fifo.put(frame)
 
                     # ensure all payloads have been matched to headers
@@ -0,0 +1 @@
+../lib/axis/tb/iverilog_build.py
\ No newline at end of file
@@ -0,0 +1 @@
+../lib/axis/tb/latency.py
\ No newline at end of file
@@ -0,0 +1,374 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+import io
+import mmap
+import struct
+
+LINKTYPE_ETHERNET = 1
+
+# classic pcap, nanosecond timestamps
+pcap_file_hdr = struct.Struct('<LHHlLLL')
+pcap_rec_hdr = struct.Struct('<LLLL')
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+
+# pcapng, little endian
+pcapng_block_hdr = struct.Struct('<LL')
+pcapng_shb = struct.Struct('<LLLHHq')
+pcapng_idb = struct.Struct('<LLHHL')
+pcapng_epb = struct.Struct('<LLLLLLL')
+pcapng_opt = struct.Struct('<HH')
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1A2B3C4D
+
+def pad4(n):
+    return (4 - n) & 3
+
+def strip_preamble(data):
+    # drop preamble and SFD from GMII/XGMII frame data
+    if len(data) > 0 and data[0] == 0x55:
+        for i in range(1, min(len(data), 8)):
+            if data[i] == 0xd5:
+                return data[i+1:]
+            if data[i] != 0x55:
+                break
+    return data
+
+class PcapInterface(object):
+    # handle returned by PcapWriter.add_interface, one per sink
+    __slots__ = ('writer', 'id', 'preamble')
+
+    def __init__(self, writer, id, preamble=False):
+        self.writer = writer
+        self.id = id
+        self.preamble = preamble
+
+    def write(self, data, timestamp):
+        if self.preamble:
+            data = strip_preamble(data)
+        self.writer.write(data, timestamp, self.id)
+
+class PcapWriter(object):
+    # Buffered pcap/pcapng capture writer.  Timestamps are simulation time
+    # (now()) in units of timescale seconds, and are stored with nanosecond
+    # resolution.  pcapng records one interface per add_interface() call;
+    # classic pcap has no interface IDs, so all interfaces share one file
+    # link type.
+    def __init__(self, file, format=None, linktype=LINKTYPE_ETHERNET,
+                 timescale=1e-9, snaplen=65535, buffer_size=1 << 16):
+        if format is None:
+            if isinstance(file, str) and file.endswith('.pcapng'):
+                format = 'pcapng'
+            else:
+                format = 'pcap'
+        if format not in ('pcap', 'pcapng'):
+            raise Exception("Unknown capture format %s" % format)
+
+        self.format = format
+        self.linktype = linktype
+        self.timescale = timescale
+        self.snaplen = snaplen
+        self.buffer_size = buffer_size
+        self.interfaces = []
+        self.buf = bytearray()
+
+        if isinstance(file, str):
+            self.file = io.open(file, 'wb')
+            self.owns_file = True
+        else:
+            self.file = file
+            self.owns_file = False
+
+        self.ns = timescale * 1e9
+
+        if format == 'pcap':
+            self.buf += pcap_file_hdr.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, linktype)
+        else:
+            self.buf += pcapng_shb.pack(PCAPNG_SHB, 28, PCAPNG_BOM, 1, 0, -1)
+            self.buf += struct.pack('<L', 28)
+
+    def add_interface(self, name=None, linktype=None, preamble=False):
+        if linktype is None:
+            linktype = self.linktype
+
+        if self.format == 'pcap':
+            if linktype != self.linktype:
+                raise Exception("pcap files support a single link type")
+        else:
+            opts = bytearray()
+            if name is not None:
+                b = name.encode('utf-8')
+                opts += pcapng_opt.pack(2, len(b)) + b + b'\x00'*pad4(len(b))
+            # if_tsresol: 10^-9 s
+            opts += pcapng_opt.pack(9, 1) + b'\x09\x00\x00\x00'
+            opts += pcapng_opt.pack(0, 0)
+            length = pcapng_idb.size + len(opts) + 4
+            self.buf += pcapng_idb.pack(PCAPNG_IDB, length, linktype, 0, self.snaplen)
+            self.buf += opts
+            self.buf += struct.pack('<L', length)
+
+        iface = PcapInterface(self, len(self.interfaces), preamble)
+        self.interfaces.append(name)
+        return iface
+
+    def write(self, data, timestamp, interface=0):
+        ts = int(round(timestamp * self.ns))
+        orig_len = len(data)
+        incl_len = min(orig_len, self.snaplen)
+        if incl_len < orig_len:
+            data = data[:incl_len]
+
+        if self.format == 'pcap':
+            self.buf += pcap_rec_hdr.pack(ts // 1000000000, ts % 1000000000, incl_len, orig_len)
+            self.buf += data
+        else:
+            p = pad4(incl_len)
+            length = pcapng_epb.size + incl_len + p + 4
+            self.buf += pcapng_epb.pack(PCAPNG_EPB, length, interface,
+                (ts >> 32) & 0xffffffff, ts & 0xffffffff, incl_len, orig_len)
+            self.buf += data
+            self.buf += b'\x00'*p
+            self.buf += struct.pack('<L', length)
+
+        if len(self.buf) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.file.write(self.buf)
+            self.buf = bytearray()
+        self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class PcapReader(object):
+    # Memory maps a pcap or pcapng file and iterates over its packets as
+    # (timestamp in ns, interface ID, data) without reading the whole file.
+    # Timestamps are None for pcapng simple packet blocks.
+    def __init__(self, file):
+        self.file = io.open(file, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self.map = b''
+
+        magic = self.map[0:4]
+        if len(magic) < 4:
+            raise Exception("Not a pcap or pcapng file")
+        if struct.unpack('<L', magic)[0] == PCAPNG_SHB:
+            self.format = 'pcapng'
+        else:
+            self.format = 'pcap'
+            for e in '<>':
+                m = struct.unpack(e+'L', magic)[0]
+                if m in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                    self.endian = e
+                    self.ns = m == PCAP_MAGIC_NS
+                    break
+            else:
+                raise Exception("Not a pcap or pcapng file")
+
+    def __iter__(self):
+        if self.format == 'pcap':
+            return self.read_pcap()
+        return self.read_pcapng()
+
+    def read_pcap(self):
+        m = self.map
+        rec_hdr = struct.Struct(self.endian+'LLLL')
+        ns = self.ns
+        offset = pcap_file_hdr.size
+        end = len(m)
+
+        while offset + rec_hdr.size <= end:
+            sec, frac, incl_len, orig_len = rec_hdr.unpack_from(m, offset)
+            offset += rec_hdr.size
+            ts = sec*1000000000 + (frac if ns else frac*1000)
+            yield ts, 0, m[offset:offset+incl_len]
+            offset += incl_len
+
+    def read_pcapng(self):
+        m = self.map
+        offset = 0
+        end = len(m)
+        endian = '<'
+        tsres = []
+
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian+'L', m, offset)[0]
+
+            if block_type == PCAPNG_SHB:
+                # new section; byte order and interfaces start over
+                bom = struct.unpack_from('<L', m, offset+8)[0]
+                endian = '<' if bom == PCAPNG_BOM else '>'
+                tsres = []
+
+            length = struct.unpack_from(endian+'L', m, offset+4)[0]
+            if length < 12 or offset + length > end:
+                raise Exception("Truncated pcapng block at offset %d" % offset)
+
+            if block_type == PCAPNG_IDB:
+                tsres.append(self.parse_tsresol(m, offset+16, offset+length-4, endian))
+            elif block_type == PCAPNG_EPB:
+                iface, th, tl, incl_len, orig_len = struct.unpack_from(endian+'LLLLL', m, offset+8)
+                ts = tsres[iface](th << 32 | tl)
+                yield ts, iface, m[offset+28:offset+28+incl_len]
+            elif block_type == PCAPNG_SPB:
+                orig_len = struct.unpack_from(endian+'L', m, offset+8)[0]
+                incl_len = min(orig_len, length - 16)
+                yield None, 0, m[offset+12:offset+12+incl_len]
+
+            offset += length
+
+    @staticmethod
+    def parse_tsresol(m, offset, end, endian):
+        # returns a function converting interface timestamps to ns
+        res = 6
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(endian+'HH', m, offset)
+            if code == 0:
+                break
+            if code == 9:
+                res = bytearray(m[offset+4:offset+5])[0]
+            offset += 4 + length + pad4(length)
+
+        if res & 0x80:
+            return lambda ts: (ts * 1000000000) >> (res & 0x7f)
+        elif res <= 9:
+            scale = 10**(9-res)
+            return lambda ts: ts * scale
+        else:
+            scale = 10**(res-9)
+            return lambda ts: ts // scale
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def PcapSource(clk, rst,
+               fifo,
+               file,
+               interface=None,
+               preamble=False,
+               timing=False,
+               timescale=1e-9,
+               scale=1.0,
+               depth=2,
+               enable=Signal(bool(True)),
+               done=None,
+               name=None):
+
+    # Feeds frames from a capture file into the fifo of an existing source
+    # endpoint (AXIStreamSource, GMIISource, XGMIISource), keeping at most
+    # depth frames queued so memory use does not depend on the file size.
+    # Frames are only queued while enable is set and rst is clear; reset
+    # does not rewind the capture.
+    # interface: only replay this pcapng interface ID
+    # preamble: prepend preamble and SFD (for GMII/XGMII sources)
+    # timing: False to run back to back, True to queue each frame at its
+    # capture timestamp relative to the first frame, converted to now()
+    # units with timescale (seconds per unit) and stretched by scale
+
+    if done is None:
+        done = Signal(bool(0))
+
+    @instance
+    def logic():
+        reader = PcapReader(file)
+        packets = iter(reader)
+        start = None
+        t0 = None
+        pending = None
+
+        done.next = False
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                # replay gaps restart from the next frame
+                t0 = None
+                continue
+
+            if reader is None or not enable:
+                continue
+
+            while fifo.qsize() < depth:
+                if pending is None:
+                    for ts, iface, data in packets:
+                        if interface is None or iface == interface:
+                            pending = (ts, data)
+                            break
+                    else:
+                        # end of file
+                        reader.close()
+                        reader = None
+                        done.next = True
+                        break
+
+                ts, data = pending
+
+                if timing and ts is not None:
+                    if t0 is None:
+                        t0 = ts
+                        start = now()
+                    if now() < start + (ts - t0) * 1e-9 * scale / timescale:
+                        break
+
+                if preamble:
+                    data = b'\x55\x55\x55\x55\x55\x55\x55\xD5' + data
+                else:
+                    data = bytes(data)
+                fifo.put(data)
+                pending = None
+
+                if name is not None:
+                    print("[%s] Queued frame of %d bytes" % (name, len(data)))
+
+    return logic
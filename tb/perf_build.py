@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Measures cold and warm iverilog build times of the testbenches
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+def load(path):
+    # import a testbench for its build_cmd and srcs without running it
+    d, f = os.path.split(path)
+    name = os.path.splitext(f)[0]
+    sys.modules.pop(name, None)
+    sys.path.insert(0, d)
+    try:
+        return __import__(name)
+    finally:
+        sys.path.pop(0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('dirs', type=str, nargs='*', default=['.'], help="testbench directories")
+    parser.add_argument('--cache-dir', type=str, help="cache directory (default: temporary, cold start)")
+
+    args = parser.parse_args()
+
+    tests = []
+    for d in args.dirs:
+        tests.extend(sorted(os.path.abspath(p) for p in glob.glob(os.path.join(d, 'test_*.py'))))
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp()
+    cwd = os.getcwd()
+
+    totals = [0.0, 0.0]
+
+    try:
+        for path in tests:
+            os.chdir(os.path.dirname(path))
+            m = load(path)
+            m.iverilog_build.cache_dir = cache_dir
+
+            t = []
+            for k in range(2):
+                start = time.time()
+                m.iverilog_build.build(m.build_cmd, m.srcs)
+                t.append(time.time() - start)
+                totals[k] += t[-1]
+
+            os.chdir(cwd)
+            print("%-48s cold %8.3f s  warm %8.3f s" % (os.path.relpath(path), t[0], t[1]))
+    finally:
+        os.chdir(cwd)
+        if args.cache_dir is None:
+            shutil.rmtree(cache_dir)
+
+    print("%-48s cold %8.3f s  warm %8.3f s" % ("total (%d)" % len(tests), totals[0], totals[1]))
+
+if __name__ == '__main__':
+    main()
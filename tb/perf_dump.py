@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Measures testbench wall time with each waveform dump mode
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import run_regression
+
+default_benches = [
+    'tb/test_eth_mac_10g.py',
+    'tb/test_eth_mac_10g_fifo.py',
+    'tb/test_udp_complete_64.py'
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('benches', type=str, nargs='*', help="testbench files (default: 10G benches)")
+    parser.add_argument('-d', '--dump', type=str, action='append', help="dump modes (default: full, none)")
+    parser.add_argument('-t', '--timeout', type=float, default=0, help="per testbench timeout in seconds (default: none)")
+
+    args = parser.parse_args()
+
+    benches = [os.path.abspath(b) for b in args.benches]
+    if not benches:
+        benches = [os.path.join(run_regression.root, b) for b in default_benches]
+
+    modes = args.dump or ['full', 'none']
+
+    times = {}
+
+    for mode in modes:
+        os.environ['COSIM_DUMP'] = mode
+        work_root = tempfile.mkdtemp(prefix='perf_dump_')
+        try:
+            # build once so only simulation time is compared
+            run_regression.run_bench(benches[0], work_root, args.timeout)
+            shutil.rmtree(work_root)
+            os.mkdir(work_root)
+
+            for b in benches:
+                r = run_regression.run_bench(b, work_root, args.timeout)
+                times[mode, b] = r['wall_time']
+                print("%-8s %8.2f s  %-6s %s" % (mode, r['wall_time'], r['status'], r['name']))
+        finally:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    print()
+    base = modes[0]
+    for mode in modes[1:]:
+        for b in benches:
+            print("%-8s vs %-8s %6.2fx  %s" % (mode, base, times[base, b]/times[mode, b], run_regression.bench_name(b)))
+
+if __name__ == '__main__':
+    main()
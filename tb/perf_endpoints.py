@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Measures endpoint simulation throughput in beats per second of wall time
+"""
+
+from __future__ import print_function
+
+from myhdl import *
+import argparse
+import time
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import axis_ep
+import gmii_ep
+import xgmii_ep
+import xlgmii_ep
+import ll_ep
+
+def bench_axis(frames, width=64):
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    tdata = Signal(intbv(0)[width:])
+    tkeep = Signal(intbv(0)[max(width//8, 1):])
+    tvalid = Signal(bool(0))
+    tready = Signal(bool(0))
+    tlast = Signal(bool(0))
+    tuser = Signal(bool(0))
+
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = axis_ep.AXIStreamSource(clk,
+                                     rst,
+                                     tdata=tdata,
+                                     tkeep=tkeep,
+                                     tvalid=tvalid,
+                                     tready=tready,
+                                     tlast=tlast,
+                                     tuser=tuser,
+                                     fifo=source_queue)
+
+    sink = axis_ep.AXIStreamSink(clk,
+                                 rst,
+                                 tdata=tdata,
+                                 tkeep=tkeep,
+                                 tvalid=tvalid,
+                                 tready=tready,
+                                 tlast=tlast,
+                                 tuser=tuser,
+                                 fifo=sink_queue)
+
+    frames = [axis_ep.AXIStreamFrame(f) for f in frames]
+    beats = sum((len(f.data)+len(tkeep)-1)//len(tkeep) for f in frames)
+
+    return (source, sink), clk, rst, source_queue, sink_queue, frames, beats
+
+def bench_gmii(frames):
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    d = Signal(intbv(0)[8:])
+    en = Signal(bool(0))
+    er = Signal(bool(0))
+
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = gmii_ep.GMIISource(clk,
+                                rst,
+                                txd=d,
+                                tx_en=en,
+                                tx_er=er,
+                                fifo=source_queue,
+                                preamble=True)
+
+    sink = gmii_ep.GMIISink(clk,
+                            rst,
+                            rxd=d,
+                            rx_dv=en,
+                            rx_er=er,
+                            fifo=sink_queue,
+                            preamble=True)
+
+    frames = [gmii_ep.GMIIFrame(f) for f in frames]
+    beats = sum(len(f.data)+8 for f in frames)
+
+    return (source, sink), clk, rst, source_queue, sink_queue, frames, beats
+
+def bench_xgmii(frames):
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    d = Signal(intbv(0x0707070707070707)[64:])
+    c = Signal(intbv(0xff)[8:])
+
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = xgmii_ep.XGMIISource(clk,
+                                  rst,
+                                  txd=d,
+                                  txc=c,
+                                  fifo=source_queue)
+
+    sink = xgmii_ep.XGMIISink(clk,
+                              rst,
+                              rxd=d,
+                              rxc=c,
+                              fifo=sink_queue)
+
+    frames = [xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytes(f)) for f in frames]
+    beats = sum((len(f.data)+7)//8 for f in frames)
+
+    return (source, sink), clk, rst, source_queue, sink_queue, frames, beats
+
+def bench_xlgmii(frames, lanes=16):
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    d = Signal(intbv(0)[8*lanes:])
+    c = Signal(intbv(0)[lanes:])
+
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = xlgmii_ep.XLGMIISource(clk,
+                                    rst,
+                                    txd=d,
+                                    txc=c,
+                                    fifo=source_queue)
+
+    sink = xlgmii_ep.XLGMIISink(clk,
+                                rst,
+                                rxd=d,
+                                rxc=c,
+                                fifo=sink_queue)
+
+    frames = [xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytes(f)) for f in frames]
+    beats = sum((len(f.data)+lanes-1)//lanes for f in frames)
+
+    return (source, sink), clk, rst, source_queue, sink_queue, frames, beats
+
+def bench_ll(frames):
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    data = Signal(intbv(0)[8:])
+    sof_n = Signal(bool(1))
+    eof_n = Signal(bool(1))
+    src_rdy_n = Signal(bool(1))
+    dst_rdy_n = Signal(bool(1))
+
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = ll_ep.LocalLinkSource(clk,
+                                   rst,
+                                   data_out=data,
+                                   sof_out_n=sof_n,
+                                   eof_out_n=eof_n,
+                                   src_rdy_out_n=src_rdy_n,
+                                   dst_rdy_in_n=dst_rdy_n,
+                                   fifo=source_queue)
+
+    sink = ll_ep.LocalLinkSink(clk,
+                               rst,
+                               data_in=data,
+                               sof_in_n=sof_n,
+                               eof_in_n=eof_n,
+                               src_rdy_in_n=src_rdy_n,
+                               dst_rdy_out_n=dst_rdy_n,
+                               fifo=sink_queue)
+
+    frames = [bytearray(f) for f in frames]
+    beats = sum(len(f) for f in frames)
+
+    return (source, sink), clk, rst, source_queue, sink_queue, frames, beats
+
+def run(name, bench, frames):
+    endpoints, clk, rst, source_queue, sink_queue, frames, beats = bench(frames)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+
+        for f in frames:
+            source_queue.put(f)
+
+        while sink_queue.qsize() < len(frames):
+            yield clk.posedge
+
+        raise StopSimulation
+
+    sim = Simulation(endpoints, clkgen, check)
+
+    start = time.time()
+    sim.run(quiet=1)
+    elapsed = time.time() - start
+
+    print("%-14s %8d beats %8.3f s %10.0f beats/s" % (name, beats, elapsed, beats/elapsed))
+
+    return beats/elapsed
+
+def min_size(bench):
+    # back to back minimum size frames (60 bytes without FCS), as many as
+    # it takes to carry the same number of bytes as the given frames
+    def b(frames):
+        n = max(sum(len(f) for f in frames) // 60, 1)
+        return bench([bytearray((k+i) & 0xff for k in range(60)) for i in range(n)])
+    return b
+
+# frame sizes of RFC 2544 less FCS
+sweep_lengths = [60, 124, 252, 508, 1020, 1276, 1514]
+
+benches = [
+    ('axis_8', lambda f: bench_axis(f, 8)),
+    ('axis_64', lambda f: bench_axis(f, 64)),
+    ('gmii', bench_gmii),
+    ('xgmii', bench_xgmii),
+    ('xgmii_min', min_size(bench_xgmii)),
+    ('xlgmii_128', lambda f: bench_xlgmii(f, 16)),
+    ('xlgmii_256', lambda f: bench_xlgmii(f, 32)),
+    ('xlgmii_512', lambda f: bench_xlgmii(f, 64)),
+    ('xlgmii_512_min', min_size(lambda f: bench_xlgmii(f, 64))),
+    ('ll', bench_ll)
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-l', '--length', type=int, default=9000, help="frame length")
+    parser.add_argument('-c', '--count',  type=int, default=4, help="frame count")
+    parser.add_argument('-b', '--bench',  type=str, action='append', help="bench name (default: all)")
+    parser.add_argument('-s', '--sweep',  action='store_true', help="sweep frame sizes, each carrying length*count bytes")
+
+    args = parser.parse_args()
+
+    if args.sweep:
+        sizes = [(l, max(args.length*args.count // l, 1)) for l in sweep_lengths]
+    else:
+        sizes = [(args.length, args.count)]
+
+    for name, bench in benches:
+        if args.bench is None or name in args.bench:
+            for length, count in sizes:
+                frames = [bytearray((k+i) & 0xff for k in range(length)) for i in range(count)]
+                run(name if not args.sweep else "%s/%d" % (name, length), bench, frames)
+
+if __name__ == '__main__':
+    main()
+
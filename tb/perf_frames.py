@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Measures frame model build and parse rates in frames per second
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import axis_ep
+import eth_ep
+import ip_ep
+import udp_ep
+import arp_ep
+
+def make_eth(payload):
+    return eth_ep.EthFrame(payload, 0xDAD1D2D3D4D5, 0x5A5152535455, 0x8000)
+
+def make_ip(payload):
+    return ip_ep.IPFrame(payload,
+        eth_dest_mac=0xDAD1D2D3D4D5,
+        eth_src_mac=0x5A5152535455,
+        eth_type=0x0800,
+        ip_protocol=0x11,
+        ip_source_ip=0xc0a80165,
+        ip_dest_ip=0xc0a80164)
+
+def make_udp(payload):
+    return udp_ep.UDPFrame(payload,
+        eth_dest_mac=0xDAD1D2D3D4D5,
+        eth_src_mac=0x5A5152535455,
+        eth_type=0x0800,
+        ip_protocol=0x11,
+        ip_source_ip=0xc0a80165,
+        ip_dest_ip=0xc0a80164,
+        udp_source_port=1234,
+        udp_dest_port=5678)
+
+def make_arp(payload):
+    return arp_ep.ARPFrame(0xFFFFFFFFFFFF, 0x5A5152535455, 0x0806)
+
+benches = [
+    ('eth', make_eth, eth_ep.EthFrame),
+    ('ip', make_ip, ip_ep.IPFrame),
+    ('udp', make_udp, udp_ep.UDPFrame),
+    ('arp', make_arp, arp_ep.ARPFrame)
+]
+
+views = {
+    'ip': ip_ep.IPFrameView,
+    'udp': udp_ep.UDPFrameView
+}
+
+def run(name, make, cls, payload, count):
+    frame = make(payload)
+
+    start = time.time()
+    for k in range(count):
+        axis_frame = frame.build_axis()
+    build_rate = count/(time.time() - start)
+
+    data = bytearray(axis_frame.data)
+
+    start = time.time()
+    for k in range(count):
+        rx_frame = cls()
+        rx_frame.parse_axis(axis_ep.AXIStreamFrame(data))
+    parse_rate = count/(time.time() - start)
+
+    assert rx_frame == frame
+
+    print("%-6s build %10.0f frames/s  parse %10.0f frames/s" % (name, build_rate, parse_rate))
+
+    view = views.get(name)
+    if view is not None:
+        # lazy view, reading only the last header field
+        start = time.time()
+        for k in range(count):
+            rx_frame = view(axis_ep.AXIStreamFrame(data))
+            rx_frame.eth_type
+        view_rate = count/(time.time() - start)
+
+        assert rx_frame == frame
+
+        print("%-6s view  %10.0f frames/s" % (name, view_rate))
+
+    return build_rate, parse_rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-l', '--length', type=int, default=64, help="payload length")
+    parser.add_argument('-c', '--count',  type=int, default=100000, help="frame count")
+    parser.add_argument('-b', '--bench',  type=str, action='append', help="bench name (default: all)")
+
+    args = parser.parse_args()
+
+    payload = bytes(bytearray(k & 0xff for k in range(args.length)))
+
+    for name, make, cls in benches:
+        if args.bench is None or name in args.bench:
+            run(name, make, cls, payload, args.count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+"""
+Measures throughput, latency and stalls of the MACs and the IP/UDP stack
+with back to back traffic
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from myhdl import *
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import axis_ep
+import eth_ep
+import arp_ep
+import ip_ep
+import udp_ep
+import gmii_ep
+import xgmii_ep
+
+tb_dir = os.path.dirname(os.path.abspath(__file__))
+
+# clock period of the benches in ns; rates are scaled to the nominal clock
+period = 8
+
+preamble = b'\x55\x55\x55\x55\x55\x55\x55\xD5'
+
+local_mac = 0x5A5152535455
+local_ip = 0xc0a80164
+remote_mac = 0xDAD1D2D3D4D5
+remote_ip = 0xc0a80165
+
+fields = ['dut', 'direction', 'frame_size', 'frames', 'received', 'clock_mhz',
+    'gbps', 'max_gbps', 'utilization', 'latency_cycles', 'stall_ratio']
+
+class Probe(object):
+    # first beat time, frame end times, and valid and stall cycle counts
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.first = None
+        self.ends = []
+        self.valid = 0
+        self.stall = 0
+
+    def beat(self, last):
+        t = now() // period
+        if self.first is None:
+            self.first = t
+        if last:
+            self.ends.append(t)
+
+def AXIStreamProbe(clk, probe, tvalid, tready, tlast):
+
+    @instance
+    def logic():
+        while True:
+            yield clk.posedge
+            if tvalid:
+                probe.valid += 1
+                if tready:
+                    probe.beat(tlast)
+                else:
+                    probe.stall += 1
+
+    return logic
+
+def GMIIProbe(clk, probe, dv):
+
+    @instance
+    def logic():
+        active = False
+        while True:
+            yield clk.posedge
+            if dv:
+                probe.valid += 1
+                probe.beat(False)
+            elif active:
+                probe.beat(True)
+            active = bool(dv)
+
+    return logic
+
+def XGMIIProbe(clk, probe, d, c):
+
+    @instance
+    def logic():
+        active = False
+        while True:
+            yield clk.posedge
+            txd = int(d)
+            txc = int(c)
+            for k in range(8):
+                b = (txd >> 8*k) & 0xff
+                if txc & (1 << k):
+                    if b == 0xfb:
+                        active = True
+                    elif b == 0xfd and active:
+                        probe.beat(True)
+                        active = False
+            if active:
+                probe.valid += 1
+                probe.beat(False)
+
+    return logic
+
+def port_signals(module):
+    # one signal per reg/wire declared in test_<module>.v
+    signals = {}
+    with open(os.path.join(tb_dir, 'test_%s.v' % module)) as f:
+        for m in re.finditer(r'^(?:reg|wire)\s*(?:\[(\d+):0\])?\s*(\w+)', f.read(), re.M):
+            if m.group(1) is None:
+                signals[m.group(2)] = Signal(bool(0))
+            else:
+                signals[m.group(2)] = Signal(intbv(0)[int(m.group(1))+1:])
+    return signals
+
+def make_dut(module, s):
+    # cosimulation wrapper from the module testbench
+    test = __import__('test_%s' % module)
+    dut = [getattr(test, n) for n in dir(test) if n.startswith('dut_')][0]
+    code = dut.__code__
+    return dut(*[s[a] for a in code.co_varnames[:code.co_argcount]])
+
+def eth_frame(size):
+    # Ethernet frame of size bytes with FCS
+    payload = bytearray(k & 0xff for k in range(size-18))
+    return eth_ep.EthFrame(payload, remote_mac, local_mac, 0x8000)
+
+def ip_frame(size, src=remote_ip, dest=local_ip):
+    frame = ip_ep.IPFrame(bytearray(k & 0xff for k in range(size-38)),
+        local_mac, remote_mac, 0x0800,
+        ip_protocol=0x10, ip_source_ip=src, ip_dest_ip=dest)
+    frame.build()
+    return frame
+
+def udp_frame(size, src=remote_ip, dest=local_ip):
+    frame = udp_ep.UDPFrame(bytearray(k & 0xff for k in range(size-46)),
+        local_mac, remote_mac, 0x0800,
+        ip_source_ip=src, ip_dest_ip=dest,
+        udp_source_port=1234, udp_dest_port=5678)
+    frame.build()
+    return frame
+
+def mac_bench(module, clk, rst, s, xgmii):
+    # tx: AXI stream in, GMII/XGMII out; rx: the reverse
+    tx_queue = Queue()
+    rx_queue = Queue()
+    line_queue = Queue()
+    line_sink_queue = Queue()
+    tx_in = Probe()
+    tx_out = Probe()
+    rx_in = Probe()
+    rx_out = Probe()
+
+    insts = [make_dut(module, s)]
+
+    insts.append(axis_ep.AXIStreamSource(s['tx_clk'], s['tx_rst'],
+        tdata=s['tx_axis_tdata'], tkeep=s.get('tx_axis_tkeep', Signal(bool(True))),
+        tvalid=s['tx_axis_tvalid'], tready=s['tx_axis_tready'],
+        tlast=s['tx_axis_tlast'], tuser=s['tx_axis_tuser'], fifo=tx_queue))
+    insts.append(axis_ep.AXIStreamSink(s['rx_clk'], s['rx_rst'],
+        tdata=s['rx_axis_tdata'], tkeep=s.get('rx_axis_tkeep', Signal(bool(True))),
+        tvalid=s['rx_axis_tvalid'], tready=s.get('rx_axis_tready', Signal(bool(True))),
+        tlast=s['rx_axis_tlast'], tuser=s['rx_axis_tuser'], fifo=rx_queue))
+    insts.append(AXIStreamProbe(s['tx_clk'], tx_in, s['tx_axis_tvalid'], s['tx_axis_tready'], s['tx_axis_tlast']))
+    insts.append(AXIStreamProbe(s['rx_clk'], rx_out, s['rx_axis_tvalid'],
+        s.get('rx_axis_tready', Signal(bool(True))), s['rx_axis_tlast']))
+
+    if xgmii:
+        insts.append(xgmii_ep.XGMIISource(s['rx_clk'], s['rx_rst'],
+            txd=s['xgmii_rxd'], txc=s['xgmii_rxc'], fifo=line_queue))
+        insts.append(xgmii_ep.XGMIISink(s['tx_clk'], s['tx_rst'],
+            rxd=s['xgmii_txd'], rxc=s['xgmii_txc'], fifo=line_sink_queue))
+        insts.append(XGMIIProbe(s['rx_clk'], rx_in, s['xgmii_rxd'], s['xgmii_rxc']))
+        insts.append(XGMIIProbe(s['tx_clk'], tx_out, s['xgmii_txd'], s['xgmii_txc']))
+    else:
+        insts.append(gmii_ep.GMIISource(s['rx_clk'], s['rx_rst'],
+            txd=s['gmii_rxd'], tx_en=s['gmii_rx_dv'], tx_er=s['gmii_rx_er'], fifo=line_queue))
+        insts.append(gmii_ep.GMIISink(s['tx_clk'], s['tx_rst'],
+            rxd=s['gmii_txd'], rx_dv=s['gmii_tx_en'], rx_er=s['gmii_tx_er'], fifo=line_sink_queue))
+        insts.append(GMIIProbe(s['rx_clk'], rx_in, s['gmii_rx_dv']))
+        insts.append(GMIIProbe(s['tx_clk'], tx_out, s['gmii_tx_en']))
+
+    def setup():
+        s['ifg_delay'].next = 12
+        yield clk.posedge
+
+    directions = {
+        'tx': (lambda size: tx_queue.put(eth_frame(size).build_axis()), tx_in, tx_out, line_sink_queue),
+        'rx': (lambda size: line_queue.put(preamble + bytearray(eth_frame(size).build_axis_fcs())), rx_in, rx_out, rx_queue)
+    }
+
+    return insts, setup, directions
+
+def stack_bench(module, clk, rst, s, udp):
+    # rx: Ethernet frames in, IP or UDP out; tx: the reverse, after an ARP
+    # reply has filled the cache
+    eth_queue = Queue()
+    eth_sink_queue = Queue()
+    tx_queue = Queue()
+    rx_queue = Queue()
+    tx_in = Probe()
+    tx_out = Probe()
+    rx_in = Probe()
+    rx_out = Probe()
+
+    insts = [make_dut(module, s)]
+
+    insts.append(eth_ep.EthFrameSource(clk, rst,
+        eth_hdr_ready=s['input_eth_hdr_ready'], eth_hdr_valid=s['input_eth_hdr_valid'],
+        eth_dest_mac=s['input_eth_dest_mac'], eth_src_mac=s['input_eth_src_mac'],
+        eth_type=s['input_eth_type'], eth_payload_tdata=s['input_eth_payload_tdata'],
+        eth_payload_tkeep=s['input_eth_payload_tkeep'], eth_payload_tvalid=s['input_eth_payload_tvalid'],
+        eth_payload_tready=s['input_eth_payload_tready'], eth_payload_tlast=s['input_eth_payload_tlast'],
+        eth_payload_tuser=s['input_eth_payload_tuser'], fifo=eth_queue))
+    insts.append(eth_ep.EthFrameSink(clk, rst,
+        eth_hdr_ready=s['output_eth_hdr_ready'], eth_hdr_valid=s['output_eth_hdr_valid'],
+        eth_dest_mac=s['output_eth_dest_mac'], eth_src_mac=s['output_eth_src_mac'],
+        eth_type=s['output_eth_type'], eth_payload_tdata=s['output_eth_payload_tdata'],
+        eth_payload_tkeep=s['output_eth_payload_tkeep'], eth_payload_tvalid=s['output_eth_payload_tvalid'],
+        eth_payload_tready=s['output_eth_payload_tready'], eth_payload_tlast=s['output_eth_payload_tlast'],
+        eth_payload_tuser=s['output_eth_payload_tuser'], fifo=eth_sink_queue))
+
+    # unused host side outputs still need a ready sink
+    ip_sink_queue = Queue()
+    insts.append(ip_ep.IPFrameSink(clk, rst,
+        ip_hdr_ready=s['output_ip_hdr_ready'], ip_hdr_valid=s['output_ip_hdr_valid'],
+        eth_dest_mac=s['output_ip_eth_dest_mac'], eth_src_mac=s['output_ip_eth_src_mac'],
+        eth_type=s['output_ip_eth_type'], ip_version=s['output_ip_version'],
+        ip_ihl=s['output_ip_ihl'], ip_dscp=s['output_ip_dscp'], ip_ecn=s['output_ip_ecn'],
+        ip_length=s['output_ip_length'], ip_identification=s['output_ip_identification'],
+        ip_flags=s['output_ip_flags'], ip_fragment_offset=s['output_ip_fragment_offset'],
+        ip_ttl=s['output_ip_ttl'], ip_protocol=s['output_ip_protocol'],
+        ip_header_checksum=s['output_ip_header_checksum'], ip_source_ip=s['output_ip_source_ip'],
+        ip_dest_ip=s['output_ip_dest_ip'], ip_payload_tdata=s['output_ip_payload_tdata'],
+        ip_payload_tkeep=s['output_ip_payload_tkeep'], ip_payload_tvalid=s['output_ip_payload_tvalid'],
+        ip_payload_tready=s['output_ip_payload_tready'], ip_payload_tlast=s['output_ip_payload_tlast'],
+        ip_payload_tuser=s['output_ip_payload_tuser'], fifo=ip_sink_queue))
+
+    insts.append(AXIStreamProbe(clk, rx_in, s['input_eth_payload_tvalid'],
+        s['input_eth_payload_tready'], s['input_eth_payload_tlast']))
+    insts.append(AXIStreamProbe(clk, tx_out, s['output_eth_payload_tvalid'],
+        s['output_eth_payload_tready'], s['output_eth_payload_tlast']))
+
+    if udp:
+        insts.append(udp_ep.UDPFrameSource(clk, rst,
+            udp_hdr_valid=s['input_udp_hdr_valid'], udp_hdr_ready=s['input_udp_hdr_ready'],
+            ip_dscp=s['input_udp_ip_dscp'], ip_ecn=s['input_udp_ip_ecn'],
+            ip_ttl=s['input_udp_ip_ttl'], ip_source_ip=s['input_udp_ip_source_ip'],
+            ip_dest_ip=s['input_udp_ip_dest_ip'], udp_source_port=s['input_udp_source_port'],
+            udp_dest_port=s['input_udp_dest_port'], udp_length=s['input_udp_length'],
+            udp_checksum=s['input_udp_checksum'], udp_payload_tdata=s['input_udp_payload_tdata'],
+            udp_payload_tkeep=s['input_udp_payload_tkeep'], udp_payload_tvalid=s['input_udp_payload_tvalid'],
+            udp_payload_tready=s['input_udp_payload_tready'], udp_payload_tlast=s['input_udp_payload_tlast'],
+            udp_payload_tuser=s['input_udp_payload_tuser'], fifo=tx_queue))
+        insts.append(udp_ep.UDPFrameSink(clk, rst,
+            udp_hdr_ready=s['output_udp_hdr_ready'], udp_hdr_valid=s['output_udp_hdr_valid'],
+            eth_dest_mac=s['output_udp_eth_dest_mac'], eth_src_mac=s['output_udp_eth_src_mac'],
+            eth_type=s['output_udp_eth_type'], ip_version=s['output_udp_ip_version'],
+            ip_ihl=s['output_udp_ip_ihl'], ip_dscp=s['output_udp_ip_dscp'], ip_ecn=s['output_udp_ip_ecn'],
+            ip_length=s['output_udp_ip_length'], ip_identification=s['output_udp_ip_identification'],
+            ip_flags=s['output_udp_ip_flags'], ip_fragment_offset=s['output_udp_ip_fragment_offset'],
+            ip_ttl=s['output_udp_ip_ttl'], ip_protocol=s['output_udp_ip_protocol'],
+            ip_header_checksum=s['output_udp_ip_header_checksum'], ip_source_ip=s['output_udp_ip_source_ip'],
+            ip_dest_ip=s['output_udp_ip_dest_ip'], udp_source_port=s['output_udp_source_port'],
+            udp_dest_port=s['output_udp_dest_port'], udp_length=s['output_udp_length'],
+            udp_checksum=s['output_udp_checksum'], udp_payload_tdata=s['output_udp_payload_tdata'],
+            udp_payload_tkeep=s['output_udp_payload_tkeep'], udp_payload_tvalid=s['output_udp_payload_tvalid'],
+            udp_payload_tready=s['output_udp_payload_tready'], udp_payload_tlast=s['output_udp_payload_tlast'],
+            udp_payload_tuser=s['output_udp_payload_tuser'], fifo=rx_queue))
+        insts.append(AXIStreamProbe(clk, tx_in, s['input_udp_payload_tvalid'],
+            s['input_udp_payload_tready'], s['input_udp_payload_tlast']))
+        insts.append(AXIStreamProbe(clk, rx_out, s['output_udp_payload_tvalid'],
+            s['output_udp_payload_tready'], s['output_udp_payload_tlast']))
+        make_frame = udp_frame
+        rx_queue_out = rx_queue
+    else:
+        insts.append(ip_ep.IPFrameSource(clk, rst,
+            ip_hdr_valid=s['input_ip_hdr_valid'], ip_hdr_ready=s['input_ip_hdr_ready'],
+            ip_dscp=s['input_ip_dscp'], ip_ecn=s['input_ip_ecn'], ip_length=s['input_ip_length'],
+            ip_ttl=s['input_ip_ttl'], ip_protocol=s['input_ip_protocol'],
+            ip_source_ip=s['input_ip_source_ip'], ip_dest_ip=s['input_ip_dest_ip'],
+            ip_payload_tdata=s['input_ip_payload_tdata'], ip_payload_tkeep=s['input_ip_payload_tkeep'],
+            ip_payload_tvalid=s['input_ip_payload_tvalid'], ip_payload_tready=s['input_ip_payload_tready'],
+            ip_payload_tlast=s['input_ip_payload_tlast'], ip_payload_tuser=s['input_ip_payload_tuser'],
+            fifo=tx_queue))
+        insts.append(AXIStreamProbe(clk, tx_in, s['input_ip_payload_tvalid'],
+            s['input_ip_payload_tready'], s['input_ip_payload_tlast']))
+        insts.append(AXIStreamProbe(clk, rx_out, s['output_ip_payload_tvalid'],
+            s['output_ip_payload_tready'], s['output_ip_payload_tlast']))
+        make_frame = ip_frame
+        rx_queue_out = ip_sink_queue
+
+    def setup():
+        s['local_mac'].next = local_mac
+        s['local_ip'].next = local_ip
+        s['gateway_ip'].next = 0xc0a80101
+        s['subnet_mask'].next = 0xffffff00
+        yield clk.posedge
+
+        arp = arp_ep.ARPFrame(eth_dest_mac=local_mac, eth_src_mac=remote_mac, eth_type=0x0806,
+            arp_oper=2, arp_sha=remote_mac, arp_spa=remote_ip, arp_tha=local_mac, arp_tpa=local_ip)
+        eth_queue.put(arp.build_eth())
+        for k in range(100):
+            yield clk.posedge
+
+    directions = {
+        'tx': (lambda size: tx_queue.put(make_frame(size, local_ip, remote_ip)), tx_in, tx_out, eth_sink_queue),
+        'rx': (lambda size: eth_queue.put(make_frame(size).build_eth()), rx_in, rx_out, rx_queue_out)
+    }
+
+    return insts, setup, directions
+
+# name: (module, nominal clock in MHz, line rate in Gb/s, bench)
+duts = {
+    'eth_mac_1g': ('eth_mac_1g', 125.0, 1.0, lambda *a: mac_bench(*a, xgmii=False)),
+    'eth_mac_10g': ('eth_mac_10g', 156.25, 10.0, lambda *a: mac_bench(*a, xgmii=True)),
+    'eth_mac_10g_fifo': ('eth_mac_10g_fifo', 156.25, 10.0, lambda *a: mac_bench(*a, xgmii=True)),
+    'ip_complete_64': ('ip_complete_64', 156.25, 10.0, lambda *a: stack_bench(*a, udp=False)),
+    'udp_complete_64': ('udp_complete_64', 156.25, 10.0, lambda *a: stack_bench(*a, udp=True))
+}
+
+def result(name, direction, size, count, clock_mhz, line_gbps, pin, pout):
+    row = dict.fromkeys(fields)
+    row.update(dut=name, direction=direction, frame_size=size, frames=count,
+        received=len(pout.ends), clock_mhz=clock_mhz)
+
+    # a frame on the line also takes preamble, SFD and IFG
+    row['max_gbps'] = line_gbps * size / float(size + 20)
+
+    if len(pout.ends) > 1:
+        # steady state, from the end of the first frame to the last; with
+        # DIC a short run can average slightly under 12 bytes of IFG
+        cycles = pout.ends[-1] - pout.ends[0]
+        row['gbps'] = size*8*(len(pout.ends)-1) * clock_mhz / 1000.0 / cycles
+        row['utilization'] = row['gbps'] / row['max_gbps']
+    if pin.first is not None and pout.first is not None:
+        row['latency_cycles'] = pout.first - pin.first
+    if pin.valid:
+        row['stall_ratio'] = pin.stall / float(pin.valid)
+
+    return row
+
+def bench(name, sizes, count, results):
+    module, clock_mhz, line_gbps, make_bench = duts[name]
+
+    s = port_signals(module)
+    clk = s['clk']
+    rst = s['rst']
+    clocks = [s[n] for n in ('clk', 'rx_clk', 'tx_clk', 'logic_clk') if n in s]
+    resets = [s[n] for n in ('rst', 'rx_rst', 'tx_rst', 'logic_rst') if n in s]
+
+    insts, setup, directions = make_bench(module, clk, rst, s)
+
+    @always(delay(period//2))
+    def clkgen():
+        for c in clocks:
+            c.next = not c
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        for r in resets:
+            r.next = 1
+        yield clk.posedge
+        for r in resets:
+            r.next = 0
+        yield clk.posedge
+        yield setup()
+
+        for direction in sorted(directions):
+            send, pin, pout, sink_queue = directions[direction]
+            for size in sizes:
+                pin.reset()
+                pout.reset()
+
+                for k in range(count):
+                    send(size)
+
+                # at least 1 byte per cycle, with plenty of margin
+                timeout = 1000 + 4*count*(size+20)
+                cycles = 0
+                while len(pout.ends) < count and cycles < timeout:
+                    yield clk.posedge
+                    cycles += 1
+
+                for k in range(100):
+                    yield clk.posedge
+                while not sink_queue.empty():
+                    sink_queue.get(False)
+
+                row = result(name, direction, size, count, clock_mhz, line_gbps, pin, pout)
+                results.append(row)
+
+                print("%-16s %s %5d bytes  %s Gb/s (%s of line)  latency %s cycles  stalls %s  %d/%d frames" % (
+                    name, direction, size,
+                    '%7.3f' % row['gbps'] if row['gbps'] is not None else '    n/a',
+                    '%5.1f%%' % (100*row['utilization']) if row['utilization'] is not None else '  n/a',
+                    row['latency_cycles'], '%.3f' % row['stall_ratio'] if row['stall_ratio'] is not None else 'n/a',
+                    row['received'], count))
+                sys.stdout.flush()
+
+        raise StopSimulation
+
+    return insts, clkgen, check
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=tb_dir, stderr=subprocess.STDOUT)
+        return out.decode('ascii').strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-d', '--dut', type=str, action='append', help="DUT (default: all of %s)" % ', '.join(sorted(duts)))
+    parser.add_argument('-s', '--size', type=int, action='append', help="frame size in bytes with FCS (default: 64 to 9000)")
+    parser.add_argument('-n', '--frames', type=int, default=10, help="back to back frames per size")
+    parser.add_argument('-o', '--output', type=str, default='line_rate.json', help="JSON results file")
+    parser.add_argument('-c', '--csv', type=str, default='line_rate.csv', help="CSV results file")
+
+    args = parser.parse_args()
+
+    names = args.dut or sorted(duts)
+    sizes = args.size or [64, 128, 256, 512, 1024, 1518, 9000]
+
+    for n in names:
+        if n not in duts:
+            parser.error("unknown DUT %s" % n)
+
+    output = os.path.abspath(args.output)
+    csv_output = os.path.abspath(args.csv)
+
+    # testbench build commands use paths relative to tb
+    os.chdir(tb_dir)
+
+    results = []
+    start = time.time()
+    for n in names:
+        sim = Simulation(bench(n, sizes, args.frames, results))
+        sim.run(quiet=1)
+
+    summary = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'frames': args.frames,
+        'wall_time': time.time() - start,
+        'results': results
+    }
+
+    with open(output, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+    with open(csv_output, 'w') as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        for row in results:
+            w.writerow(row)
+
+if __name__ == '__main__':
+    main()
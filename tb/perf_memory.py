@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Measures memory held per queued received frame in bytes (needs Python 3.4+
+for tracemalloc)
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import axis_ep
+import udp_ep
+import gmii_ep
+import xgmii_ep
+
+def make_udp(length):
+    frame = udp_ep.UDPFrame(bytearray(k & 0xff for k in range(length)),
+        eth_dest_mac=0xDAD1D2D3D4D5,
+        eth_src_mac=0x5A5152535455,
+        eth_type=0x0800,
+        ip_source_ip=0xc0a80165,
+        ip_dest_ip=0xc0a80164,
+        udp_source_port=1234,
+        udp_dest_port=5678)
+    return frame.build_axis().data
+
+# the sinks collect one int per beat (or byte), then parse and compact
+
+def rx_axis(data, storage, width=64):
+    M = width//8
+    frame = axis_ep.AXIStreamFrame(data)
+    frame.M = M
+    tdata, tkeep, tuser = frame.build()
+    frame = axis_ep.AXIStreamFrame()
+    frame.M = M
+    frame.parse(tdata, tkeep, tuser)
+    frame.compact_sideband(storage)
+    return frame
+
+def rx_udp(data, storage):
+    frame = udp_ep.UDPFrame()
+    frame.parse_axis(rx_axis(data, storage))
+    return frame
+
+def rx_gmii(data, storage):
+    frame = gmii_ep.GMIIFrame()
+    frame.parse(list(bytearray(data)), [0]*len(data))
+    frame.compact_sideband(storage)
+    return frame
+
+def rx_xgmii(data, storage):
+    frame = xgmii_ep.XGMIIFrame()
+    frame.parse(list(bytearray(data)), [0]*len(data))
+    frame.compact_sideband(storage)
+    return frame
+
+benches = [
+    ('axis_64', rx_axis),
+    ('udp', rx_udp),
+    ('gmii', rx_gmii),
+    ('xgmii', rx_xgmii)
+]
+
+def run(name, rx, data, storage, count):
+    q = Queue()
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for k in range(count):
+        q.put(rx(data, storage))
+    size = (tracemalloc.get_traced_memory()[0] - start) / float(count)
+    tracemalloc.stop()
+
+    print("%-8s %-8s %10.0f bytes/frame" % (name, storage, size))
+
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-l', '--length', type=int, default=1472, help="UDP payload length")
+    parser.add_argument('-c', '--count',  type=int, default=1000, help="frame count")
+    parser.add_argument('-b', '--bench',  type=str, action='append', help="bench name (default: all)")
+    parser.add_argument('-s', '--storage', type=str, action='append', help="sideband storage (default: all)")
+
+    args = parser.parse_args()
+
+    if tracemalloc is None:
+        sys.exit("perf_memory.py needs tracemalloc, which is only in Python 3.4 and later")
+
+    data = make_udp(args.length)
+
+    for name, rx in benches:
+        if args.bench is None or name in args.bench:
+            for storage in ('list', 'array', 'compact'):
+                if args.storage is None or storage in args.storage:
+                    run(name, rx, data, storage, args.count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Runs the testbenches in parallel and writes a JSON summary
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+bench_dirs = ['tb', 'lib/axis/tb', 'example/*/fpga/tb']
+
+# files in testbench directories that are outputs, not inputs
+skip_suffixes = ('.vvp', '.lxt', '.vcd', '.pyc')
+skip_names = ('__pycache__',)
+
+SIM_TIME_TAG = 'REGRESSION_SIM_TIME'
+
+def find_benches(patterns):
+    benches = []
+    for p in patterns:
+        for d in sorted(glob.glob(os.path.join(root, p))):
+            benches.extend(sorted(glob.glob(os.path.join(d, 'test_*.py'))))
+    return benches
+
+def bench_name(bench):
+    name = os.path.relpath(bench, root)
+    if name.startswith('..'):
+        return bench
+    return name
+
+def link_dir(src, dst, skip=None):
+    os.mkdir(dst)
+    for name in os.listdir(src):
+        if name == skip or name in skip_names or name.endswith(skip_suffixes):
+            continue
+        os.symlink(os.path.join(src, name), os.path.join(dst, name))
+
+def shardable(bench):
+    # testbenches that enumerate their cases can be split with SHARD
+    with open(bench) as f:
+        return '\ndef cases(' in f.read()
+
+def make_work_dir(bench, work_root, suffix=''):
+    # Mirrors the testbench directory and its parent with symlinks, so
+    # relative source paths (../rtl/...) still resolve while build and dump
+    # outputs land in a directory private to this run.
+    tb_dir = os.path.dirname(bench)
+    parent = os.path.dirname(tb_dir)
+    name = bench_name(bench).strip(os.sep).replace(os.sep, '_')[:-3] + suffix
+    work = os.path.join(work_root, name)
+    link_dir(parent, work, skip=os.path.basename(tb_dir))
+    work_tb = os.path.join(work, os.path.basename(tb_dir))
+    link_dir(tb_dir, work_tb)
+    return work, work_tb
+
+def run_bench(bench, work_root, timeout=0, shard=''):
+    name = bench_name(bench)
+    suffix = ''
+    env = dict(os.environ)
+    env['SHARD'] = shard
+    if shard:
+        suffix = '_shard%s' % shard.split('/')[0]
+    work, work_tb = make_work_dir(bench, work_root, suffix)
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', os.path.basename(bench)]
+    log_path = os.path.join(work_tb, 'regression.log')
+
+    start = time.time()
+    with open(log_path, 'wb') as log:
+        p = subprocess.Popen(cmd, cwd=work_tb, env=env, stdout=log, stderr=subprocess.STDOUT)
+        status = 'pass'
+        try:
+            while p.poll() is None:
+                if timeout and time.time() - start > timeout:
+                    p.kill()
+                    p.wait()
+                    status = 'timeout'
+                    break
+                time.sleep(0.05)
+        except KeyboardInterrupt:
+            p.kill()
+            raise
+    wall_time = time.time() - start
+
+    with open(log_path, 'rb') as log:
+        output = log.read().decode('utf-8', 'replace').splitlines()
+
+    sim_time = None
+    for line in reversed(output):
+        if line.startswith(SIM_TIME_TAG):
+            sim_time = int(line.split()[1])
+            break
+
+    if status == 'pass' and p.returncode != 0:
+        status = 'fail'
+
+    result = {
+        'name': name,
+        'shard': shard,
+        'status': status,
+        'returncode': p.returncode,
+        'wall_time': wall_time,
+        'sim_time': sim_time,
+        'work_dir': work
+    }
+
+    if status != 'pass':
+        result['log_tail'] = output[-20:]
+
+    return result
+
+def merge_shards(results):
+    # one entry per testbench; sharded runs keep per shard results
+    merged = {}
+    for r in results:
+        if not r['shard']:
+            del r['shard']
+            merged[r['name']] = r
+            continue
+        m = merged.get(r['name'])
+        if m is None:
+            m = merged[r['name']] = {
+                'name': r['name'],
+                'status': 'pass',
+                'wall_time': 0.0,
+                'sim_time': 0,
+                'shards': []
+            }
+        m['shards'].append(r)
+        m['wall_time'] = max(m['wall_time'], r['wall_time'])
+        if r['sim_time'] is not None:
+            m['sim_time'] += r['sim_time']
+        if m['status'] == 'pass':
+            m['status'] = r['status']
+    for m in merged.values():
+        if 'shards' in m:
+            m['shards'].sort(key=lambda r: int(r['shard'].split('/')[0]))
+    return sorted(merged.values(), key=lambda r: r['name'])
+
+def worker(bench):
+    # runs in the private working directory of one testbench
+    sys.path.insert(0, os.getcwd())
+    from myhdl import now
+
+    m = __import__(os.path.splitext(bench)[0])
+    try:
+        m.test_bench()
+    finally:
+        print("%s %d" % (SIM_TIME_TAG, now()))
+        sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('benches', type=str, nargs='*', help="testbench files (default: all)")
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help="parallel jobs (default: cores)")
+    parser.add_argument('-o', '--output', type=str, default='regression.json', help="JSON summary file")
+    parser.add_argument('-t', '--timeout', type=float, default=0, help="per testbench timeout in seconds (default: none)")
+    parser.add_argument('-s', '--slowest', type=int, default=10, help="number of slowest testbenches to list")
+    parser.add_argument('-k', '--keep', action='store_true', help="keep working directories of passing testbenches")
+    parser.add_argument('--shards', type=int, help="shards for testbenches that define cases() (default: jobs)")
+    parser.add_argument('-d', '--dump', type=str, help="waveform dump: full, none or a window, see iverilog_build (default: COSIM_DUMP or full)")
+    parser.add_argument('--work-dir', type=str, help="directory for working directories (default: temporary)")
+    parser.add_argument('--worker', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+        return
+
+    if args.dump is not None:
+        # inherited by the testbench processes
+        os.environ['COSIM_DUMP'] = args.dump
+
+    if args.benches:
+        benches = [os.path.abspath(b) for b in args.benches]
+    else:
+        benches = find_benches(bench_dirs)
+
+    work_root = args.work_dir or tempfile.mkdtemp(prefix='regression_')
+    if not os.path.isdir(work_root):
+        os.makedirs(work_root)
+
+    shards = args.shards or args.jobs
+
+    runs = []
+    for b in benches:
+        if shards > 1 and shardable(b):
+            runs.extend((b, work_root, args.timeout, '%d/%d' % (k, shards)) for k in range(shards))
+        else:
+            runs.append((b, work_root, args.timeout, ''))
+
+    jobs = max(1, min(args.jobs, len(runs)))
+    print("Running %d testbenches (%d runs) with %d jobs in %s" % (len(benches), len(runs), jobs, work_root))
+
+    start = time.time()
+    pool = multiprocessing.pool.ThreadPool(jobs)
+    results = []
+    try:
+        for r in pool.imap_unordered(lambda a: run_bench(*a), runs):
+            print("%-8s %8.2f s  %s %s" % (r['status'].upper(), r['wall_time'], r['name'], r['shard']))
+            results.append(r)
+    finally:
+        pool.terminate()
+    wall_time = time.time() - start
+
+    for r in results:
+        if r['status'] == 'pass' and not args.keep:
+            shutil.rmtree(r['work_dir'], ignore_errors=True)
+            del r['work_dir']
+
+    bench_time = sum(r['wall_time'] for r in results)
+    results = merge_shards(results)
+    failed = [r for r in results if r['status'] != 'pass']
+
+    summary = {
+        'jobs': jobs,
+        'runs': len(runs),
+        'wall_time': wall_time,
+        'bench_time': bench_time,
+        'passed': len(results) - len(failed),
+        'failed': len(failed),
+        'benches': results
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+    print()
+    print("Slowest testbenches:")
+    for r in sorted(results, key=lambda r: -r['wall_time'])[:args.slowest]:
+        print("%8.2f s  %12s sim  %s" % (r['wall_time'], r['sim_time'], r['name']))
+
+    print()
+    print("%d passed, %d failed in %.2f s (%.2f s of testbench time)" % (
+        summary['passed'], summary['failed'], wall_time, summary['bench_time']))
+    for r in failed:
+        for f in r.get('shards', [r]):
+            if f['status'] != 'pass':
+                print("%s: %s %s, see %s" % (f['status'].upper(), f['name'], f.get('shard', ''), f['work_dir']))
+
+    if not failed and not args.keep and args.work_dir is None:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+../lib/axis/tb/shard.py
\ No newline at end of file
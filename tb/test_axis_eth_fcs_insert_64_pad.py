@@ -25,6 +25,9 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
+import cosim_session
+import shard
 import struct
 import zlib
 
@@ -75,9 +78,8 @@ def dut_axis_eth_fcs_insert_64(clk,
 
                                busy):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -98,7 +100,24 @@ def dut_axis_eth_fcs_insert_64(clk,
 
                 busy=busy)
 
-def bench():
+waits = ('wait_normal', 'wait_pause_source', 'wait_pause_sink')
+
+def cases():
+    # test matrix, one (test, length, wait mode) case each, see shard.py
+    c = []
+    for payload_len in list(range(1,18))+list(range(40,58)):
+        for test in 1, 2, 3:
+            for wait in waits:
+                c.append((test, payload_len, wait))
+    for payload_len in list(range(1,18)):
+        for wait in waits:
+            c.append((4, payload_len, wait))
+    return c
+
+def bench(case_list=None):
+
+    if case_list is None:
+        case_list = cases()
 
     # Parameters
     ENABLE_PADDING = 1
@@ -202,239 +221,255 @@ def bench():
             sink_pause.next = False
             yield clk.posedge
 
-    @instance
-    def check():
-        yield delay(100)
+    def test_packet(payload_len, wait):
         yield clk.posedge
-        rst.next = 1
+        print("test 1: test packet, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 1
+
+        test_frame = eth_ep.EthFrame()
+        test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame.eth_src_mac = 0x5A5152535455
+        test_frame.eth_type = 0x8000
+        test_frame.payload = bytearray(range(payload_len))
+        test_frame.update_fcs()
+
+        axis_frame = test_frame.build_axis()
+
+        source_queue.put(axis_frame)
+        yield clk.posedge
+        yield clk.posedge
+
+        yield wait()
+
         yield clk.posedge
-        rst.next = 0
         yield clk.posedge
-        yield delay(100)
         yield clk.posedge
 
-        # testbench stimulus
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-        for payload_len in list(range(1,18))+list(range(40,58)):
-            yield clk.posedge
-            print("test 1: test packet, length %d" % payload_len)
-            current_test.next = 1
+        eth_frame = eth_ep.EthFrame()
+        eth_frame.parse_axis_fcs(rx_frame)
+
+        print(hex(eth_frame.eth_fcs))
+        print(hex(eth_frame.calc_fcs()))
+
+        assert len(eth_frame.payload.data) == max(payload_len, 46)
+        assert eth_frame.eth_fcs == eth_frame.calc_fcs()
+        assert eth_frame.eth_dest_mac == test_frame.eth_dest_mac
+        assert eth_frame.eth_src_mac == test_frame.eth_src_mac
+        assert eth_frame.eth_type == test_frame.eth_type
+        assert eth_frame.payload.data.index(test_frame.payload.data) == 0
 
-            test_frame = eth_ep.EthFrame()
-            test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame.eth_src_mac = 0x5A5152535455
-            test_frame.eth_type = 0x8000
-            test_frame.payload = bytearray(range(payload_len))
-            test_frame.update_fcs()
+        assert sink_queue.empty()
 
-            axis_frame = test_frame.build_axis()
+        yield delay(100)
+
+    def test_back_to_back(payload_len, wait):
+        yield clk.posedge
+        print("test 2: back-to-back packets, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 2
+
+        test_frame1 = eth_ep.EthFrame()
+        test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame1.eth_src_mac = 0x5A5152535455
+        test_frame1.eth_type = 0x8000
+        test_frame1.payload = bytearray(range(payload_len))
+        test_frame1.update_fcs()
+        test_frame2 = eth_ep.EthFrame()
+        test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame2.eth_src_mac = 0x5A5152535455
+        test_frame2.eth_type = 0x8000
+        test_frame2.payload = bytearray(range(payload_len))
+        test_frame2.update_fcs()
+
+        axis_frame1 = test_frame1.build_axis()
+        axis_frame2 = test_frame2.build_axis()
+
+        source_queue.put(axis_frame1)
+        source_queue.put(axis_frame2)
+        yield clk.posedge
+        yield clk.posedge
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame)
-                yield clk.posedge
-                yield clk.posedge
+        yield wait()
 
-                yield wait()
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        eth_frame = eth_ep.EthFrame()
+        eth_frame.parse_axis_fcs(rx_frame)
 
-                eth_frame = eth_ep.EthFrame()
-                eth_frame.parse_axis_fcs(rx_frame)
+        print(hex(eth_frame.eth_fcs))
+        print(hex(eth_frame.calc_fcs()))
 
-                print(hex(eth_frame.eth_fcs))
-                print(hex(eth_frame.calc_fcs()))
+        assert len(eth_frame.payload.data) == max(payload_len, 46)
+        assert eth_frame.eth_fcs == eth_frame.calc_fcs()
+        assert eth_frame.eth_dest_mac == test_frame1.eth_dest_mac
+        assert eth_frame.eth_src_mac == test_frame1.eth_src_mac
+        assert eth_frame.eth_type == test_frame1.eth_type
+        assert eth_frame.payload.data.index(test_frame1.payload.data) == 0
 
-                assert len(eth_frame.payload.data) == max(payload_len, 46)
-                assert eth_frame.eth_fcs == eth_frame.calc_fcs()
-                assert eth_frame.eth_dest_mac == test_frame.eth_dest_mac
-                assert eth_frame.eth_src_mac == test_frame.eth_src_mac
-                assert eth_frame.eth_type == test_frame.eth_type
-                assert eth_frame.payload.data.index(test_frame.payload.data) == 0
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                assert sink_queue.empty()
+        eth_frame = eth_ep.EthFrame()
+        eth_frame.parse_axis_fcs(rx_frame)
 
-                yield delay(100)
+        print(hex(eth_frame.eth_fcs))
+        print(hex(eth_frame.calc_fcs()))
 
-            yield clk.posedge
-            print("test 2: back-to-back packets, length %d" % payload_len)
-            current_test.next = 2
-
-            test_frame1 = eth_ep.EthFrame()
-            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame1.eth_src_mac = 0x5A5152535455
-            test_frame1.eth_type = 0x8000
-            test_frame1.payload = bytearray(range(payload_len))
-            test_frame1.update_fcs()
-            test_frame2 = eth_ep.EthFrame()
-            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame2.eth_src_mac = 0x5A5152535455
-            test_frame2.eth_type = 0x8000
-            test_frame2.payload = bytearray(range(payload_len))
-            test_frame2.update_fcs()
-
-            axis_frame1 = test_frame1.build_axis()
-            axis_frame2 = test_frame2.build_axis()
-
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame1)
-                source_queue.put(axis_frame2)
-                yield clk.posedge
-                yield clk.posedge
-
-                yield wait()
-
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
-
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
-
-                eth_frame = eth_ep.EthFrame()
-                eth_frame.parse_axis_fcs(rx_frame)
-
-                print(hex(eth_frame.eth_fcs))
-                print(hex(eth_frame.calc_fcs()))
-
-                assert len(eth_frame.payload.data) == max(payload_len, 46)
-                assert eth_frame.eth_fcs == eth_frame.calc_fcs()
-                assert eth_frame.eth_dest_mac == test_frame1.eth_dest_mac
-                assert eth_frame.eth_src_mac == test_frame1.eth_src_mac
-                assert eth_frame.eth_type == test_frame1.eth_type
-                assert eth_frame.payload.data.index(test_frame1.payload.data) == 0
-
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
-
-                eth_frame = eth_ep.EthFrame()
-                eth_frame.parse_axis_fcs(rx_frame)
-
-                print(hex(eth_frame.eth_fcs))
-                print(hex(eth_frame.calc_fcs()))
-
-                assert len(eth_frame.payload.data) == max(payload_len, 46)
-                assert eth_frame.eth_fcs == eth_frame.calc_fcs()
-                assert eth_frame.eth_dest_mac == test_frame2.eth_dest_mac
-                assert eth_frame.eth_src_mac == test_frame2.eth_src_mac
-                assert eth_frame.eth_type == test_frame2.eth_type
-                assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
-
-                assert sink_queue.empty()
-
-                yield delay(100)
+        assert len(eth_frame.payload.data) == max(payload_len, 46)
+        assert eth_frame.eth_fcs == eth_frame.calc_fcs()
+        assert eth_frame.eth_dest_mac == test_frame2.eth_dest_mac
+        assert eth_frame.eth_src_mac == test_frame2.eth_src_mac
+        assert eth_frame.eth_type == test_frame2.eth_type
+        assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
 
-            yield clk.posedge
-            print("test 3: tuser assert, length %d" % payload_len)
-            current_test.next = 3
+        assert sink_queue.empty()
 
-            test_frame1 = eth_ep.EthFrame()
-            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame1.eth_src_mac = 0x5A5152535455
-            test_frame1.eth_type = 0x8000
-            test_frame1.payload = bytearray(range(payload_len))
-            test_frame1.update_fcs()
-            test_frame2 = eth_ep.EthFrame()
-            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame2.eth_src_mac = 0x5A5152535455
-            test_frame2.eth_type = 0x8000
-            test_frame2.payload = bytearray(range(payload_len))
-            test_frame2.update_fcs()
+        yield delay(100)
 
-            axis_frame1 = test_frame1.build_axis()
-            axis_frame2 = test_frame2.build_axis()
+    def test_tuser_assert(payload_len, wait):
+        yield clk.posedge
+        print("test 3: tuser assert, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 3
+
+        test_frame1 = eth_ep.EthFrame()
+        test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame1.eth_src_mac = 0x5A5152535455
+        test_frame1.eth_type = 0x8000
+        test_frame1.payload = bytearray(range(payload_len))
+        test_frame1.update_fcs()
+        test_frame2 = eth_ep.EthFrame()
+        test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame2.eth_src_mac = 0x5A5152535455
+        test_frame2.eth_type = 0x8000
+        test_frame2.payload = bytearray(range(payload_len))
+        test_frame2.update_fcs()
+
+        axis_frame1 = test_frame1.build_axis()
+        axis_frame2 = test_frame2.build_axis()
+
+        axis_frame1.user = 1
+
+        source_queue.put(axis_frame1)
+        source_queue.put(axis_frame2)
+        yield clk.posedge
+        yield clk.posedge
 
-            axis_frame1.user = 1
+        yield wait()
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame1)
-                source_queue.put(axis_frame2)
-                yield clk.posedge
-                yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-                yield wait()
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        assert rx_frame.user[-1]
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                assert rx_frame.user[-1]
+        eth_frame = eth_ep.EthFrame()
+        eth_frame.parse_axis_fcs(rx_frame)
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        print(hex(eth_frame.eth_fcs))
+        print(hex(eth_frame.calc_fcs()))
 
-                eth_frame = eth_ep.EthFrame()
-                eth_frame.parse_axis_fcs(rx_frame)
+        assert len(eth_frame.payload.data) == max(payload_len, 46)
+        assert eth_frame.eth_fcs == eth_frame.calc_fcs()
+        assert eth_frame.eth_dest_mac == test_frame2.eth_dest_mac
+        assert eth_frame.eth_src_mac == test_frame2.eth_src_mac
+        assert eth_frame.eth_type == test_frame2.eth_type
+        assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
 
-                print(hex(eth_frame.eth_fcs))
-                print(hex(eth_frame.calc_fcs()))
+        assert sink_queue.empty()
 
-                assert len(eth_frame.payload.data) == max(payload_len, 46)
-                assert eth_frame.eth_fcs == eth_frame.calc_fcs()
-                assert eth_frame.eth_dest_mac == test_frame2.eth_dest_mac
-                assert eth_frame.eth_src_mac == test_frame2.eth_src_mac
-                assert eth_frame.eth_type == test_frame2.eth_type
-                assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
+        yield delay(100)
 
-                assert sink_queue.empty()
+    def test_short_packet(payload_len, wait):
+        yield clk.posedge
+        print("test 4: test short packet, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 4
 
-                yield delay(100)
+        test_frame = bytearray(range(payload_len))
 
-        for payload_len in list(range(1,18)):
-            yield clk.posedge
-            print("test 4: test short packet, length %d" % payload_len)
-            current_test.next = 4
+        source_queue.put(test_frame)
+        yield clk.posedge
+        yield clk.posedge
 
-            test_frame = bytearray(range(payload_len))
+        yield wait()
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(test_frame)
-                yield clk.posedge
-                yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-                yield wait()
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        payload = rx_frame.data[:-4]
+        fcs = struct.unpack('<L', rx_frame.data[-4:])[0]
+        check_fcs = zlib.crc32(bytes(payload)) & 0xffffffff
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        print(hex(fcs))
+        print(hex(check_fcs))
 
-                payload = rx_frame.data[:-4]
-                fcs = struct.unpack('<L', rx_frame.data[-4:])[0]
-                check_fcs = zlib.crc32(bytes(payload)) & 0xffffffff
+        assert len(payload) == 60
+        assert payload.index(test_frame) == 0
+        assert check_fcs == fcs
 
-                print(hex(fcs))
-                print(hex(check_fcs))
+        assert sink_queue.empty()
 
-                assert len(payload) == 60
-                assert payload.index(test_frame) == 0
-                assert check_fcs == fcs
+        yield delay(100)
+
+    tests = {
+        1: test_packet,
+        2: test_back_to_back,
+        3: test_tuser_assert,
+        4: test_short_packet
+    }
+
+    wait_modes = {
+        'wait_normal': wait_normal,
+        'wait_pause_source': wait_pause_source,
+        'wait_pause_sink': wait_pause_sink
+    }
+
+    # one vvp process for all cases, run back to back without a reset in
+    # between like the original single sequence, so state the DUT carries
+    # from frame to frame and across wait modes is still exercised
+    session = cosim_session.CosimSession(clk, rst, [source_queue, sink_queue], reset_cases=False)
 
-                assert sink_queue.empty()
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
 
-                yield delay(100)
+        yield session.run(case_list, lambda test, length, wait: tests[test](length, wait_modes[wait]))
 
         raise StopSimulation
 
     return dut, source, sink, clkgen, check
 
 def test_bench():
-    sim = Simulation(bench())
+    sim = Simulation(bench(shard.select(cases())))
     sim.run()
 
 if __name__ == '__main__':
@@ -25,6 +25,9 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
+import cosim_session
+import shard
 
 try:
     from queue import Queue
@@ -71,9 +74,8 @@ def dut_eth_axis_rx_64(clk,
                        busy,
                        error_header_early_termination):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -100,7 +102,24 @@ def dut_eth_axis_rx_64(clk,
                 busy=busy,
                 error_header_early_termination=error_header_early_termination)
 
-def bench():
+waits = ('wait_normal', 'wait_pause_source', 'wait_pause_sink')
+
+def cases():
+    # test matrix, one (test, length, wait mode) case each, see shard.py
+    c = []
+    for payload_len in range(1,18):
+        for test in 1, 2, 3:
+            for wait in waits:
+                c.append((test, payload_len, wait))
+    for length in range(1,15):
+        for wait in waits:
+            c.append((4, length, wait))
+    return c
+
+def bench(case_list=None):
+
+    if case_list is None:
+        case_list = cases()
 
     # Inputs
     clk = Signal(bool(0))
@@ -224,199 +243,217 @@ def bench():
             sink_pause.next = False
             yield clk.posedge
 
-    @instance
-    def check():
-        yield delay(100)
-        yield clk.posedge
-        rst.next = 1
-        yield clk.posedge
-        rst.next = 0
+    def test_packet(payload_len, wait):
         yield clk.posedge
-        yield delay(100)
-        yield clk.posedge
-
-        for payload_len in range(1,18):
-            yield clk.posedge
-            print("test 1: test packet, length %d" % payload_len)
-            current_test.next = 1
+        print("test 1: test packet, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 1
 
-            test_frame = eth_ep.EthFrame()
-            test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame.eth_src_mac = 0x5A5152535455
-            test_frame.eth_type = 0x8000
-            test_frame.payload = bytearray(range(payload_len))
+        test_frame = eth_ep.EthFrame()
+        test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame.eth_src_mac = 0x5A5152535455
+        test_frame.eth_type = 0x8000
+        test_frame.payload = bytearray(range(payload_len))
 
-            axis_frame = test_frame.build_axis()
+        axis_frame = test_frame.build_axis()
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame)
-                yield clk.posedge
-                yield clk.posedge
-
-                yield wait()
-
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        source_queue.put(axis_frame)
+        yield clk.posedge
+        yield clk.posedge
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        yield wait()
 
-                assert rx_frame == test_frame
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-                assert sink_queue.empty()
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                yield delay(100)
+        assert rx_frame == test_frame
 
-            yield clk.posedge
-            print("test 2: back-to-back packets, length %d" % payload_len)
-            current_test.next = 2
+        assert sink_queue.empty()
 
-            test_frame1 = eth_ep.EthFrame()
-            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame1.eth_src_mac = 0x5A5152535455
-            test_frame1.eth_type = 0x8000
-            test_frame1.payload = bytearray(range(payload_len))
-            test_frame2 = eth_ep.EthFrame()
-            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame2.eth_src_mac = 0x5A5152535455
-            test_frame2.eth_type = 0x8000
-            test_frame2.payload = bytearray(range(payload_len))
+        yield delay(100)
 
-            axis_frame1 = test_frame1.build_axis()
-            axis_frame2 = test_frame2.build_axis()
+    def test_back_to_back(payload_len, wait):
+        yield clk.posedge
+        print("test 2: back-to-back packets, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 2
+
+        test_frame1 = eth_ep.EthFrame()
+        test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame1.eth_src_mac = 0x5A5152535455
+        test_frame1.eth_type = 0x8000
+        test_frame1.payload = bytearray(range(payload_len))
+        test_frame2 = eth_ep.EthFrame()
+        test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame2.eth_src_mac = 0x5A5152535455
+        test_frame2.eth_type = 0x8000
+        test_frame2.payload = bytearray(range(payload_len))
+
+        axis_frame1 = test_frame1.build_axis()
+        axis_frame2 = test_frame2.build_axis()
+
+        source_queue.put(axis_frame1)
+        source_queue.put(axis_frame2)
+        yield clk.posedge
+        yield clk.posedge
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame1)
-                source_queue.put(axis_frame2)
-                yield clk.posedge
-                yield clk.posedge
+        yield wait()
 
-                yield wait()
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        assert rx_frame == test_frame1
 
-                assert rx_frame == test_frame1
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        assert rx_frame == test_frame2
 
-                assert rx_frame == test_frame2
+        assert sink_queue.empty()
 
-                assert sink_queue.empty()
+        yield delay(100)
 
-                yield delay(100)
+    def test_tuser_assert(payload_len, wait):
+        yield clk.posedge
+        print("test 3: tuser assert, length %d, %s" % (payload_len, wait.__name__))
+        current_test.next = 3
+
+        test_frame1 = eth_ep.EthFrame()
+        test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame1.eth_src_mac = 0x5A5152535455
+        test_frame1.eth_type = 0x8000
+        test_frame1.payload = bytearray(range(payload_len))
+        test_frame2 = eth_ep.EthFrame()
+        test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame2.eth_src_mac = 0x5A5152535455
+        test_frame2.eth_type = 0x8000
+        test_frame2.payload = bytearray(range(payload_len))
+
+        axis_frame1 = test_frame1.build_axis()
+        axis_frame2 = test_frame2.build_axis()
+
+        axis_frame1.user = 1
+
+        source_queue.put(axis_frame1)
+        source_queue.put(axis_frame2)
+        yield clk.posedge
+        yield clk.posedge
 
-            yield clk.posedge
-            print("test 3: tuser assert, length %d" % payload_len)
-            current_test.next = 3
+        yield wait()
 
-            test_frame1 = eth_ep.EthFrame()
-            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame1.eth_src_mac = 0x5A5152535455
-            test_frame1.eth_type = 0x8000
-            test_frame1.payload = bytearray(range(payload_len))
-            test_frame2 = eth_ep.EthFrame()
-            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame2.eth_src_mac = 0x5A5152535455
-            test_frame2.eth_type = 0x8000
-            test_frame2.payload = bytearray(range(payload_len))
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-            axis_frame1 = test_frame1.build_axis()
-            axis_frame2 = test_frame2.build_axis()
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-            axis_frame1.user = 1
+        assert rx_frame == test_frame1
+        assert rx_frame.payload.user[-1]
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                source_queue.put(axis_frame1)
-                source_queue.put(axis_frame2)
-                yield clk.posedge
-                yield clk.posedge
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                yield wait()
+        assert rx_frame == test_frame2
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        assert sink_queue.empty()
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        yield delay(100)
 
-                assert rx_frame == test_frame1
-                assert rx_frame.payload.user[-1]
+    def test_truncated_packet(length, wait):
+        yield clk.posedge
+        print("test 4: truncated packet, length %d, %s" % (length, wait.__name__))
+        current_test.next = 4
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+        test_frame1 = eth_ep.EthFrame()
+        test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame1.eth_src_mac = 0x5A5152535455
+        test_frame1.eth_type = 0x8000
+        test_frame1.payload = bytearray(range(16))
+        test_frame2 = eth_ep.EthFrame()
+        test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+        test_frame2.eth_src_mac = 0x5A5152535455
+        test_frame2.eth_type = 0x8000
+        test_frame2.payload = bytearray(range(16))
 
-                assert rx_frame == test_frame2
+        axis_frame1 = test_frame1.build_axis()
+        axis_frame2 = test_frame2.build_axis()
 
-                assert sink_queue.empty()
+        axis_frame1.data = axis_frame1.data[:length]
 
-                yield delay(100)
+        error_header_early_termination_asserted.next = 0
 
-        for length in range(1,15):
-            yield clk.posedge
-            print("test 4: truncated packet, length %d" % length)
-            current_test.next = 4
+        source_queue.put(axis_frame1)
+        source_queue.put(axis_frame2)
+        yield clk.posedge
+        yield clk.posedge
 
-            test_frame1 = eth_ep.EthFrame()
-            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame1.eth_src_mac = 0x5A5152535455
-            test_frame1.eth_type = 0x8000
-            test_frame1.payload = bytearray(range(16))
-            test_frame2 = eth_ep.EthFrame()
-            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
-            test_frame2.eth_src_mac = 0x5A5152535455
-            test_frame2.eth_type = 0x8000
-            test_frame2.payload = bytearray(range(16))
+        yield wait()
 
-            axis_frame1 = test_frame1.build_axis()
-            axis_frame2 = test_frame2.build_axis()
+        yield clk.posedge
+        yield clk.posedge
+        yield clk.posedge
 
-            axis_frame1.data = axis_frame1.data[:length]
+        assert error_header_early_termination_asserted
 
-            for wait in wait_normal, wait_pause_source, wait_pause_sink:
-                error_header_early_termination_asserted.next = 0
+        rx_frame = None
+        if not sink_queue.empty():
+            rx_frame = sink_queue.get()
 
-                source_queue.put(axis_frame1)
-                source_queue.put(axis_frame2)
-                yield clk.posedge
-                yield clk.posedge
+        assert rx_frame == test_frame2
 
-                yield wait()
+        assert sink_queue.empty()
 
-                yield clk.posedge
-                yield clk.posedge
-                yield clk.posedge
+        yield delay(100)
 
-                assert error_header_early_termination_asserted
+    tests = {
+        1: test_packet,
+        2: test_back_to_back,
+        3: test_tuser_assert,
+        4: test_truncated_packet
+    }
 
-                rx_frame = None
-                if not sink_queue.empty():
-                    rx_frame = sink_queue.get()
+    wait_modes = {
+        'wait_normal': wait_normal,
+        'wait_pause_source': wait_pause_source,
+        'wait_pause_sink': wait_pause_sink
+    }
 
-                assert rx_frame == test_frame2
+    # one vvp process for all cases, run back to back without a reset in
+    # between like the original single sequence, so state the DUT carries
+    # from frame to frame and across wait modes is still exercised
+    session = cosim_session.CosimSession(clk, rst, [source_queue, sink_queue], reset_cases=False)
 
-                assert sink_queue.empty()
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
 
-                yield delay(100)
+        yield session.run(case_list, lambda test, length, wait: tests[test](length, wait_modes[wait]))
 
         raise StopSimulation
 
     return dut, source, sink, clkgen, monitor, check
 
 def test_bench():
-    sim = Simulation(bench())
+    sim = Simulation(bench(shard.select(cases())))
     sim.run()
 
 if __name__ == '__main__':
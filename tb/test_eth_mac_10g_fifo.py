@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -32,11 +33,16 @@ except ImportError:
     from Queue import Queue
 
 import axis_ep
+import clock_ep
 import eth_ep
+import latency
 import xgmii_ep
 
 module = 'eth_mac_10g_fifo'
 
+# frames for the sustained line rate tests
+LINE_RATE_FRAMES = 1000
+
 srcs = []
 
 srcs.append("../rtl/%s.v" % module)
@@ -100,9 +106,8 @@ def dut_eth_mac_1g(clk,
 
                    ifg_delay):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -199,6 +204,7 @@ def bench():
     axis_source_queue = Queue()
     axis_source_pause = Signal(bool(0))
     axis_sink_queue = Queue()
+    line_queue = Queue()
 
     xgmii_source = xgmii_ep.XGMIISource(rx_clk,
                                         rx_rst,
@@ -214,8 +220,8 @@ def bench():
                                     fifo=xgmii_sink_queue,
                                     name='xgmii_sink')
 
-    axis_source = axis_ep.AXIStreamSource(tx_clk,
-                                          tx_rst,
+    axis_source = axis_ep.AXIStreamSource(logic_clk,
+                                          logic_rst,
                                           tdata=tx_axis_tdata,
                                           tkeep=tx_axis_tkeep,
                                           tvalid=tx_axis_tvalid,
@@ -226,8 +232,8 @@ def bench():
                                           pause=axis_source_pause,
                                           name='axis_source')
 
-    axis_sink = axis_ep.AXIStreamSink(rx_clk,
-                                      rx_rst,
+    axis_sink = axis_ep.AXIStreamSink(logic_clk,
+                                      logic_rst,
                                       tdata=rx_axis_tdata,
                                       tkeep=rx_axis_tkeep,
                                       tvalid=rx_axis_tvalid,
@@ -237,6 +243,18 @@ def bench():
                                       fifo=axis_sink_queue,
                                       name='axis_sink')
 
+    # offers frames at the line rate of the rx link, the fastest domain;
+    # the frames have no FCS, so the overhead is the FCS the MAC adds plus
+    # preamble, SFD and IFG
+    line_source = clock_ep.LineRateSource(logic_clk,
+                                          logic_rst,
+                                          fifo=line_queue,
+                                          source_fifo=axis_source_queue,
+                                          bytes_per_cycle=8,
+                                          overhead=24,
+                                          period=8,
+                                          ppm=100)
+
     # DUT
     dut = dut_eth_mac_1g(clk,
                          rst,
@@ -280,12 +298,34 @@ def bench():
 
                          ifg_delay)
 
-    @always(delay(4))
-    def clkgen():
-        clk.next = not clk
-        tx_clk.next = not tx_clk
-        rx_clk.next = not rx_clk
-        logic_clk.next = not logic_clk
+    # worst case 802.3 offsets: rx link 100 ppm fast, tx link and logic
+    # 100 ppm slow
+    clkgen = clock_ep.ClockGen(clk, 8)
+    rx_clkgen = clock_ep.ClockGen(rx_clk, 8, ppm=100, phase=1)
+    tx_clkgen = clock_ep.ClockGen(tx_clk, 8, ppm=-100, phase=2)
+    logic_clkgen = clock_ep.ClockGen(logic_clk, 8, ppm=-100, phase=3)
+
+    rx_fifo_overflow_asserted = Signal(bool(0))
+    rx_fifo_bad_frame_asserted = Signal(bool(0))
+    rx_error_asserted = Signal(bool(0))
+    tx_fifo_overflow_asserted = Signal(bool(0))
+    tx_fifo_bad_frame_asserted = Signal(bool(0))
+
+    @always(rx_clk.posedge)
+    def monitor_rx():
+        if rx_error_bad_frame or rx_error_bad_fcs:
+            rx_error_asserted.next = 1
+        if rx_fifo_overflow:
+            rx_fifo_overflow_asserted.next = 1
+        if rx_fifo_bad_frame:
+            rx_fifo_bad_frame_asserted.next = 1
+
+    @always(logic_clk.posedge)
+    def monitor_tx():
+        if tx_fifo_overflow:
+            tx_fifo_overflow_asserted.next = 1
+        if tx_fifo_bad_frame:
+            tx_fifo_bad_frame_asserted.next = 1
 
     @instance
     def check():
@@ -397,9 +437,116 @@ def bench():
 
         yield delay(100)
 
+        yield clk.posedge
+        print("test 3: rx back to back minimum size packets at line rate")
+        current_test.next = 3
+
+        rx_fifo_overflow_asserted.next = 0
+        rx_fifo_bad_frame_asserted.next = 0
+        rx_error_asserted.next = 0
+
+        test_frames = []
+        xgmii_frames = []
+        for k in range(LINE_RATE_FRAMES):
+            test_frame = eth_ep.EthFrame()
+            test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
+            test_frame.eth_src_mac = 0x5A5152535455
+            test_frame.eth_type = 0x8000
+            test_frame.payload = bytearray((k+i) & 0xff for i in range(46))
+            test_frame.update_fcs()
+            test_frames.append(test_frame)
+
+            xgmii_frame = xgmii_ep.XGMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(test_frame.build_axis_fcs()))
+            xgmii_frames.append(xgmii_frame)
+            xgmii_source_queue.put(xgmii_frame)
+
+        rx_frames = []
+        cycles = 0
+        while len(rx_frames) < len(test_frames) and cycles < 20*LINE_RATE_FRAMES:
+            yield logic_clk.posedge
+            cycles += 1
+            while not axis_sink_queue.empty():
+                rx_frames.append(axis_sink_queue.get())
+
+        assert len(rx_frames) == len(test_frames)
+
+        for rx_frame, test_frame in zip(rx_frames, test_frames):
+            eth_frame = eth_ep.EthFrame()
+            eth_frame.parse_axis(rx_frame)
+            eth_frame.update_fcs()
+
+            assert eth_frame == test_frame
+            assert eth_frame.ts_first == rx_frame.ts_first
+            assert eth_frame.ts_last == rx_frame.ts_last
+
+        assert not rx_error_asserted
+        assert not rx_fifo_overflow_asserted
+        assert not rx_fifo_bad_frame_asserted
+
+        # RX FIFO depth used, from the first word on XGMII to the last word out
+        peak = latency.peak_in_flight(xgmii_frames, rx_frames)
+        print("rx peak %d frames (%d bytes) in flight, FIFO %d bytes" % (peak, peak*64, 8*2**RX_FIFO_ADDR_WIDTH))
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 4: tx minimum size packets at rx line rate")
+        current_test.next = 4
+
+        tx_fifo_overflow_asserted.next = 0
+        tx_fifo_bad_frame_asserted.next = 0
+
+        test_frames = []
+        axis_frames = []
+        for k in range(LINE_RATE_FRAMES):
+            test_frame = eth_ep.EthFrame()
+            test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
+            test_frame.eth_src_mac = 0x5A5152535455
+            test_frame.eth_type = 0x8000
+            test_frame.payload = bytearray((k+i) & 0xff for i in range(46))
+            test_frame.update_fcs()
+            test_frames.append(test_frame)
+
+            axis_frame = test_frame.build_axis()
+            axis_frames.append(axis_frame)
+            line_queue.put(axis_frame)
+
+        rx_frames = []
+        cycles = 0
+        while len(rx_frames) < len(test_frames) and cycles < 20*LINE_RATE_FRAMES:
+            yield tx_clk.posedge
+            cycles += 1
+            while not xgmii_sink_queue.empty():
+                rx_frames.append(xgmii_sink_queue.get())
+
+        assert len(rx_frames) == len(test_frames)
+
+        for rx_frame, test_frame in zip(rx_frames, test_frames):
+            assert rx_frame.data[0:8] == bytearray(b'\x55\x55\x55\x55\x55\x55\x55\xD5')
+
+            eth_frame = eth_ep.EthFrame()
+            eth_frame.parse_axis_fcs(rx_frame.data[8:])
+
+            assert eth_frame.eth_fcs == eth_frame.calc_fcs()
+            eth_frame.update_fcs()
+
+            assert eth_frame == test_frame
+
+        assert not tx_fifo_overflow_asserted
+        assert not tx_fifo_bad_frame_asserted
+
+        # frames are offered every 84 byte times of the rx link, which runs
+        # 200 ppm faster than the tx link, so the backlog grows by only one
+        # frame in about 5000; over LINE_RATE_FRAMES the peak is mostly the
+        # pipeline latency through the FIFO and MAC
+        peak = latency.peak_in_flight(axis_frames, rx_frames)
+        print("tx peak %d frames (%d bytes) in flight, FIFO %d bytes" % (peak, peak*64, 8*2**TX_FIFO_ADDR_WIDTH))
+
+        yield delay(100)
+
         raise StopSimulation
 
-    return dut, axis_source, axis_sink, xgmii_source, xgmii_sink, clkgen, check
+    return dut, axis_source, axis_sink, line_source, xgmii_source, xgmii_sink, clkgen, rx_clkgen, tx_clkgen, logic_clkgen, monitor_rx, monitor_tx, check
 
 def test_bench():
     sim = Simulation(bench())
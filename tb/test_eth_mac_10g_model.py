@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+# Checks the eth_mac_10g_tx reference model against hand worked XGMII
+# sequences; no DUT, so it runs without iverilog
+
+import random
+import struct
+import zlib
+
+import eth_mac_10g_model
+
+def words_to_lanes(words):
+    lanes = []
+    for txd, txc in words:
+        for j in range(8):
+            lanes.append(((txd >> j*8) & 0xff, txc >> j & 1))
+    return lanes
+
+def starts(words):
+    return [k for k, (b, c) in enumerate(words_to_lanes(words)) if c and b == 0xfb]
+
+def terms(words):
+    return [k for k, (b, c) in enumerate(words_to_lanes(words)) if c and b == 0xfd]
+
+def test_single_frame():
+    print("test 1: single frame")
+
+    data = bytearray(range(60))
+    fcs = struct.pack('<L', zlib.crc32(bytes(data)) & 0xffffffff)
+    wire = bytearray(b'\x55'*6+b'\xd5') + data + fcs
+
+    words = eth_mac_10g_model.predict([data])
+
+    # /S/ and preamble in word 0, 64 bytes of data and FCS in words 1 to 8,
+    # /T/ on lane 0 of word 9
+    assert len(words) == 10
+    assert words[0] == (0xd5555555555555fb, 0x01)
+    for k in range(1, 9):
+        assert words[k] == (struct.unpack('<Q', bytes(wire[k*8-1:k*8+7]))[0], 0x00)
+    assert words[9] == (0x07070707070707fd, 0xff)
+
+def test_padding():
+    print("test 2: padding")
+
+    data = bytearray(range(15))
+    padded = data + bytearray(45)
+    fcs = bytearray(struct.pack('<L', zlib.crc32(bytes(padded)) & 0xffffffff))
+
+    lanes = words_to_lanes(eth_mac_10g_model.predict([data]))
+    assert bytearray(b for b, c in lanes[8:72]) == padded + fcs
+    assert lanes[72] == (0xfd, 1)
+
+    lanes = words_to_lanes(eth_mac_10g_model.predict([data], enable_padding=False))
+    fcs = bytearray(struct.pack('<L', zlib.crc32(bytes(data)) & 0xffffffff))
+    assert bytearray(b for b, c in lanes[8:27]) == data + fcs
+    assert lanes[27] == (0xfd, 1)
+
+def test_back_to_back():
+    print("test 3: back to back frames")
+
+    # 61 byte frames take 73 lanes from /S/ to /T/
+    frames = [bytearray(61)]*5
+
+    # without DIC: /T/ + 11 idles, then round up to lane 0 or 4
+    words = eth_mac_10g_model.predict(frames, enable_dic=False)
+    assert starts(words) == [0, 88, 176, 264, 352]
+
+    # with DIC: IPGs of 11, 11, 11 run up a deficit of 3, the 15 lane IPG
+    # after it pays the deficit back
+    words = eth_mac_10g_model.predict(frames)
+    assert starts(words) == [0, 84, 168, 252, 340]
+
+    # 64 byte frames (72 lanes) end on a lane 0, 12 is a multiple of 4
+    words = eth_mac_10g_model.predict([bytearray(60)]*4)
+    assert starts(words) == [0, 84, 168, 252]
+
+def test_ifg_delay():
+    print("test 4: IFG delay")
+
+    frames = [bytearray(random.randrange(14, 100)) for k in range(50)]
+
+    for dic in (False, True):
+        words = eth_mac_10g_model.predict(frames, ifg_delay=20, enable_dic=dic)
+        s = starts(words)
+        t = terms(words)
+        assert len(s) == len(t) == 50
+        assert all(k % 4 == 0 for k in s)
+        if not dic:
+            assert all(b - a >= 20 for a, b in zip(t, s[1:]))
+        else:
+            assert all(b - a >= 17 for a, b in zip(t, s[1:]))
+
+def test_dic():
+    print("test 5: deficit idle count")
+
+    frames = [bytearray(random.randrange(14, 200)) for k in range(200)]
+    words = eth_mac_10g_model.predict(frames)
+    s = starts(words)
+    t = terms(words)
+
+    # replay the deficit from the IPGs alone
+    deficit = 0
+    for a, b in zip(t, s[1:]):
+        assert b % 4 == 0
+        assert b - a >= 9
+        deficit = max(0, deficit + 12 - (b - a))
+        assert deficit <= 3
+
+    # the IPG averages 12, less what is still owed
+    n = len(s) - 1
+    assert sum(b - a for a, b in zip(t, s[1:])) == 12*n - deficit
+
+def input_frame(model, data, tuser=0):
+    for k in range(0, len(data), 8):
+        beat = data[k:k+8]
+        tdata = 0
+        for j, b in enumerate(beat):
+            tdata |= b << j*8
+        model.input(tdata, (1 << len(beat)) - 1, 1, 1, k+8 >= len(data), tuser)
+
+def check(model, words):
+    errors = []
+    for txd, txc in words:
+        e = model.output(txd, txc)
+        if e is not None:
+            errors.append(e)
+    return errors
+
+def test_checker():
+    print("test 6: checker")
+
+    frames = [bytearray(random.randrange(14, 100)) for k in range(20)]
+    words = eth_mac_10g_model.predict(frames)
+
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    for f in frames:
+        input_frame(model, f)
+    assert check(model, [(0x0707070707070707, 0xff)]*3 + words) == []
+    assert not model.expected
+
+    # start on lane 2
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    input_frame(model, frames[0])
+    w = eth_mac_10g_model.predict(frames[:1])
+    w = [((txd << 16 | 0x0707) & 0xffffffffffffffff, (txc << 2 | 3) & 0xff) for txd, txc in w]
+    assert any("start on lane 2" in e for e in check(model, w))
+
+    # IPG too short: 61 byte frames, both starts on lane 0, 7 lane IPG
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    input_frame(model, bytearray(61))
+    input_frame(model, bytearray(61))
+    lanes = words_to_lanes(eth_mac_10g_model.predict([bytearray(61)]))
+    lanes = lanes[:74] + [(0x07, 1)]*6 + lanes[:74]
+    w = eth_mac_10g_model.lanes_to_words(lanes)
+    assert any("IPG of 7" in e for e in check(model, w))
+
+    # an 11 lane IPG is too short without DIC, with DIC it is fine
+    for dic in (False, True):
+        model = eth_mac_10g_model.EthMac10GTxModel(enable_dic=dic)
+        input_frame(model, bytearray(61))
+        input_frame(model, bytearray(61))
+        lanes = words_to_lanes(eth_mac_10g_model.predict([bytearray(61)]))
+        lanes = lanes[:74] + [(0x07, 1)]*10 + lanes[:74]
+        errors = check(model, eth_mac_10g_model.lanes_to_words(lanes))
+        if dic:
+            assert errors == []
+        else:
+            assert errors == ["lane 4: IPG of 11, 12 allowed"]
+
+    # corrupted data
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    input_frame(model, frames[0])
+    w = eth_mac_10g_model.predict(frames[:1])
+    w[2] = (w[2][0] ^ 0x100, w[2][1])
+    assert any("frame data differs" in e for e in check(model, w))
+
+    # aborted frame sent without /E/, and sent with it
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    input_frame(model, frames[0], tuser=1)
+    assert any("without /E/" in e for e in check(model, eth_mac_10g_model.predict(frames[:1])))
+
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    input_frame(model, frames[0], tuser=1)
+    assert check(model, [(0xd5555555555555fb, 0x01), (0x07070707fdfefefe, 0xff)]) == []
+
+    # frame the input never sent
+    model = eth_mac_10g_model.EthMac10GTxModel()
+    assert any("not sent" in e for e in check(model, eth_mac_10g_model.predict(frames[:1])))
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_single_frame()
+    test_padding()
+    test_back_to_back()
+    test_ifg_delay()
+    test_dic()
+    test_checker()
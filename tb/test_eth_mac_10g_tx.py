@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -34,6 +35,7 @@ except ImportError:
 import axis_ep
 import eth_ep
 import xgmii_ep
+import eth_mac_10g_model
 
 module = 'eth_mac_10g_tx'
 
@@ -70,9 +72,8 @@ def dut_eth_mac_10g_tx(clk,
 
                        ifg_delay):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -93,6 +94,7 @@ def bench():
 
     # Parameters
     ENABLE_PADDING = 1
+    ENABLE_DIC = 1
     MIN_FRAME_LENGTH = 64
 
     # Inputs
@@ -136,6 +138,23 @@ def bench():
                               fifo=sink_queue,
                               name='sink')
 
+    # reference model
+    model = eth_mac_10g_model.EthMac10GTxModel(ENABLE_PADDING, ENABLE_DIC, MIN_FRAME_LENGTH)
+
+    model_check = eth_mac_10g_model.EthMac10GTxChecker(clk,
+                                                       rst,
+                                                       model,
+                                                       input_axis_tdata,
+                                                       input_axis_tkeep,
+                                                       input_axis_tvalid,
+                                                       input_axis_tready,
+                                                       input_axis_tlast,
+                                                       input_axis_tuser,
+                                                       xgmii_txd,
+                                                       xgmii_txc,
+                                                       ifg_delay,
+                                                       name='model')
+
     # DUT
     dut = dut_eth_mac_10g_tx(clk,
                              rst,
@@ -217,6 +236,7 @@ def bench():
             assert eth_frame.payload.data.index(test_frame.payload.data) == 0
 
             assert sink_queue.empty()
+            assert model.mismatch is None
 
             yield delay(100)
 
@@ -291,6 +311,7 @@ def bench():
             assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
 
             assert sink_queue.empty()
+            assert model.mismatch is None
 
             yield delay(100)
 
@@ -357,6 +378,7 @@ def bench():
             assert eth_frame.payload.data.index(test_frame2.payload.data) == 0
 
             assert sink_queue.empty()
+            assert model.mismatch is None
 
             yield delay(100)
 
@@ -365,6 +387,8 @@ def bench():
             print("test 4: test stream, length %d" % payload_len)
             current_test.next = 4
 
+            model.reset_stats()
+
             for i in range(10):
                 test_frame = eth_ep.EthFrame()
                 test_frame.eth_dest_mac = 0xDAD1D2D3D4D5
@@ -387,11 +411,19 @@ def bench():
             yield clk.posedge
             yield clk.posedge
 
+            assert model.mismatch is None
+
+            # within a few lanes of ideal at the end of the stream
+            utilization = model.utilization()
+            ideal = eth_mac_10g_model.ideal_utilization([payload_len+14]*10, 12)
+            print("line utilization %.4f (ideal %.4f)" % (utilization, ideal))
+            assert utilization > ideal*0.98
+
             yield delay(100)
 
         raise StopSimulation
 
-    return dut, source, sink, clkgen, check
+    return dut, source, sink, model_check, clkgen, check
 
 def test_bench():
     sim = Simulation(bench())
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -63,9 +64,8 @@ def dut_eth_mac_1g_rx(clk,
                       error_bad_frame,
                       error_bad_fcs):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -106,6 +106,7 @@ def bench():
 
     # sources and sinks
     source_queue = Queue()
+    source_ifg = Signal(intbv(12)[8:])
     sink_queue = Queue()
 
     source = gmii_ep.GMIISource(clk,
@@ -114,6 +115,8 @@ def bench():
                                 tx_en=gmii_rx_dv,
                                 tx_er=gmii_rx_er,
                                 fifo=source_queue,
+                                ifg=source_ifg,
+                                preamble=True,
                                 name='source')
 
     sink = axis_ep.AXIStreamSink(clk,
@@ -182,7 +185,7 @@ def bench():
             test_frame.update_fcs()
 
             axis_frame = test_frame.build_axis_fcs()
-            gmii_frame = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame))
+            gmii_frame = gmii_ep.GMIIFrame(bytearray(axis_frame))
 
             source_queue.put(gmii_frame)
             yield clk.posedge
@@ -228,8 +231,8 @@ def bench():
 
             axis_frame1 = test_frame1.build_axis_fcs()
             axis_frame2 = test_frame2.build_axis_fcs()
-            gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            gmii_frame1 = gmii_ep.GMIIFrame(bytearray(axis_frame1))
+            gmii_frame2 = gmii_ep.GMIIFrame(bytearray(axis_frame2))
 
             source_queue.put(gmii_frame1)
             source_queue.put(gmii_frame2)
@@ -297,8 +300,8 @@ def bench():
             error_bad_frame_asserted.next = 0
             error_bad_fcs_asserted.next = 0
 
-            gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            gmii_frame1 = gmii_ep.GMIIFrame(bytearray(axis_frame1))
+            gmii_frame2 = gmii_ep.GMIIFrame(bytearray(axis_frame2))
 
             source_queue.put(gmii_frame1)
             source_queue.put(gmii_frame2)
@@ -363,8 +366,8 @@ def bench():
             error_bad_frame_asserted.next = 0
             error_bad_fcs_asserted.next = 0
 
-            gmii_frame1 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame1))
-            gmii_frame2 = gmii_ep.GMIIFrame(b'\x55\x55\x55\x55\x55\x55\x55\xD5'+bytearray(axis_frame2))
+            gmii_frame1 = gmii_ep.GMIIFrame(bytearray(axis_frame1))
+            gmii_frame2 = gmii_ep.GMIIFrame(bytearray(axis_frame2))
 
             gmii_frame1.error = 1
 
@@ -408,6 +411,81 @@ def bench():
 
             yield delay(100)
 
+        for ifg in range(1,12):
+            yield clk.posedge
+            print("test 5: back-to-back packets, undersized IFG %d" % ifg)
+            current_test.next = 5
+
+            source_ifg.next = ifg
+
+            test_frame1 = eth_ep.EthFrame()
+            test_frame1.eth_dest_mac = 0xDAD1D2D3D4D5
+            test_frame1.eth_src_mac = 0x5A5152535455
+            test_frame1.eth_type = 0x8000
+            test_frame1.payload = bytearray(range(46))
+            test_frame1.update_fcs()
+            test_frame2 = eth_ep.EthFrame()
+            test_frame2.eth_dest_mac = 0xDAD1D2D3D4D5
+            test_frame2.eth_src_mac = 0x5A5152535455
+            test_frame2.eth_type = 0x8000
+            test_frame2.payload = bytearray(range(1,47))
+            test_frame2.update_fcs()
+
+            axis_frame1 = test_frame1.build_axis_fcs()
+            axis_frame2 = test_frame2.build_axis_fcs()
+
+            error_bad_frame_asserted.next = 0
+            error_bad_fcs_asserted.next = 0
+
+            gmii_frame1 = gmii_ep.GMIIFrame(bytearray(axis_frame1))
+            gmii_frame2 = gmii_ep.GMIIFrame(bytearray(axis_frame2))
+
+            source_queue.put(gmii_frame1)
+            source_queue.put(gmii_frame2)
+            yield clk.posedge
+            yield clk.posedge
+
+            while gmii_rx_dv or output_axis_tvalid or not source_queue.empty():
+                yield clk.posedge
+
+            yield clk.posedge
+
+            while gmii_rx_dv or output_axis_tvalid or not source_queue.empty():
+                yield clk.posedge
+
+            yield clk.posedge
+            yield clk.posedge
+            yield clk.posedge
+
+            assert not error_bad_frame_asserted
+            assert not error_bad_fcs_asserted
+
+            rx_frame = None
+            if not sink_queue.empty():
+                rx_frame = sink_queue.get()
+
+            eth_frame = eth_ep.EthFrame()
+            eth_frame.parse_axis(rx_frame)
+            eth_frame.update_fcs()
+
+            assert eth_frame == test_frame1
+
+            rx_frame = None
+            if not sink_queue.empty():
+                rx_frame = sink_queue.get()
+
+            eth_frame = eth_ep.EthFrame()
+            eth_frame.parse_axis(rx_frame)
+            eth_frame.update_fcs()
+
+            assert eth_frame == test_frame2
+
+            assert sink_queue.empty()
+
+            yield delay(100)
+
+        source_ifg.next = 12
+
         raise StopSimulation
 
     return dut, monitor, source, sink, clkgen, check
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+# Endpoint loopback test of sink capture; no DUT, so it runs without iverilog
+
+from myhdl import *
+import os
+import tempfile
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import axis_ep
+import pcap_ep
+
+def bench(capture):
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    axis_tdata = Signal(intbv(0)[64:])
+    axis_tkeep = Signal(intbv(0)[8:])
+    axis_tvalid = Signal(bool(0))
+    axis_tready = Signal(bool(0))
+    axis_tlast = Signal(bool(0))
+    axis_tuser = Signal(bool(0))
+
+    # sources and sinks
+    source_queue = Queue()
+    sink_queue = Queue()
+
+    source = axis_ep.AXIStreamSource(clk,
+                                     rst,
+                                     tdata=axis_tdata,
+                                     tkeep=axis_tkeep,
+                                     tvalid=axis_tvalid,
+                                     tready=axis_tready,
+                                     tlast=axis_tlast,
+                                     tuser=axis_tuser,
+                                     fifo=source_queue,
+                                     name='source')
+
+    sink = axis_ep.AXIStreamSink(clk,
+                                 rst,
+                                 tdata=axis_tdata,
+                                 tkeep=axis_tkeep,
+                                 tvalid=axis_tvalid,
+                                 tready=axis_tready,
+                                 tlast=axis_tlast,
+                                 tuser=axis_tuser,
+                                 fifo=sink_queue,
+                                 name='sink',
+                                 capture=capture)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 1: capture 64 bit stream")
+        current_test.next = 1
+
+        test_frames = []
+        for k in range(1, 20):
+            test_frame = axis_ep.AXIStreamFrame(bytearray(range(k)))
+            test_frames.append(test_frame)
+            source_queue.put(test_frame)
+
+        rx_frames = []
+        while len(rx_frames) < len(test_frames):
+            yield clk.posedge
+            while not sink_queue.empty():
+                rx_frames.append(sink_queue.get())
+
+        assert rx_frames == test_frames
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_bench():
+    for ext in ('.pcap', '.pcapng'):
+        fd, file = tempfile.mkstemp(suffix=ext)
+        os.close(fd)
+        try:
+            with pcap_ep.PcapWriter(file) as capture:
+                sim = Simulation(bench(capture))
+                sim.run()
+
+            records = list(pcap_ep.PcapReader(file))
+            assert [bytearray(r[2]) for r in records] == [bytearray(range(k)) for k in range(1, 20)]
+            assert all(r[1] == 0 for r in records)
+            assert all(a[0] < b[0] for a, b in zip(records, records[1:]))
+        finally:
+            os.remove(file)
+
+def test_capture_lanes():
+    print("test 2: capture rejects streams without 8 bit lanes")
+
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    tdata = [Signal(intbv(0)[8:]) for i in range(4)]
+
+    capture = pcap_ep.PcapWriter(tempfile.TemporaryFile())
+
+    try:
+        axis_ep.AXIStreamSink(clk, rst, tdata=tdata, capture=capture)
+    except Exception as e:
+        assert "8 bit lanes" in str(e)
+    else:
+        assert False, "capture of a multiple tdata stream was accepted"
+
+    try:
+        axis_ep.AXIStreamSink(clk, rst, tdata=Signal(intbv(0)[16:]), tkeep=Signal(bool(1)), capture=capture)
+    except Exception as e:
+        assert "8 bit lanes" in str(e)
+    else:
+        assert False, "capture of a 16 bit lane stream was accepted"
+
+    capture.close()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_bench()
+    test_capture_lanes()
@@ -25,6 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
+import iverilog_build
 
 try:
     from queue import Queue
@@ -35,6 +36,7 @@ import eth_ep
 import arp_ep
 import ip_ep
 import udp_ep
+import udp_complete_model
 
 module = 'udp_complete_64'
 
@@ -200,9 +202,8 @@ def dut_udp_complete(clk,
                      subnet_mask,
                      clear_arp_cache):
 
-    if os.system(build_cmd):
-        raise Exception("Error running build command")
-    return Cosimulation("vvp -m myhdl test_%s.vvp -lxt2" % module,
+    iverilog_build.build(build_cmd, srcs)
+    return Cosimulation(iverilog_build.vvp_cmd("test_%s.vvp" % module),
                 clk=clk,
                 rst=rst,
                 current_test=current_test,
@@ -473,18 +474,33 @@ def bench():
     subnet_mask = Signal(intbv(0)[32:])
     clear_arp_cache = Signal(bool(0))
 
+    # transaction level model with the same parameters as the DUT, run
+    # beside it; the queues copy what goes into the sources to the model
+    # and what comes out of the sinks to the scoreboards
+    model = udp_complete_model.UDPCompleteModel(udp_checksum_enable=False,
+                                                arp_cache_addr_width=2,
+                                                arp_request_retry_count=4,
+                                                arp_request_retry_interval=150,
+                                                arp_request_timeout=400)
+    model_eth_queue = Queue()
+    model_ip_queue = Queue()
+    model_udp_queue = Queue()
+    eth_scoreboard = udp_complete_model.Scoreboard('eth')
+    ip_scoreboard = udp_complete_model.Scoreboard('ip')
+    udp_scoreboard = udp_complete_model.Scoreboard('udp')
+
     # sources and sinks
-    eth_source_queue = Queue()
+    eth_source_queue = udp_complete_model.TapQueue(model_eth_queue.put)
     eth_source_pause = Signal(bool(0))
-    eth_sink_queue = Queue()
+    eth_sink_queue = udp_complete_model.TapQueue(eth_scoreboard.add_dut)
     eth_sink_pause = Signal(bool(0))
-    ip_source_queue = Queue()
+    ip_source_queue = udp_complete_model.TapQueue(model_ip_queue.put)
     ip_source_pause = Signal(bool(0))
-    ip_sink_queue = Queue()
+    ip_sink_queue = udp_complete_model.TapQueue(ip_scoreboard.add_dut)
     ip_sink_pause = Signal(bool(0))
-    udp_source_queue = Queue()
+    udp_source_queue = udp_complete_model.TapQueue(model_udp_queue.put)
     udp_source_pause = Signal(bool(0))
-    udp_sink_queue = Queue()
+    udp_sink_queue = udp_complete_model.TapQueue(udp_scoreboard.add_dut)
     udp_sink_pause = Signal(bool(0))
 
     eth_source = eth_ep.EthFrameSource(clk,
@@ -766,6 +782,21 @@ def bench():
                            subnet_mask,
                            clear_arp_cache)
 
+    model_tlm = udp_complete_model.IPCompleteTLM(clk,
+                                                 rst,
+                                                 model,
+                                                 input_eth_queue=model_eth_queue,
+                                                 output_eth_queue=udp_complete_model.TapQueue(eth_scoreboard.add_model),
+                                                 input_ip_queue=model_ip_queue,
+                                                 output_ip_queue=udp_complete_model.TapQueue(ip_scoreboard.add_model),
+                                                 input_udp_queue=model_udp_queue,
+                                                 output_udp_queue=udp_complete_model.TapQueue(udp_scoreboard.add_model),
+                                                 local_mac=local_mac,
+                                                 local_ip=local_ip,
+                                                 gateway_ip=gateway_ip,
+                                                 subnet_mask=subnet_mask,
+                                                 clear_arp_cache=clear_arp_cache)
+
     @always(delay(4))
     def clkgen():
         clk.next = not clk
@@ -1128,9 +1159,17 @@ def bench():
 
         yield delay(100)
 
+        # the model must have produced the same frames as the DUT; check()
+        # fails on any frame left unmatched on either side, so the counts
+        # agree and only need to show each stream carried traffic
+        assert eth_scoreboard.check() > 0
+        assert ip_scoreboard.check() > 0
+        assert udp_scoreboard.check() > 0
+        assert model.errors['ip_tx_error_arp_failed'] > 0
+
         raise StopSimulation
 
-    return dut, eth_source, eth_sink, ip_source, ip_sink, udp_source, udp_sink, clkgen, monitor, check
+    return dut, eth_source, eth_sink, ip_source, ip_sink, udp_source, udp_sink, model_tlm, clkgen, monitor, check
 
 def test_bench():
     sim = Simulation(bench())
@@ -0,0 +1,477 @@
+"""
+
+Copyright (c) 2014-2017 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+# Transaction level models of ip_complete and udp_complete.  Frames are the
+# eth_ep/ip_ep/udp_ep/arp_ep frame objects carried by the endpoint queues;
+# time is counted in clock cycles and only matters for ARP retries and
+# timeouts, so results match the RTL frame for frame but not cycle for cycle.
+
+from myhdl import *
+from collections import deque
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import arp_ep
+import ip_ep
+import udp_ep
+
+ARP_OPER_ARP_REQUEST = 1
+ARP_OPER_ARP_REPLY = 2
+ARP_OPER_INARP_REQUEST = 8
+ARP_OPER_INARP_REPLY = 9
+
+BROADCAST_MAC = 0xffffffffffff
+
+ip_errors = ('ip_rx_error_header_early_termination', 'ip_rx_error_payload_early_termination',
+    'ip_rx_error_invalid_header', 'ip_rx_error_invalid_checksum',
+    'ip_tx_error_payload_early_termination', 'ip_tx_error_arp_failed')
+
+udp_errors = ('udp_rx_error_header_early_termination', 'udp_rx_error_payload_early_termination',
+    'udp_tx_error_payload_early_termination')
+
+class ARPCache(object):
+    # arp_cache: 2**addr_width entries, a hit sets the entry LRU bit, new
+    # entries go to the next slot with a clear LRU bit, and the bits are
+    # cleared when all are set.  Cleared entries are IP 0, MAC 0.
+    def __init__(self, addr_width=2):
+        self.size = 2**addr_width
+        self.clear()
+
+    def clear(self):
+        self.ip = [0]*self.size
+        self.mac = [0]*self.size
+        self.lru = [False]*self.size
+        self.write_ptr = 0
+
+    def query(self, ip):
+        for i in range(self.size):
+            if self.ip[i] == ip:
+                self.lru[i] = True
+                mac = self.mac[i]
+                if all(self.lru):
+                    self.lru = [False]*self.size
+                return mac
+        return None
+
+    def write(self, ip, mac):
+        for i in range(self.size):
+            if self.ip[i] == ip:
+                self.mac[i] = mac
+                return
+        while self.lru[self.write_ptr]:
+            self.write_ptr = (self.write_ptr + 1) % self.size
+        self.ip[self.write_ptr] = ip
+        self.mac[self.write_ptr] = mac
+        self.write_ptr = (self.write_ptr + 1) % self.size
+
+class IPCompleteModel(object):
+    # ip_complete: eth_type demux to IP and ARP, ARP responder and cache,
+    # and IP transmit through ARP lookups.  Frames leave through the
+    # eth_tx and ip_rx deques; errors are counted under the RTL status
+    # output names.  Transmit is in order, so a frame waiting for ARP holds
+    # up the ones behind it, while ARP replies are sent right away.
+    def __init__(self,
+                 local_mac=0,
+                 local_ip=0,
+                 gateway_ip=0,
+                 subnet_mask=0,
+                 arp_cache_addr_width=2,
+                 arp_request_retry_count=4,
+                 arp_request_retry_interval=125000000*2,
+                 arp_request_timeout=125000000*30):
+
+        self.local_mac = local_mac
+        self.local_ip = local_ip
+        self.gateway_ip = gateway_ip
+        self.subnet_mask = subnet_mask
+        self.arp_request_retry_count = arp_request_retry_count
+        self.arp_request_retry_interval = arp_request_retry_interval
+        self.arp_request_timeout = arp_request_timeout
+
+        self.cache = ARPCache(arp_cache_addr_width)
+        self.eth_tx = deque()
+        self.ip_rx = deque()
+        self.tx_queue = deque()
+        self.errors = dict.fromkeys(self.error_names, 0)
+        self.reset()
+
+    error_names = ip_errors
+
+    def reset(self):
+        self.time = 0
+        self.cache.clear()
+        self.eth_tx.clear()
+        self.ip_rx.clear()
+        self.tx_queue.clear()
+        self.arp_ip = None
+        self.arp_retry_cnt = 0
+        self.arp_deadline = None
+        for k in self.errors:
+            self.errors[k] = 0
+
+    # network side
+
+    def receive(self, frame):
+        if frame.eth_type == 0x0800:
+            self.receive_ip(frame)
+        elif frame.eth_type == 0x0806:
+            self.receive_arp(frame)
+        self.service()
+
+    def receive_ip(self, frame):
+        length = frame.payload.get_length()
+        if length < ip_ep.ip_hdr.size:
+            self.errors['ip_rx_error_header_early_termination'] += 1
+            return
+
+        ip_frame = ip_ep.IPFrame()
+        ip_frame.parse_eth(frame)
+
+        if ip_frame.ip_version != 4 or ip_frame.ip_ihl != 5:
+            self.errors['ip_rx_error_invalid_header'] += 1
+            return
+        if ip_frame.ip_header_checksum != ip_frame.calc_checksum():
+            self.errors['ip_rx_error_invalid_checksum'] += 1
+            return
+
+        n = ip_frame.ip_length - ip_ep.ip_hdr.size
+        if length - ip_ep.ip_hdr.size < n:
+            self.errors['ip_rx_error_payload_early_termination'] += 1
+            return
+        # drop Ethernet padding
+        ip_frame.payload = ip_frame.payload.get_slice(0, n)
+
+        self.deliver_ip(ip_frame)
+
+    def deliver_ip(self, frame):
+        self.ip_rx.append(frame)
+
+    def receive_arp(self, frame):
+        if frame.payload.get_length() < arp_ep.arp_hdr.size:
+            return
+
+        arp_frame = arp_ep.ARPFrame()
+        arp_frame.parse_eth(frame)
+
+        if arp_frame.arp_htype != 1 or arp_frame.arp_ptype != 0x0800:
+            return
+        if arp_frame.arp_hlen != 6 or arp_frame.arp_plen != 4:
+            return
+
+        self.cache.write(arp_frame.arp_spa, arp_frame.arp_sha)
+
+        if arp_frame.arp_oper == ARP_OPER_ARP_REQUEST:
+            if arp_frame.arp_tpa == self.local_ip:
+                self.send_arp(arp_frame.eth_src_mac, ARP_OPER_ARP_REPLY, arp_frame.arp_sha, arp_frame.arp_spa)
+        elif arp_frame.arp_oper == ARP_OPER_INARP_REQUEST:
+            if arp_frame.arp_tha == self.local_mac:
+                self.send_arp(arp_frame.eth_src_mac, ARP_OPER_INARP_REPLY, arp_frame.arp_sha, arp_frame.arp_spa)
+
+    def send_arp(self, dest_mac, oper, tha, tpa):
+        frame = arp_ep.ARPFrame(
+            eth_dest_mac=dest_mac,
+            eth_src_mac=self.local_mac,
+            eth_type=0x0806,
+            arp_oper=oper,
+            arp_sha=self.local_mac,
+            arp_spa=self.local_ip,
+            arp_tha=tha,
+            arp_tpa=tpa)
+        self.eth_tx.append(frame.build_eth())
+
+    # host side
+
+    def send(self, frame):
+        # frame: IPFrame, the eth_dest_mac and eth_src_mac fields are ignored
+        self.tx_queue.append(frame)
+        self.service()
+
+    def clear_arp_cache(self):
+        self.cache.clear()
+
+    def advance(self, cycles=1):
+        self.run_until(self.time + cycles)
+
+    def next_event(self):
+        # time of the next ARP retry or timeout, None if nothing is pending
+        return self.arp_deadline
+
+    def run_until(self, time):
+        while self.arp_deadline is not None and self.arp_deadline <= time:
+            self.time = self.arp_deadline
+            self.arp_timer_expired()
+            self.service()
+        self.time = max(self.time, time)
+
+    def lookup_ip(self, ip):
+        # returns the IP to resolve, None for broadcast
+        if ~(ip | self.subnet_mask) & 0xffffffff == 0:
+            return None
+        if (ip ^ self.gateway_ip) & self.subnet_mask == 0:
+            return ip
+        return self.gateway_ip
+
+    def service(self):
+        # transmit from the head of the queue until it blocks on ARP
+        while self.tx_queue:
+            frame = self.tx_queue[0]
+            ip = self.lookup_ip(frame.ip_dest_ip)
+            if ip is None:
+                mac = BROADCAST_MAC
+            else:
+                mac = self.cache.query(ip)
+                if mac is None:
+                    if self.arp_ip is None:
+                        self.start_arp_request(ip)
+                    return
+            self.arp_ip = None
+            self.arp_deadline = None
+            self.tx_queue.popleft()
+            self.transmit_ip(frame, mac)
+
+    def start_arp_request(self, ip):
+        self.arp_ip = ip
+        self.send_arp(BROADCAST_MAC, ARP_OPER_ARP_REQUEST, 0, ip)
+        self.arp_retry_cnt = self.arp_request_retry_count - 1
+        # the timer counts down to zero, then acts on the next cycle
+        self.arp_deadline = self.time + self.arp_request_retry_interval + 1
+
+    def arp_timer_expired(self):
+        if self.arp_retry_cnt > 0:
+            self.send_arp(BROADCAST_MAC, ARP_OPER_ARP_REQUEST, 0, self.arp_ip)
+            if self.arp_retry_cnt > 1:
+                self.arp_deadline = self.time + self.arp_request_retry_interval + 1
+            else:
+                self.arp_deadline = self.time + self.arp_request_timeout + 1
+            self.arp_retry_cnt -= 1
+        else:
+            # give up, drop the frame waiting for this lookup
+            self.arp_ip = None
+            self.arp_deadline = None
+            self.tx_queue.popleft()
+            self.errors['ip_tx_error_arp_failed'] += 1
+
+    def transmit_ip(self, frame, mac):
+        tx = ip_ep.IPFrame(frame)
+        if tx.ip_length is None:
+            tx.update_length()
+        n = tx.ip_length - ip_ep.ip_hdr.size
+        if frame.payload.get_length() < n:
+            self.errors['ip_tx_error_payload_early_termination'] += 1
+            return
+
+        tx.payload = frame.payload.get_slice(0, n)
+        tx.eth_dest_mac = mac
+        tx.eth_src_mac = self.local_mac
+        tx.eth_type = 0x0800
+        tx.ip_version = 4
+        tx.ip_ihl = 5
+        tx.ip_identification = 0
+        tx.ip_flags = 0b010
+        tx.ip_fragment_offset = 0
+        tx.update_checksum()
+        self.eth_tx.append(tx.build_eth())
+
+class UDPCompleteModel(IPCompleteModel):
+    # udp_complete: ip_complete with UDP (protocol 0x11) split off to
+    # udp_rx on receive, and UDP frames arbitrated into the IP transmit
+    # path in arrival order
+    def __init__(self, udp_checksum_enable=True, **kwargs):
+        self.udp_checksum_enable = udp_checksum_enable
+        self.udp_rx = deque()
+        super(UDPCompleteModel, self).__init__(**kwargs)
+
+    error_names = ip_errors + udp_errors
+
+    def reset(self):
+        super(UDPCompleteModel, self).reset()
+        self.udp_rx.clear()
+
+    def deliver_ip(self, frame):
+        if frame.ip_protocol != 0x11:
+            self.ip_rx.append(frame)
+            return
+
+        length = frame.payload.get_length()
+        if length < udp_ep.udp_hdr.size:
+            self.errors['udp_rx_error_header_early_termination'] += 1
+            return
+
+        udp_frame = udp_ep.UDPFrame()
+        udp_frame.parse_ip(frame)
+
+        n = udp_frame.udp_length - udp_ep.udp_hdr.size
+        if length - udp_ep.udp_hdr.size < n:
+            self.errors['udp_rx_error_payload_early_termination'] += 1
+            return
+        udp_frame.payload = udp_frame.payload.get_slice(0, n)
+
+        self.udp_rx.append(udp_frame)
+
+    def send_udp(self, frame):
+        # frame: UDPFrame; with the checksum enabled, udp_length and
+        # udp_checksum are computed, otherwise they are used as given
+        tx = udp_ep.UDPFrame(frame)
+        tx.ip_protocol = 0x11
+        if self.udp_checksum_enable:
+            tx.update_udp_length()
+            tx.update_udp_checksum()
+        else:
+            if tx.udp_length is None:
+                tx.update_udp_length()
+            n = tx.udp_length - udp_ep.udp_hdr.size
+            if tx.payload.get_length() < n:
+                self.errors['udp_tx_error_payload_early_termination'] += 1
+                return
+            tx.payload = tx.payload.get_slice(0, n)
+        tx.update_ip_length()
+        tx.ip_header_checksum = 0
+
+        ip_frame = tx.build_ip()
+        self.send(ip_frame)
+
+def IPCompleteTLM(clk, rst,
+                  model,
+                  input_eth_queue,
+                  output_eth_queue,
+                  input_ip_queue,
+                  output_ip_queue,
+                  input_udp_queue=None,
+                  output_udp_queue=None,
+                  local_mac=None,
+                  local_ip=None,
+                  gateway_ip=None,
+                  subnet_mask=None,
+                  clear_arp_cache=None,
+                  name=None):
+
+    # Stands in for ip_complete_64/udp_complete_64 and the source and sink
+    # endpoints around it: frames put in the input queues come out of the
+    # output queues as the sinks would collect them, with one model time
+    # step per clock cycle.  The UDP queues need a UDPCompleteModel.  The
+    # address signals default to the model settings.
+
+    if local_mac is None:
+        local_mac = Signal(intbv(model.local_mac)[48:])
+    if local_ip is None:
+        local_ip = Signal(intbv(model.local_ip)[32:])
+    if gateway_ip is None:
+        gateway_ip = Signal(intbv(model.gateway_ip)[32:])
+    if subnet_mask is None:
+        subnet_mask = Signal(intbv(model.subnet_mask)[32:])
+    if clear_arp_cache is None:
+        clear_arp_cache = Signal(bool(0))
+
+    inputs = [(input_eth_queue, model.receive), (input_ip_queue, model.send)]
+    outputs = [(model.eth_tx, output_eth_queue), (model.ip_rx, output_ip_queue)]
+
+    if input_udp_queue is not None:
+        inputs.append((input_udp_queue, model.send_udp))
+    if output_udp_queue is not None:
+        outputs.append((model.udp_rx, output_udp_queue))
+
+    @instance
+    def logic():
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                model.reset()
+                continue
+
+            model.local_mac = int(local_mac)
+            model.local_ip = int(local_ip)
+            model.gateway_ip = int(gateway_ip)
+            model.subnet_mask = int(subnet_mask)
+
+            if clear_arp_cache:
+                model.clear_arp_cache()
+
+            model.advance(1)
+
+            for q, func in inputs:
+                while not q.empty():
+                    func(q.get(False))
+
+            for d, q in outputs:
+                while d:
+                    frame = d.popleft()
+                    q.put(frame)
+                    if name is not None:
+                        print("[%s] Got frame %s" % (name, repr(frame)))
+
+    return logic
+
+class TapQueue(Queue):
+    # Queue that also passes every frame put in it to func, so stimulus
+    # and results can be copied to a model without touching the test code
+    # that uses the queue
+    def __init__(self, func, maxsize=0):
+        Queue.__init__(self, maxsize)
+        self.func = func
+
+    def put(self, item, block=True, timeout=None):
+        Queue.put(self, item, block, timeout)
+        self.func(item)
+
+class Scoreboard(object):
+    # Matches frames from the DUT against frames from the model in order.
+    # Either side may run ahead; a mismatch fails as soon as both frames
+    # are in, and check() fails on anything left unmatched at the end.
+    def __init__(self, name=None):
+        self.name = name
+        self.dut_frames = deque()
+        self.model_frames = deque()
+        self.matched = 0
+
+    def reset(self):
+        self.dut_frames.clear()
+        self.model_frames.clear()
+        self.matched = 0
+
+    def add_dut(self, frame):
+        self.dut_frames.append(frame)
+        self.match()
+
+    def add_model(self, frame):
+        self.model_frames.append(frame)
+        self.match()
+
+    def match(self):
+        while self.dut_frames and self.model_frames:
+            dut_frame = self.dut_frames.popleft()
+            model_frame = self.model_frames.popleft()
+            if dut_frame != model_frame:
+                raise AssertionError("[%s] frame %d mismatch\n  DUT:   %s\n  model: %s" %
+                    (self.name, self.matched, repr(dut_frame), repr(model_frame)))
+            self.matched += 1
+
+    def check(self):
+        if self.dut_frames or self.model_frames:
+            raise AssertionError("[%s] %d DUT and %d model frames unmatched after %d" %
+                (self.name, len(self.dut_frames), len(self.model_frames), self.matched))
+        return self.matched
@@ -33,7 +33,40 @@ try:
 except ImportError:
     from Queue import Queue
 
+# source port, dest port, length, checksum
+udp_hdr = struct.Struct('>HHHH')
+
+# source IP, dest IP, zero, protocol, UDP length
+udp_pseudo_hdr = struct.Struct('>LLBBH')
+
+def pack_udp_hdr(buf, offset, f):
+    udp_hdr.pack_into(buf, offset,
+        f.udp_source_port,
+        f.udp_dest_port,
+        f.udp_length,
+        f.udp_checksum)
+
+def unpack_udp_hdr(buf, offset, f):
+    (f.udp_source_port, f.udp_dest_port,
+        f.udp_length, f.udp_checksum) = udp_hdr.unpack_from(buf, offset)
+
+def calc_udp_checksum(f):
+    n = udp_pseudo_hdr.size
+    data = bytearray(n + udp_hdr.size)
+    udp_pseudo_hdr.pack_into(data, 0, f.ip_source_ip, f.ip_dest_ip, 0, f.ip_protocol, f.udp_length)
+    udp_hdr.pack_into(data, n, f.udp_source_port, f.udp_dest_port, f.udp_length, 0)
+    cksum = ip_ep.Checksum(data)
+    cksum.update_frame(f.payload)
+    return cksum.checksum()
+
 class UDPFrame(object):
+    __slots__ = ('_payload', 'eth_dest_mac', 'eth_src_mac', 'eth_type',
+        'ip_version', 'ip_ihl', 'ip_dscp', 'ip_ecn', 'ip_length', 'ip_identification',
+        'ip_flags', 'ip_fragment_offset', 'ip_ttl', 'ip_protocol', 'ip_header_checksum',
+        'ip_source_ip', 'ip_dest_ip',
+        'udp_source_port', 'udp_dest_port', 'udp_length', 'udp_checksum',
+        'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, payload=b'',
                  eth_dest_mac=0,
                  eth_src_mac=0,
@@ -77,9 +110,12 @@ class UDPFrame(object):
         self.udp_dest_port = udp_dest_port
         self.udp_length = udp_length
         self.udp_checksum = udp_checksum
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
 
         if type(payload) is dict:
-            self.payload = axis_ep.AXIStreamFrame(payload['udp_payload'])
+            self.payload = payload['udp_payload']
             self.eth_dest_mac = payload['eth_dest_mac']
             self.eth_src_mac = payload['eth_src_mac']
             self.eth_type = payload['eth_type']
@@ -100,12 +136,10 @@ class UDPFrame(object):
             self.udp_dest_port = payload['udp_dest_port']
             self.udp_length = payload['udp_length']
             self.udp_checksum = payload['udp_checksum']
-        if type(payload) is bytes:
-            payload = bytearray(payload)
-        if type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload)
-        if type(payload) is UDPFrame:
-            self.payload = axis_ep.AXIStreamFrame(payload.payload)
+        if type(payload) is bytes or type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
+            self.payload = payload
+        if isinstance(payload, UDPFrame):
+            self.payload = payload.payload
             self.eth_dest_mac = payload.eth_dest_mac
             self.eth_src_mac = payload.eth_src_mac
             self.eth_type = payload.eth_type
@@ -126,6 +160,7 @@ class UDPFrame(object):
             self.udp_dest_port = payload.udp_dest_port
             self.udp_length = payload.udp_length
             self.udp_checksum = payload.udp_checksum
+            axis_ep.copy_timestamps(self, payload)
 
     @property
     def payload(self):
@@ -139,46 +174,17 @@ class UDPFrame(object):
         self.ip_length = self.udp_length + 20
 
     def update_udp_length(self):
-        self.udp_length = len(self.payload.data) + 8
+        self.udp_length = self.payload.get_length() + 8
 
     def update_length(self):
         self.update_udp_length()
         self.update_ip_length()
 
     def calc_ip_checksum(self):
-        cksum = self.ip_version << 12 | self.ip_ihl << 8 | self.ip_dscp << 2 | self.ip_ecn
-        cksum += self.ip_length
-        cksum += self.ip_identification
-        cksum += self.ip_flags << 13 | self.ip_fragment_offset
-        cksum += self.ip_ttl << 8 | self.ip_protocol
-        cksum += self.ip_source_ip & 0xffff
-        cksum += (self.ip_source_ip >> 16) & 0xffff
-        cksum += self.ip_dest_ip & 0xffff
-        cksum += (self.ip_dest_ip >> 16) & 0xffff
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        return ~cksum & 0xffff
+        return ip_ep.calc_ip_checksum(self)
 
     def calc_udp_checksum(self):
-        cksum = self.ip_source_ip & 0xffff
-        cksum += (self.ip_source_ip >> 16) & 0xffff
-        cksum += self.ip_dest_ip & 0xffff
-        cksum += (self.ip_dest_ip >> 16) & 0xffff
-        cksum += self.ip_protocol
-        cksum += self.udp_length
-        cksum += self.udp_source_port
-        cksum += self.udp_dest_port
-        cksum += self.udp_length
-        odd = False
-        for d in self.payload.data:
-            if odd:
-                cksum += d
-            else:
-                cksum += d << 8
-            odd = not odd
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        cksum = (cksum & 0xffff) + (cksum >> 16)
-        return ~cksum & 0xffff
+        return calc_udp_checksum(self)
 
     def update_ip_checksum(self):
         self.ip_header_checksum = self.calc_ip_checksum()
@@ -201,23 +207,25 @@ class UDPFrame(object):
             self.update_ip_checksum()
 
     def build_axis(self):
-        return self.build_eth().build_axis()
+        self.build()
+        n = eth_ep.eth_hdr.size
+        m = n + ip_ep.ip_hdr.size
+        data = bytearray(m + udp_hdr.size)
+        eth_ep.pack_eth_hdr(data, 0, self)
+        ip_ep.pack_ip_hdr(data, n, self)
+        pack_udp_hdr(data, m, self)
+
+        return axis_ep.layered_frame(data, self.payload)
 
     def build_eth(self):
         return self.build_ip().build_eth()
 
     def build_ip(self):
         self.build()
-        data = b''
-
-        data += struct.pack('>H', self.udp_source_port)
-        data += struct.pack('>H', self.udp_dest_port)
-        data += struct.pack('>H', self.udp_length)
-        data += struct.pack('>H', self.udp_checksum)
+        data = bytearray(udp_hdr.size)
+        pack_udp_hdr(data, 0, self)
 
-        data += self.payload.data
-
-        return ip_ep.IPFrame(data,
+        frame = ip_ep.IPFrame(b'',
                              self.eth_dest_mac,
                              self.eth_src_mac,
                              self.eth_type,
@@ -234,11 +242,21 @@ class UDPFrame(object):
                              self.ip_header_checksum,
                              self.ip_source_ip,
                              self.ip_dest_ip)
+        frame.payload = axis_ep.layered_frame(data, self.payload)
+        return frame
 
     def parse_axis(self, data):
-        frame = eth_ep.EthFrame()
-        frame.parse_axis(data)
-        self.parse_eth(frame)
+        data = axis_ep.layered_frame(data)
+        n = eth_ep.eth_hdr.size
+        m = n + ip_ep.ip_hdr.size
+        hdr = data.get_bytes(0, m + udp_hdr.size)
+        eth_ep.unpack_eth_hdr(hdr, 0, self)
+        ip_ep.unpack_ip_hdr(hdr, n, self)
+        unpack_udp_hdr(hdr, m, self)
+
+        # get_slice returns a new frame, so it does not need to be copied
+        self._payload = data.get_slice(m + udp_hdr.size)
+        axis_ep.copy_timestamps(self, data)
 
     def parse_eth(self, data):
         frame = ip_ep.IPFrame()
@@ -263,15 +281,14 @@ class UDPFrame(object):
         self.ip_source_ip = data.ip_source_ip
         self.ip_dest_ip = data.ip_dest_ip
 
-        self.udp_source_port = struct.unpack('>H', data.payload.data[0:2])[0]
-        self.udp_dest_port = struct.unpack('>H', data.payload.data[2:4])[0]
-        self.udp_length = struct.unpack('>H', data.payload.data[4:6])[0]
-        self.udp_checksum = struct.unpack('>H', data.payload.data[6:8])[0]
+        unpack_udp_hdr(data.payload.get_bytes(0, udp_hdr.size), 0, self)
 
-        self.payload = axis_ep.AXIStreamFrame(data.payload.data[8:])
+        # get_slice returns a new frame, so it does not need to be copied
+        self._payload = data.payload.get_slice(udp_hdr.size)
+        axis_ep.copy_timestamps(self, data)
 
     def __eq__(self, other):
-        if type(other) is UDPFrame:
+        if isinstance(other, UDPFrame):
             return (self.eth_src_mac == other.eth_src_mac and
                 self.eth_dest_mac == other.eth_dest_mac and
                 self.eth_type == other.eth_type and
@@ -317,6 +334,31 @@ class UDPFrame(object):
                 ('udp_length=%d, ' % self.udp_length) +
                 ('udp_checksum=%04x)' % self.udp_checksum))
 
+udp_fields = ('udp_source_port', 'udp_dest_port', 'udp_length', 'udp_checksum')
+
+class UDPFrameView(eth_ep.FrameView, UDPFrame):
+    __slots__ = ('_view', '_view_decoded')
+
+    # views of a whole frame, an Ethernet payload and an IP payload
+    layout_axis = eth_ep.view_layout((eth_ep.eth_fields, eth_ep.unpack_eth_hdr, eth_ep.eth_hdr.size),
+        (ip_ep.ip_fields, ip_ep.unpack_ip_hdr, ip_ep.ip_hdr.size),
+        (udp_fields, unpack_udp_hdr, udp_hdr.size))
+    layout_eth = eth_ep.view_layout((ip_ep.ip_fields, ip_ep.unpack_ip_hdr, ip_ep.ip_hdr.size),
+        (udp_fields, unpack_udp_hdr, udp_hdr.size))
+    layout_ip = eth_ep.view_layout((udp_fields, unpack_udp_hdr, udp_hdr.size))
+
+    def __init__(self, data):
+        if isinstance(data, ip_ep.IPFrame):
+            self.init_view(data.payload, self.layout_ip, data)
+            for name in eth_ep.eth_fields + ip_ep.ip_fields:
+                setattr(self, name, getattr(data, name))
+        elif isinstance(data, eth_ep.EthFrame):
+            self.init_view(data.payload, self.layout_eth, data)
+            for name in eth_ep.eth_fields:
+                setattr(self, name, getattr(data, name))
+        else:
+            self.init_view(axis_ep.layered_frame(data), self.layout_axis, data)
+
 def UDPFrameSource(clk, rst,
                    udp_hdr_valid=None,
                    udp_hdr_ready=None,
@@ -348,10 +390,12 @@ def UDPFrameSource(clk, rst,
                    udp_payload_tuser=Signal(bool(False)),
                    fifo=None,
                    pause=0,
+                   pause_policy=None,
                    name=None):
 
     udp_hdr_ready_int = Signal(bool(False))
     udp_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     udp_payload_pause = Signal(bool(False))
 
     udp_payload_fifo = Queue()
@@ -369,9 +413,14 @@ def UDPFrameSource(clk, rst,
 
     @always_comb
     def pause_logic():
-        udp_hdr_ready_int.next = udp_hdr_ready and not pause
-        udp_hdr_valid.next = udp_hdr_valid_int and not pause
-        udp_payload_pause.next = pause # or udp_hdr_valid_int
+        udp_hdr_ready_int.next = udp_hdr_ready and not (pause or policy_pause)
+        udp_hdr_valid.next = udp_hdr_valid_int and not (pause or policy_pause)
+        udp_payload_pause.next = pause or policy_pause # or udp_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -382,12 +431,18 @@ def UDPFrameSource(clk, rst,
 
             if rst:
                 udp_hdr_valid_int.next = False
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 if udp_hdr_ready_int:
                     udp_hdr_valid_int.next = False
                 if (udp_payload_tlast and udp_hdr_ready_int and udp_hdr_valid) or not udp_hdr_valid_int:
                     if not fifo.empty():
                         frame = fifo.get()
+                        axis_ep.set_inject_time(frame)
                         frame = UDPFrame(frame)
                         frame.build()
                         eth_dest_mac.next = frame.eth_dest_mac
@@ -451,10 +506,12 @@ def UDPFrameSink(clk, rst,
                  udp_payload_tuser=Signal(bool(False)),
                  fifo=None,
                  pause=0,
+                 pause_policy=None,
                  name=None):
 
     udp_hdr_ready_int = Signal(bool(False))
     udp_hdr_valid_int = Signal(bool(False))
+    policy_pause = Signal(bool(False))
     udp_payload_pause = Signal(bool(False))
 
     udp_payload_fifo = Queue()
@@ -473,9 +530,14 @@ def UDPFrameSink(clk, rst,
 
     @always_comb
     def pause_logic():
-        udp_hdr_ready.next = udp_hdr_ready_int and not pause
-        udp_hdr_valid_int.next = udp_hdr_valid and not pause
-        udp_payload_pause.next = pause # or udp_hdr_valid_int
+        udp_hdr_ready.next = udp_hdr_ready_int and not (pause or policy_pause)
+        udp_hdr_valid_int.next = udp_hdr_valid and not (pause or policy_pause)
+        udp_payload_pause.next = pause or policy_pause # or udp_hdr_valid_int
+
+    policy_reset = policy_step = None
+    if pause_policy is not None:
+        policy_reset = pause_policy.reset
+        policy_step = pause_policy.step
 
     @instance
     def logic():
@@ -487,7 +549,12 @@ def UDPFrameSink(clk, rst,
             if rst:
                 udp_hdr_ready_int.next = False
                 frame = UDPFrame()
+                if policy_reset is not None:
+                    policy_reset(policy_pause)
             else:
+                if policy_step is not None:
+                    policy_step(policy_pause)
+
                 udp_hdr_ready_int.next = True
 
                 if udp_hdr_ready_int and udp_hdr_valid_int:
@@ -512,11 +579,14 @@ def UDPFrameSink(clk, rst,
                     frame.udp_dest_port = int(udp_dest_port)
                     frame.udp_length = int(udp_length)
                     frame.udp_checksum = int(udp_checksum)
+                    frame.ts_first = now()
                     udp_header_fifo.put(frame)
 
                 if not udp_payload_fifo.empty() and not udp_header_fifo.empty():
                     frame = udp_header_fifo.get()
                     frame.payload = udp_payload_fifo.get()
+                    frame.ts_first = min(frame.ts_first, frame.payload.ts_first)
+                    frame.ts_last = frame.payload.ts_last
                     fifo.put(frame)
 
                     # ensure all payloads have been matched to headers
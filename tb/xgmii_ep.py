@@ -23,17 +23,34 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+from collections import deque
+import array
+import axis_ep
+
+# how sinks store per-byte sideband (error, ctrl) of received frames:
+# 'list' - plain lists
+# 'array' - compact arrays
+# 'compact' - arrays, or None where all zero
+sideband_storage = 'list'
 
 class XGMIIFrame(object):
+    __slots__ = ('data', 'error', 'ctrl', 'ts_inject', 'ts_first', 'ts_last')
+
     def __init__(self, data=b'', error=None, ctrl=None):
         self.data = b''
         self.error = None
         self.ctrl = None
+        self.ts_inject = None
+        self.ts_first = None
+        self.ts_last = None
 
         if type(data) is XGMIIFrame:
             self.data = data.data
             self.error = data.error
             self.ctrl = data.ctrl
+            self.ts_inject = data.ts_inject
+            self.ts_first = data.ts_first
+            self.ts_last = data.ts_last
         else:
             self.data = bytearray(data)
 
@@ -41,12 +58,9 @@ class XGMIIFrame(object):
         if self.data is None:
             return
 
-        f = list(self.data)
-        ctrl = []
-        error = []
-        d = []
+        d = list(self.data)
         c = []
-        i = 0
+        error = []
 
         assert_error = False
         if (type(self.error) is int or type(self.error) is bool) and self.error:
@@ -59,23 +73,16 @@ class XGMIIFrame(object):
             error = list(self.error)
 
         if self.ctrl is None:
-            ctrl = [0]*len(self.data)
+            c = [0]*len(self.data)
         else:
-            ctrl = list(self.ctrl)
+            c = list(self.ctrl)
 
-        assert len(ctrl) == len(f)
-        assert len(ctrl) == len(f)
+        assert len(c) == len(d)
 
-        for i in range(len(f)):
+        for i in range(len(d)):
             if error[i]:
-                f[i] = 0xfe
-                ctrl[i] = 1
-
-        i = 0
-        while len(f) > 0:
-            d.append(f.pop(0))
-            c.append(ctrl[i])
-            i += 1
+                d[i] = 0xfe
+                c[i] = 1
 
         return d, c
 
@@ -88,9 +95,24 @@ class XGMIIFrame(object):
 
         self.error = [0]*len(self.data)
 
-        for i in range(len(self.data)):
-            if c[i] and d[i] == 0xfe:
-                self.error[i] = 1
+        if any(c):
+            for i in range(len(self.data)):
+                if c[i] and d[i] == 0xfe:
+                    self.error[i] = 1
+
+    def compact_sideband(self, storage='compact'):
+        if storage == 'list':
+            return
+        if self.error is not None and type(self.error) is not int and type(self.error) is not bool:
+            if storage == 'compact' and not any(self.error):
+                self.error = None
+            else:
+                self.error = array.array('B', self.error)
+        if self.ctrl is not None and type(self.ctrl) is not int and type(self.ctrl) is not bool:
+            if storage == 'compact' and not any(self.ctrl):
+                self.ctrl = None
+            else:
+                self.ctrl = array.array('B', self.ctrl)
 
     def __eq__(self, other):
         if type(other) is XGMIIFrame:
@@ -103,102 +125,132 @@ class XGMIIFrame(object):
         return self.data.__iter__()
 
 
+IDLE_WORD = 0x0707070707070707
+
+# 0x80 in each lane whose control bit is set, by txc/rxc value
+ctrl_lane_mask = [sum(0x80 << 8*i for i in range(8) if c >> i & 1) for c in range(256)]
+
+def terminate_lane(d, c):
+    # lowest control lane holding 0xfd, or -1; x has zero bytes where d has
+    # 0xfd, and the expression below sets 0x80 in exactly those bytes
+    x = d ^ 0xfdfdfdfdfdfdfdfd
+    t = ~(((x & 0x7f7f7f7f7f7f7f7f) + 0x7f7f7f7f7f7f7f7f) | x | 0x7f7f7f7f7f7f7f7f)
+    t &= ctrl_lane_mask[c]
+    if not t:
+        return -1
+    return (t & -t).bit_length() // 8 - 1
+
+class XGMIIEncoder(object):
+    # Encodes whole frames into the (txd, txc) words XGMIISource sends.  The
+    # inter-frame gap and deficit idle count carry over from one frame to the
+    # next: a frame starts in lane 4 when at least 4 idles of the previous gap
+    # are left, and the gap shortened that way is made up after the frame.
+    # The word lists end with the idle words of the gap that must be sent
+    # before the next frame can start.
+    def __init__(self):
+        self.ifg_cnt = 0
+        self.deficit_idle_cnt = 0
+
+    def reset(self):
+        # when nothing is queued, the next frame starts with no gap to make up
+        self.ifg_cnt = 0
+        self.deficit_idle_cnt = 0
+
+    def encode(self, frame):
+        if frame.error is None and frame.ctrl is None:
+            data = frame.data
+            ctrl = None
+        else:
+            data, ctrl = frame.build()
+            data = bytearray(data)
+
+        assert len(data) > 0
+        assert data[0] == 0x55
+
+        ifg_cnt = self.ifg_cnt
+        if ifg_cnt >= 4:
+            deficit_idle_cnt = ifg_cnt - 4
+            lane = 4
+        else:
+            deficit_idle_cnt = ifg_cnt
+            ifg_cnt = 0
+            lane = 0
+
+        # start replaces the first preamble byte, terminate follows the data
+        k = lane + 1
+        n = len(data) - 1
+        buf = bytearray(b'\x07'*lane + b'\xfb')
+        buf += data[1:]
+        end = k + n
+        if n > 0:
+            buf.append(0xfd)
+            if end >= 8:
+                ifg_cnt = 12 - (8 - end % 8) + deficit_idle_cnt
+        buf += b'\x07'*(-len(buf) % 8)
+
+        mv = memoryview(buf)
+        dl = [axis_ep.from_le_bytes(mv[i:i+8]) for i in range(0, len(buf), 8)]
+        cl = [0]*len(dl)
+        cl[0] = (1 << k) - 1
+        cl[end // 8] |= (0xff << end % 8) & 0xff
+        if ctrl is not None:
+            for i in range(1, len(ctrl)):
+                if ctrl[i]:
+                    cl[(k+i-1) // 8] |= 1 << (k+i-1) % 8
+
+        while ifg_cnt > 7:
+            ifg_cnt -= 8
+            dl.append(IDLE_WORD)
+            cl.append(0xff)
+
+        self.ifg_cnt = ifg_cnt
+        self.deficit_idle_cnt = deficit_idle_cnt
+        return dl, cl
+
+
 def XGMIISource(clk, rst,
                 txd,
                 txc,
                 fifo=None,
                 name=None):
 
+    encoder = XGMIIEncoder()
+
     @instance
     def logic():
         frame = None
-        dl = []
-        cl = []
-        ifg_cnt = 0
-        deficit_idle_cnt = 0
-        nt = False
+        dl = deque()
+        cl = deque()
 
         while True:
             yield clk.posedge, rst.posedge
 
             if rst:
                 frame = None
-                txd.next = 0x0707070707070707
+                txd.next = IDLE_WORD
                 txc.next = 0xff
-                dl = []
-                cl = []
-                ifg_cnt = 0
-                deficit_idle_cnt = 0
-                nt = False
+                dl = deque()
+                cl = deque()
+                encoder.reset()
             else:
-                if ifg_cnt > 7:
-                    ifg_cnt -= 8
-                    txd.next = 0x0707070707070707
-                    txc.next = 0xff
-                elif len(dl) > 0 or nt:
-                    d = 0
-                    c = 0
-
-                    for i in range(8):
-                        if len(dl) > 0:
-                            d |= dl.pop(0) << (8*i)
-                            c |= cl.pop(0) << i
-                            nt = True
-                        else:
-                            if nt:
-                                d |= 0xfd << (8*i)
-                                nt = False
-                                ifg_cnt = 12 - (8-i) + deficit_idle_cnt
-                            else:
-                                d |= 0x07 << (8*i)
-                            c |= 1 << i
-
-                    txd.next = d
-                    txc.next = c
+                if len(dl) > 0:
+                    txd.next = dl.popleft()
+                    txc.next = cl.popleft()
                 elif not fifo.empty():
-                    frame = XGMIIFrame(fifo.get())
-                    dl, cl = frame.build()
+                    frame = fifo.get()
+                    if type(frame) is XGMIIFrame:
+                        frame.ts_inject = now()
+                    frame = XGMIIFrame(frame)
+                    dl, cl = encoder.encode(frame)
+                    dl = deque(dl)
+                    cl = deque(cl)
                     if name is not None:
                         print("[%s] Sending frame %s" % (name, repr(frame)))
-                    
-                    if ifg_cnt >= 4:
-                        deficit_idle_cnt = ifg_cnt - 4
-                    else:
-                        deficit_idle_cnt = ifg_cnt
-                        ifg_cnt = 0
-
-                    assert len(dl) > 0
-                    assert dl.pop(0) == 0x55
-                    cl.pop(0)
-
-                    k = 1
-                    d = 0xfb
-                    c = 1
-
-                    if ifg_cnt > 0:
-                        k = 5
-                        d = 0xfb07070707
-                        c = 0x1f
-
-                    for i in range(k,8):
-                        if len(dl) > 0:
-                            d |= dl.pop(0) << (8*i)
-                            c |= cl.pop(0) << i
-                            nt = True
-                        else:
-                            if nt:
-                                d |= 0xfd << (8*i)
-                                nt = False
-                            else:
-                                d |= 0x07 << (8*i)
-                            c |= 1 << i
-
-                    txd.next = d
-                    txc.next = c
+                    txd.next = dl.popleft()
+                    txc.next = cl.popleft()
                 else:
-                    ifg_cnt = 0
-                    deficit_idle_cnt = 0
-                    txd.next = 0x0707070707070707
+                    encoder.reset()
+                    txd.next = IDLE_WORD
                     txc.next = 0xff
 
     return logic
@@ -208,13 +260,22 @@ def XGMIISink(clk, rst,
               rxd,
               rxc,
               fifo=None,
-              name=None):
+              name=None,
+              sideband=None,
+              capture=None):
+
+    # capture: PcapWriter (pcap_ep) to record received frames to
+    capture_write = None
+    if capture is not None:
+        capture_write = capture.add_interface(name, preamble=True).write
 
     @instance
     def logic():
         frame = None
+        # received bytes, and (offset, mask) of words with control lanes
         d = []
-        c = []
+        cw = []
+        n = 0
 
         while True:
             yield clk.posedge, rst.posedge
@@ -222,41 +283,62 @@ def XGMIISink(clk, rst,
             if rst:
                 frame = None
                 d = []
-                c = []
+                cw = []
+                n = 0
             else:
+                rd = int(rxd)
+                rc = int(rxc)
+
                 if frame is None:
-                    if rxc & 1 and rxd & 0xff == 0xfb:
+                    if rc & 1 and rd & 0xff == 0xfb:
                         # start in lane 0
-                        frame = XGMIIFrame()
-                        d = [0x55]
-                        c = [0]
-                        for i in range(1,8):
-                            d.append((int(rxd) >> (8*i)) & 0xff)
-                            c.append((int(rxc) >> i) & 1)
-                    elif (rxc >> 4) & 1 and (rxd >> 32) & 0xff == 0xfb:
+                        k = 1
+                    elif (rc >> 4) & 1 and (rd >> 32) & 0xff == 0xfb:
                         # start in lane 4
-                        frame = XGMIIFrame()
-                        d = [0x55]
-                        c = [0]
-                        for i in range(5,8):
-                            d.append((int(rxd) >> (8*i)) & 0xff)
-                            c.append((int(rxc) >> i) & 1)
+                        k = 5
+                    else:
+                        continue
+                    frame = XGMIIFrame()
+                    frame.ts_first = now()
+                    d = [b'\x55', axis_ep.to_le_bytes(rd, 8)[k:]]
+                    cw = []
+                    if rc >> k:
+                        cw.append((1, rc >> k))
+                    n = 9 - k
+                elif rc == 0:
+                    d.append(axis_ep.to_le_bytes(rd, 8))
+                    n += 8
                 else:
-                    for i in range(8):
-                        if (rxc >> i) & 1 and (rxd >> (8*i)) & 0xff == 0xfd:
-                            # terminate
-                            frame.parse(d, c)
-                            if fifo is not None:
-                                fifo.put(frame)
-                            if name is not None:
-                                print("[%s] Got frame %s" % (name, repr(frame)))
-                            frame = None
-                            d = []
-                            c = []
-                            break
-                        else:
-                            d.append((int(rxd) >> (8*i)) & 0xff)
-                            c.append((int(rxc) >> i) & 1)
+                    i = terminate_lane(rd, rc)
+                    if i < 0:
+                        d.append(axis_ep.to_le_bytes(rd, 8))
+                        cw.append((n, rc))
+                        n += 8
+                        continue
+
+                    d.append(axis_ep.to_le_bytes(rd, 8)[:i])
+                    if rc & ((1 << i) - 1):
+                        cw.append((n, rc & ((1 << i) - 1)))
+                    n += i
+
+                    c = [0]*n
+                    for offset, mask in cw:
+                        for j in range(8):
+                            if mask >> j & 1:
+                                c[offset+j] = 1
+
+                    frame.ts_last = now()
+                    frame.parse(b''.join(d), c)
+                    frame.compact_sideband(sideband or sideband_storage)
+                    if fifo is not None:
+                        fifo.put(frame)
+                    if name is not None:
+                        print("[%s] Got frame %s" % (name, repr(frame)))
+                    if capture_write is not None:
+                        capture_write(frame.data, now())
+                    frame = None
+                    d = []
+                    cw = []
+                    n = 0
 
     return logic
-
@@ -0,0 +1,331 @@
+"""
+
+Copyright (c) 2015-2016 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from myhdl import *
+from collections import deque
+import axis_ep
+import xgmii_ep
+from xgmii_ep import XGMIIFrame
+
+# Wide XGMII style interfaces: XLGMII (40G), CGMII (100G) and wider MAC
+# datapaths, with N lanes of one data byte and one control bit each.  Frames
+# are XGMIIFrame objects, starting with the preamble.  A start character
+# only goes in lane 0 of a block of align lanes (8, lane 0 of each 64 bit
+# word, for XLGMII and CGMII), so several frames can share a bus word.
+
+# how sinks store per-byte sideband (error, ctrl) of received frames, see
+# xgmii_ep.sideband_storage
+sideband_storage = 'list'
+
+class LaneMasks(object):
+    # Per lane bit masks for words of a given number of lanes
+    def __init__(self, lanes):
+        self.lanes = lanes
+        self.ones = (1 << 8*lanes) - 1
+        self.low = self.ones // 0xff
+        self.high7 = self.low * 0x7f
+        self.high = self.low * 0x80
+        self.idle = self.low * 0x07
+        self.ctrl_mask = (1 << lanes) - 1
+
+    def match(self, d, v):
+        # 0x80 in exactly the lanes of d holding byte v
+        x = d ^ (self.low * v)
+        return ~(((x & self.high7) + self.high7) | x | self.high7) & self.high
+
+    def ctrl_lanes(self, c):
+        # 0x80 in the lanes whose control bit is set in c
+        m = 0
+        k = 0
+        while c:
+            m |= xgmii_ep.ctrl_lane_mask[c & 0xff] << k
+            c >>= 8
+            k += 64
+        return m
+
+def lowest_lane(m):
+    # lane of the lowest 0x80 flag in m
+    return (m & -m).bit_length() // 8 - 1
+
+class XLGMIIEncoder(object):
+    # Encodes frames into the (txd, txc) words XLGMIISource sends, as a byte
+    # stream cut into words.  Each terminate is followed by an inter-frame
+    # gap of ifg characters, counting the terminate; the next start is then
+    # moved to a lane multiple of align.  With enable_dic, idles are deleted
+    # to move it back while the deficit idle count stays below align, and
+    # inserted otherwise, so the gap averages ifg; without it they are only
+    # inserted.  Frames that end or start partway into a word stay pending
+    # until the next frame or idle() completes that word.
+    def __init__(self, lanes=16, ifg=12, enable_dic=True, align=8):
+        if lanes % 8 or align < 1 or lanes % align:
+            raise Exception("Invalid lanes %d or align %d" % (lanes, align))
+        self.lanes = lanes
+        self.ifg = ifg
+        self.enable_dic = enable_dic
+        self.align = align
+        self.masks = LaneMasks(lanes)
+        self.reset()
+
+    def reset(self):
+        self.buf = bytearray()
+        self.ctrl = 0
+        self.start = 0
+        self.deficit_idle_cnt = 0
+
+    def encode(self, frame):
+        # returns (txd list, txc list) of the words completed by this frame
+        if frame.error is None and frame.ctrl is None:
+            data = frame.data
+            ctrl = None
+        else:
+            data, ctrl = frame.build()
+            data = bytearray(data)
+
+        assert len(data) > 0
+        assert data[0] == 0x55
+
+        buf = self.buf
+        p = self.start
+        if p > len(buf):
+            self.ctrl |= ((1 << (p - len(buf))) - 1) << len(buf)
+            buf += b'\x07'*(p - len(buf))
+
+        # start replaces the first preamble byte
+        buf.append(0xfb)
+        self.ctrl |= 1 << p
+        buf += data[1:]
+        if ctrl is not None:
+            for i in range(1, len(ctrl)):
+                if ctrl[i]:
+                    self.ctrl |= 1 << (p + i)
+
+        t = len(buf)
+        buf.append(0xfd)
+        self.ctrl |= 1 << t
+
+        # next start, aligned
+        s = t + self.ifg
+        r = s % self.align
+        if r:
+            if self.enable_dic and self.deficit_idle_cnt + r < self.align and s - r > t:
+                s -= r
+                self.deficit_idle_cnt += r
+            else:
+                s += self.align - r
+                if self.enable_dic:
+                    self.deficit_idle_cnt = max(self.deficit_idle_cnt - (self.align - r), 0)
+
+        # words before the one the next start is in are complete
+        end = s - s % self.lanes
+        if len(buf) < end:
+            self.ctrl |= ((1 << (end - len(buf))) - 1) << len(buf)
+            buf += b'\x07'*(end - len(buf))
+
+        dl, cl = self.words(end)
+        self.start = s - end
+        return dl, cl
+
+    def idle(self):
+        # next word when no frame follows: the pending part of a word padded
+        # with idles, or an idle word; the next frame starts a new gap
+        n = self.lanes
+        if len(self.buf) > 0:
+            self.ctrl |= ((1 << (n - len(self.buf))) - 1) << len(self.buf)
+            self.buf += b'\x07'*(n - len(self.buf))
+            dl, cl = self.words(n)
+            d, c = dl[0], cl[0]
+        else:
+            d, c = self.masks.idle, self.masks.ctrl_mask
+        self.reset()
+        return d, c
+
+    def words(self, end):
+        n = self.lanes
+        mv = memoryview(self.buf)
+        dl = [axis_ep.from_le_bytes(mv[i:i+n]) for i in range(0, end, n)]
+        # the buffer cannot be resized while viewed
+        del mv
+        m = self.masks.ctrl_mask
+        c = self.ctrl
+        cl = [(c >> i) & m for i in range(0, end, n)]
+        del self.buf[:end]
+        self.ctrl >>= end
+        return dl, cl
+
+
+def XLGMIISource(clk, rst,
+                 txd,
+                 txc,
+                 fifo=None,
+                 ifg=12,
+                 enable_dic=True,
+                 align=8,
+                 name=None):
+
+    encoder = XLGMIIEncoder(len(txc), ifg, enable_dic, align)
+
+    @instance
+    def logic():
+        dl = deque()
+        cl = deque()
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                txd.next = encoder.masks.idle
+                txc.next = encoder.masks.ctrl_mask
+                dl = deque()
+                cl = deque()
+                encoder.reset()
+            else:
+                # a frame may not complete a word if it ends in the word
+                # the next one can start in
+                while len(dl) == 0 and not fifo.empty():
+                    frame = fifo.get()
+                    if type(frame) is XGMIIFrame:
+                        frame.ts_inject = now()
+                    frame = XGMIIFrame(frame)
+                    d, c = encoder.encode(frame)
+                    dl.extend(d)
+                    cl.extend(c)
+                    if name is not None:
+                        print("[%s] Sending frame %s" % (name, repr(frame)))
+
+                if len(dl) > 0:
+                    txd.next = dl.popleft()
+                    txc.next = cl.popleft()
+                else:
+                    d, c = encoder.idle()
+                    txd.next = d
+                    txc.next = c
+
+    return logic
+
+
+def XLGMIISink(clk, rst,
+               rxd,
+               rxc,
+               fifo=None,
+               align=8,
+               name=None,
+               sideband=None,
+               capture=None):
+
+    lanes = len(rxc)
+    masks = LaneMasks(lanes)
+    # 0x80 in the lanes a start may be in
+    start_lanes = sum(0x80 << 8*i for i in range(0, lanes, align))
+
+    # capture: PcapWriter (pcap_ep) to record received frames to
+    capture_write = None
+    if capture is not None:
+        capture_write = capture.add_interface(name, preamble=True).write
+
+    @instance
+    def logic():
+        frame = None
+        # received bytes, and (offset, mask) of words with control lanes
+        d = []
+        cw = []
+        n = 0
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                frame = None
+                d = []
+                cw = []
+                n = 0
+                continue
+
+            rd = int(rxd)
+            rc = int(rxc)
+
+            if rc == 0:
+                if frame is not None:
+                    d.append(axis_ep.to_le_bytes(rd, lanes))
+                    n += lanes
+                continue
+
+            if frame is None and rd == masks.idle:
+                continue
+
+            b = axis_ep.to_le_bytes(rd, lanes)
+            cm = masks.ctrl_lanes(rc)
+            starts = masks.match(rd, 0xfb) & cm & start_lanes
+            terms = masks.match(rd, 0xfd) & cm
+            pos = 0
+
+            while True:
+                # flags of lanes from pos on
+                above = -1 << 8*pos
+                if frame is None:
+                    m = starts & above
+                    if not m:
+                        break
+                    i = lowest_lane(m)
+                    frame = XGMIIFrame()
+                    frame.ts_first = now()
+                    d = [b'\x55']
+                    cw = []
+                    n = 1
+                    pos = i + 1
+                else:
+                    m = terms & above
+                    i = lowest_lane(m) if m else lanes
+                    d.append(b[pos:i])
+                    c = (rc >> pos) & ((1 << (i - pos)) - 1)
+                    if c:
+                        cw.append((n, c))
+                    n += i - pos
+                    if not m:
+                        break
+
+                    c = [0]*n
+                    for offset, mask in cw:
+                        j = 0
+                        while mask:
+                            if mask & 1:
+                                c[offset+j] = 1
+                            mask >>= 1
+                            j += 1
+
+                    frame.ts_last = now()
+                    frame.parse(b''.join(d), c)
+                    frame.compact_sideband(sideband or sideband_storage)
+                    if fifo is not None:
+                        fifo.put(frame)
+                    if name is not None:
+                        print("[%s] Got frame %s" % (name, repr(frame)))
+                    if capture_write is not None:
+                        capture_write(frame.data, now())
+                    frame = None
+                    d = []
+                    cw = []
+                    n = 0
+                    pos = i + 1
+
+    return logic